@@ -70,6 +70,8 @@ SITE_ID = 1
 MIDDLEWARE = [
     # Seguridad y sesión
     "django.middleware.security.SecurityMiddleware",
+    # Métricas por vista (queries, BD, caché, tiempo) → /metricz/
+    "reservas.middleware.RequestMetricsMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.locale.LocaleMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -294,6 +296,38 @@ RESERVA_SEPARACION_POR_SUCURSAL = True
 HORARIO_APERTURA = 8
 HORARIO_CIERRE = 22
 RESERVA_INTERVALO_MIN = 15
+# Valores por defecto: cada sucursal puede sobreescribirlos (HorarioSucursal / HorarioDia /
+# ExcepcionHorario). Cada cuántos segundos un proceso revisa si otro editó el horario.
+CALENDARIO_VERIFICAR_SEG = 5
+# Mapa de ocupación por mesa/día (reservas/ocupacion.py): tamaño de cubeta y vida en caché
+OCUPACION_CUBETA_MIN = 5
+OCUPACION_TTL = 300
+# Máximo de días que devuelve /api/sucursal/<id>/calendario/ en una llamada
+CALENDARIO_DIAS_MAX = 31
+# Búsqueda multi-sucursal: ±minutos alrededor de la hora pedida y peso de la distancia
+# (minutos de diferencia que "valen" 1 km al ordenar)
+BUSQUEDA_VENTANA_MIN = 120
+BUSQUEDA_MIN_POR_KM = 2
+# Snapshot de próximos horarios libres (manage.py refrescar_proximos)
+PROXIMOS_PARTIES = (2, 4, 6)
+PROXIMOS_N = 5
+PROXIMOS_TTL = 120
+PROXIMOS_INTERVALO_SEG = 60
+# Plano de mesas pre-serializado por versión (reservas/plano.py); la versión lo invalida
+PLANO_TTL = 3600
+# Exportación CSV (staff/exportar/*.csv): rango máximo y filas por lectura del cursor
+EXPORT_DIAS_MAX = 92
+EXPORT_CHUNK = 2000
+# Caché folio → reserva de los QR escaneados (reservas/folios.py)
+FOLIO_CACHE_TTL = 300
+# Folios nuevos: números reservados por proceso en cada query y clave de la permutación
+# (NO cambiarla en producción, ver reservas/folios.py)
+FOLIO_BLOQUE = 50
+FOLIO_CLAVE = os.environ.get("FOLIO_CLAVE", "ihop-folios")
+# Tarjeta de reserva (QR / ticket / check-in) en caché (reservas/tarjeta.py)
+TARJETA_TTL = 300
+# Ids de sucursales visibles por usuario staff (reservas/visibilidad.py)
+VISIBLES_TTL = 600
 
 
 # ---- Reserva / asignación automática ----
@@ -302,6 +336,14 @@ PROTECCION_BIG = 90
 WASTE_MAX = 3
 CAP_MAX = 12
 
+# =========================
+# MÉTRICAS POR VISTA (/metricz/)
+# =========================
+REQUEST_METRICS_ENABLED = config("REQUEST_METRICS_ENABLED", default=True, cast=bool)
+REQUEST_METRICS_WINDOW = 200   # muestras por vista en el ring buffer
+# Overrides de @query_budget por nombre de URL, ej. {"reservas:ver_mesas": 20}
+QUERY_BUDGETS = {}
+
 # =========================
 # SEGURIDAD
 # =========================
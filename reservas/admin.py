@@ -7,6 +7,9 @@ from .models import (
     ChainOwnerPaisRole,
     Sucursal,
     SucursalFoto,
+    HorarioSucursal,
+    HorarioDia,
+    ExcepcionHorario,
     Mesa,
     Cliente,
     Reserva,
@@ -16,6 +19,8 @@ from .models import (
     MenuItem,
     Review,
 )
+from .utils import MesaOcupada, guardar_reserva_sin_traslape
+from .visibilidad import sucursal_ids_visibles
 
 # Si tienes el helper de correo, mantenlo opcional para no romper si no existe.
 try:
@@ -36,25 +41,12 @@ def is_chain_owner(user) -> bool:
 def _sucursales_visibles_qs(user):
     """
     - Dueño de cadena -> todas
-    - Staff con PerfilAdmin asignado -> esa sucursal
-    - Staff administrador (M2M) -> sus sucursales
+    - Staff -> sucursal asignada, las que administra (M2M) y las de sus países
     - Otros -> ninguna
     """
-    if not getattr(user, "is_authenticated", False):
-        return Sucursal.objects.none()
-    if is_chain_owner(user):
-        return Sucursal.objects.all()
-
-    # PerfilAdmin (sucursal asignada)
-    try:
-        perfil = PerfilAdmin.objects.get(user=user)
-    except PerfilAdmin.DoesNotExist:
-        perfil = None
-    if perfil and perfil.sucursal_asignada_id:
-        return Sucursal.objects.filter(pk=perfil.sucursal_asignada_id)
-
-    # M2M administradores
-    return Sucursal.objects.filter(administradores=user).distinct()
+    # Conjunto de ids en caché (reservas/visibilidad.py): sin PerfilAdmin.get ni JOIN al M2M
+    ids = sucursal_ids_visibles(user)
+    return Sucursal.objects.all() if ids is None else Sucursal.objects.filter(pk__in=ids)
 
 
 # ==============================================================================
@@ -80,6 +72,31 @@ class SucursalFotoInline(admin.TabularInline):
     preview.short_description = "Miniatura"
 
 
+class HorarioSucursalInline(admin.StackedInline):
+    model = HorarioSucursal
+    extra = 0
+    max_num = 1
+    fields = (
+        ("paso_min", "fin_de_semana_pico"),
+        ("duracion_normal_min", "duracion_pico_min"),
+        ("anticipacion_min", "anticipacion_pico_min"),
+        "horas_pico",
+    )
+
+
+class HorarioDiaInline(admin.TabularInline):
+    model = HorarioDia
+    extra = 0
+    max_num = 7
+    fields = ("dia_semana", "abre", "cierra", "cerrado")
+
+
+class ExcepcionHorarioInline(admin.TabularInline):
+    model = ExcepcionHorario
+    extra = 0
+    fields = ("fecha", "cerrado", "abre", "cierra", "motivo")
+
+
 # ==============================================================================
 # Sucursal
 # ==============================================================================
@@ -103,7 +120,7 @@ class SucursalAdmin(admin.ModelAdmin):
     list_filter = ("pais", "activo", "recomendado", "precio_nivel")  # <- incluye país
     readonly_fields = ("preview_portada", "slug")  # slug lo genera la señal
     filter_horizontal = ("administradores",)
-    inlines = [SucursalFotoInline]
+    inlines = [SucursalFotoInline, HorarioSucursalInline, HorarioDiaInline, ExcepcionHorarioInline]
 
     fieldsets = (
         (
@@ -312,30 +329,33 @@ class ReservaAdmin(admin.ModelAdmin):
         "estado",
         "fecha",            # legacy (hora local)
         "mesa",
-        "sucursal_nombre",  # derivado via mesa
+        "sucursal_nombre",
         "cliente_nombre",
         "cliente_email",
         "num_personas",
     )
-    list_filter = ("estado", "mesa__sucursal", "fecha")
+    list_filter = ("estado", "sucursal", "fecha")
     search_fields = (
         "folio",
         "cliente__nombre",
         "cliente__email",
-        "mesa__sucursal__nombre",
+        "sucursal__nombre",
     )
     date_hierarchy = "fecha"
-    ordering = ("-fecha",)
+    ordering = ("-fecha", "-id")
+    # Sucursales grandes: sin COUNT(*) total por página y con la FK directa (índice sucursal, fecha)
+    list_per_page = 50
+    show_full_result_count = False
 
     # Acciones
     actions = ["cancelar_reservas", "marcar_confirmada_y_enviar_correo"]
 
     # Restringir queryset por sucursal asignada
     def get_queryset(self, request):
-        qs = super().get_queryset(request).select_related("mesa__sucursal", "cliente")
+        qs = super().get_queryset(request).select_related("mesa", "sucursal", "cliente")
         if request.user.is_superuser:
             return qs
-        return qs.filter(mesa__sucursal__in=_sucursales_visibles_qs(request.user))
+        return qs.filter(sucursal__in=_sucursales_visibles_qs(request.user))
 
     # Limitar choices en FKs relevantes
     def formfield_for_foreignkey(self, db_field, request, **kwargs):
@@ -348,7 +368,7 @@ class ReservaAdmin(admin.ModelAdmin):
     # Columnas calculadas
     @admin.display(description="Sucursal")
     def sucursal_nombre(self, obj):
-        return obj.mesa.sucursal.nombre
+        return obj.sucursal.nombre
 
     @admin.display(description="Cliente")
     def cliente_nombre(self, obj):
@@ -361,7 +381,16 @@ class ReservaAdmin(admin.ModelAdmin):
     # Acciones
     @admin.action(description="Cancelar reservas seleccionadas")
     def cancelar_reservas(self, request, queryset):
-        updated = queryset.update(estado="CANC")
+        from .ocupacion import invalidar_ocupacion
+        from .tarjeta import invalidar_tarjeta
+        # update() no dispara señales: avisar al mapa de ocupación de cada sucursal
+        # y borrar la tarjeta cacheada de cada folio
+        filas = list(queryset.order_by().values_list("pk", "sucursal_id", "folio"))
+        updated = queryset.model.objects.filter(pk__in=[pk for pk, _, _ in filas]).update(estado="CANC")
+        for sid in {sid for _, sid, _ in filas}:
+            invalidar_ocupacion(sid)
+        for _, _, folio in filas:
+            invalidar_tarjeta(folio)
         self.message_user(request, f"{updated} reservas fueron canceladas.")
 
     @admin.action(description="Marcar como CONFIRMADA y enviar correo")
@@ -370,7 +399,17 @@ class ReservaAdmin(admin.ModelAdmin):
         for reserva in queryset:
             if reserva.estado != "CONF":
                 reserva.estado = "CONF"
-                reserva.save(update_fields=["estado"])
+                try:
+                    # Una cancelada conserva su rango: si el horario ya se volvió a reservar,
+                    # la exclusión de BD la rechaza (solo esa fila, en su savepoint)
+                    guardar_reserva_sin_traslape(reserva, update_fields=["estado"])
+                except MesaOcupada:
+                    self.message_user(
+                        request,
+                        f"{reserva.folio}: la mesa ya está ocupada en ese horario; no se confirmó.",
+                        level="warning",
+                    )
+                    continue
                 try:
                     enviar_correo_reserva_confirmada(reserva, bcc_sucursal=True)
                 except Exception as e:
@@ -0,0 +1,403 @@
+# reservas/calendario.py
+"""
+Calendario compilado por sucursal.
+
+Reúne en un objeto inmutable lo que las funciones de disponibilidad y duración leían
+de settings en cada llamada (HORARIO_APERTURA/CIERRE, paso, HORAS_PICO, duraciones,
+anticipación), con las sobreescrituras de cada sucursal:
+  - HorarioSucursal: paso, duraciones, anticipación y ventanas pico
+  - HorarioDia: apertura/cierre (o cerrado) por día de la semana
+  - ExcepcionHorario: fechas cerradas o con horario especial
+
+calendario_sucursal(s) compila una vez por proceso y reutiliza el objeto. Al editar el
+horario, las señales de models.py llaman invalidar_calendario(): se descarta la copia
+local y se sube una versión en el caché compartido para que los demás procesos
+recompilen (lo verifican cada CALENDARIO_VERIFICAR_SEG segundos, default 5).
+Sin sucursal se usa calendario_global(): los valores de settings de siempre.
+calendarios_sucursales(ids) hace lo mismo para muchas sucursales con las mismas 3 queries.
+"""
+from __future__ import annotations
+
+import threading
+import time as _time
+from datetime import datetime, timedelta
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Dict, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.utils import timezone
+
+from .cache_utils import slots_invalidate_prefix
+
+EXTRA_GRUPO_GRANDE_MIN = 15  # grupo ≥ 5
+MINUTOS_DIA = 24 * 60
+EXCEPCIONES_PASADAS_DIAS = 30  # excepciones más viejas no se cargan al compilar
+
+_SETTINGS_CALENDARIO = {
+    "HORARIO_APERTURA",
+    "HORARIO_CIERRE",
+    "RESERVA_PASO_MINUTOS",
+    "RESERVA_INTERVALO_MIN",
+    "HORAS_PICO",
+    "RESERVA_DURACION_MIN_NORM",
+    "RESERVA_DURACION_MIN_PICO",
+    "RESERVA_ANTICIPACION_MIN",
+    "RESERVA_ANTICIPACION_MIN_PICO",
+    "CALENDARIO_VERIFICAR_SEG",
+    "TIME_ZONE",
+}
+
+
+def a_minutos(valor) -> int:
+    """Hora de ventana pico → minuto del día: 7 → 420, "07:30" → 450, time(7, 30) → 450."""
+    if hasattr(valor, "hour"):
+        return valor.hour * 60 + valor.minute
+    if isinstance(valor, str) and ":" in valor:
+        h, m = valor.split(":", 1)
+        return int(h) * 60 + int(m)
+    return int(valor) * 60
+
+
+def ventanas_en_minutos(ventanas) -> Tuple[Tuple[int, int], ...]:
+    """[(7, 11), ["12:30", "15:00"]] → ((420, 660), (750, 900)). ValueError si alguna es inválida."""
+    out = []
+    for par in ventanas or ():
+        ini, fin = (a_minutos(v) for v in par)
+        if not 0 <= ini < fin <= MINUTOS_DIA:
+            raise ValueError(f"Ventana pico inválida: {par!r}")
+        out.append((ini, fin))
+    return tuple(out)
+
+
+class ReglasDuracion:
+    """
+    Reglas de duración de un día local de un calendario, compiladas una sola vez.
+    Arreglos indexados por minuto del día local (0..1439):
+      - dur_normal / dur_grande: minutos de ocupación (grupo < 5 / grupo ≥ 5)
+      - pico: ventana pico o fin de semana (lo que usa booking_total_minutes)
+      - anticipacion: minutos mínimos de anticipación (solo ventanas pico)
+    Inmutable; obtener con calendario.reglas(dia).
+    """
+    __slots__ = ("calendario", "tz", "dia", "dur_normal", "dur_grande", "pico", "anticipacion")
+
+    def __init__(self, calendario: "CalendarioSucursal", dia):
+        fin_semana = calendario.fin_semana_pico and dia.weekday() in (5, 6)  # 5=sábado, 6=domingo
+        self.calendario = calendario
+        self.tz = calendario.tz
+        self.dia = dia
+        # Los arreglos solo dependen de si el día es fin de semana: se comparten entre días
+        self.dur_normal, self.dur_grande, self.pico, self.anticipacion = calendario._tablas(fin_semana)
+
+    def _indice(self, dt):
+        """(reglas, minuto) para dt; si cae en otro día local delega a esas reglas."""
+        loc = dt if dt.tzinfo is self.tz else dt.astimezone(self.tz)
+        reglas = self if loc.date() == self.dia else self.calendario.reglas(loc.date())
+        return reglas, loc.hour * 60 + loc.minute
+
+    def duracion(self, dt, party=2) -> int:
+        reglas, i = self._indice(dt)
+        return (reglas.dur_grande if int(party or 2) >= 5 else reglas.dur_normal)[i]
+
+    def es_pico(self, dt) -> bool:
+        reglas, i = self._indice(dt)
+        return reglas.pico[i]
+
+
+class CalendarioSucursal:
+    """
+    Horario y reglas de una sucursal ya resueltos (settings + sobreescrituras).
+    semana: 7 tuplas (abre_min, cierra_min) o None si cierra ese día (0 = lunes).
+    excepciones: {date: (abre_min, cierra_min) | None}.
+    """
+    __slots__ = (
+        "sucursal_id", "tz", "paso_min", "dur_normal", "dur_pico", "antic_base", "antic_pico",
+        "ventanas_pico", "fin_semana_pico", "semana", "excepciones", "version",
+        "_reglas", "_por_tipo_dia",
+    )
+
+    def __init__(self, *, tz, paso_min, dur_normal, dur_pico, antic_base, antic_pico,
+                 ventanas_pico=(), fin_semana_pico=True, semana, excepciones=None,
+                 sucursal_id=None, version=None):
+        self.sucursal_id = sucursal_id
+        self.tz = tz
+        self.paso_min = int(paso_min)
+        self.dur_normal = int(dur_normal)
+        self.dur_pico = int(dur_pico)
+        self.antic_base = int(antic_base)
+        self.antic_pico = int(antic_pico)
+        self.ventanas_pico = tuple(ventanas_pico)
+        self.fin_semana_pico = bool(fin_semana_pico)
+        self.semana = tuple(semana)
+        self.excepciones = MappingProxyType(dict(excepciones or {}))
+        self.version = version
+        self._reglas: Dict = {}
+        self._por_tipo_dia: Dict = {}
+
+    def __repr__(self):
+        return f"<CalendarioSucursal sucursal={self.sucursal_id} tz={self.tz} v={self.version}>"
+
+    @property
+    def duracion_maxima(self) -> int:
+        """Cota superior de duracion() (pico + grupo grande)."""
+        return max(self.dur_normal, self.dur_pico) + EXTRA_GRUPO_GRANDE_MIN
+
+    # ---------------------------------------------------------------- horario
+    def jornada(self, dia) -> Optional[Tuple[int, int]]:
+        """(abre_min, cierra_min) del día local; None si la sucursal no abre."""
+        if dia in self.excepciones:
+            return self.excepciones[dia]
+        return self.semana[dia.weekday()]
+
+    def jornada_dt(self, dia):
+        """(inicio, fin) aware en la TZ de la sucursal; None si no abre ese día."""
+        j = self.jornada(dia)
+        if j is None:
+            return None
+        base = datetime(dia.year, dia.month, dia.day, tzinfo=self.tz)
+        return base + timedelta(minutes=j[0]), base + timedelta(minutes=j[1])
+
+    # ----------------------------------------------------------------- reglas
+    def _tablas(self, fin_semana: bool):
+        tablas = self._por_tipo_dia.get(fin_semana)
+        if tablas is None:
+            pico = [fin_semana] * MINUTOS_DIA
+            anticipacion = [self.antic_base] * MINUTOS_DIA
+            for ini, fin in self.ventanas_pico:
+                pico[ini:fin] = [True] * (fin - ini)
+                anticipacion[ini:fin] = [self.antic_pico] * (fin - ini)
+            dur_normal = tuple(self.dur_pico if p else self.dur_normal for p in pico)
+            tablas = self._por_tipo_dia[fin_semana] = (
+                dur_normal,
+                tuple(d + EXTRA_GRUPO_GRANDE_MIN for d in dur_normal),
+                tuple(pico),
+                tuple(anticipacion),
+            )
+        return tablas
+
+    def reglas(self, dia) -> ReglasDuracion:
+        reglas = self._reglas.get(dia)
+        if reglas is None:
+            if len(self._reglas) > 400:
+                self._reglas.clear()
+            reglas = self._reglas[dia] = ReglasDuracion(self, dia)
+        return reglas
+
+    def _local(self, dt):
+        loc = dt if dt.tzinfo is self.tz else dt.astimezone(self.tz)
+        return self.reglas(loc.date()), loc.hour * 60 + loc.minute
+
+    def duracion(self, dt, party=2) -> int:
+        reglas, i = self._local(dt)
+        return (reglas.dur_grande if int(party or 2) >= 5 else reglas.dur_normal)[i]
+
+    def es_pico(self, dt) -> bool:
+        reglas, i = self._local(dt)
+        return reglas.pico[i]
+
+    def anticipacion(self, dt) -> int:
+        reglas, i = self._local(dt)
+        return reglas.anticipacion[i]
+
+
+# ------------------------------------------------------------------ compilación
+def _tz_o_default(nombre):
+    try:
+        return ZoneInfo(nombre) if nombre else timezone.get_default_timezone()
+    except Exception:
+        return timezone.get_default_timezone()
+
+
+def compilar_calendario(tz, horario=None, dias=(), excepciones=(), sucursal_id=None, version=None):
+    """
+    Resuelve settings + sobreescrituras en un CalendarioSucursal.
+    horario: HorarioSucursal (o None); campos vacíos heredan de settings.
+    dias / excepciones: HorarioDia / ExcepcionHorario de la sucursal.
+    """
+    def _o(attr, default):
+        val = getattr(horario, attr, None) if horario is not None else None
+        return default if val is None else val
+
+    norm = int(getattr(settings, "RESERVA_DURACION_MIN_NORM", 90))
+    pico = int(getattr(settings, "RESERVA_DURACION_MIN_PICO", 105))
+    antic = int(getattr(settings, "RESERVA_ANTICIPACION_MIN", 20))
+    antic_pico = int(getattr(settings, "RESERVA_ANTICIPACION_MIN_PICO", antic))
+    paso = int(getattr(settings, "RESERVA_PASO_MINUTOS", getattr(settings, "RESERVA_INTERVALO_MIN", 15)))
+    apertura = int(getattr(settings, "HORARIO_APERTURA", 8)) * 60
+    cierre = int(getattr(settings, "HORARIO_CIERRE", 22)) * 60
+
+    ventanas = _o("horas_pico", None)
+    ventanas = ventanas_en_minutos(getattr(settings, "HORAS_PICO", []) if ventanas is None else ventanas)
+
+    semana = [(apertura, cierre)] * 7
+    for d in dias:
+        semana[d.dia_semana] = None if d.cerrado else (a_minutos(d.abre), a_minutos(d.cierra))
+
+    exc = {}
+    for e in excepciones:
+        exc[e.fecha] = None if e.cerrado else (a_minutos(e.abre), a_minutos(e.cierra))
+
+    return CalendarioSucursal(
+        tz=tz,
+        paso_min=_o("paso_min", paso),
+        dur_normal=_o("duracion_normal_min", norm),
+        dur_pico=_o("duracion_pico_min", pico),
+        antic_base=_o("anticipacion_min", antic),
+        antic_pico=_o("anticipacion_pico_min", antic_pico),
+        ventanas_pico=ventanas,
+        fin_semana_pico=_o("fin_de_semana_pico", True),
+        semana=semana,
+        excepciones=exc,
+        sucursal_id=sucursal_id,
+        version=version,
+    )
+
+
+@lru_cache(maxsize=64)
+def _calendario_global(tz):
+    return compilar_calendario(tz)
+
+
+def calendario_global(tz=None) -> CalendarioSucursal:
+    """Calendario solo con settings (default: TZ actual), para llamadas sin sucursal."""
+    return _calendario_global(tz or timezone.get_current_timezone())
+
+
+def reglas_duracion(dia, tz=None) -> ReglasDuracion:
+    """Reglas compiladas de settings para el día local 'dia' en 'tz' (default: TZ actual)."""
+    return calendario_global(tz).reglas(dia)
+
+
+# ----------------------------------------------------------- caché por sucursal
+_locales: Dict[int, Tuple[CalendarioSucursal, float]] = {}  # id → (calendario, verificar_después_de)
+_lock = threading.Lock()
+
+
+def _version_key(sucursal_id) -> str:
+    return f"calendario:v:{sucursal_id}"
+
+
+def _compilar_sucursales(versiones: Dict[int, object]) -> Dict[int, CalendarioSucursal]:
+    """Compila varias sucursales con las mismas 3 queries (sucursal+horario, días, excepciones)."""
+    from django.db.models import Prefetch
+    from .models import ExcepcionHorario, HorarioSucursal, Sucursal  # import local evita ciclos
+
+    desde = timezone.localdate() - timedelta(days=EXCEPCIONES_PASADAS_DIAS)
+    qs = (Sucursal.objects
+          .select_related("horario")
+          .prefetch_related(
+              "horarios_dia",
+              Prefetch("excepciones_horario", queryset=ExcepcionHorario.objects.filter(fecha__gte=desde)),
+          )
+          .filter(pk__in=list(versiones)))
+    out = {}
+    for s in qs:
+        try:
+            horario = s.horario
+        except HorarioSucursal.DoesNotExist:
+            horario = None
+        out[s.pk] = compilar_calendario(
+            _tz_o_default(s.timezone),
+            horario=horario,
+            dias=s.horarios_dia.all(),
+            excepciones=s.excepciones_horario.all(),
+            sucursal_id=s.pk,
+            version=versiones[s.pk],
+        )
+    return out
+
+
+def calendario_sucursal(sucursal) -> CalendarioSucursal:
+    """
+    Calendario compilado de la sucursal (instancia o id). Sin sucursal → calendario_global().
+    Camino normal: una lectura de dict; cada CALENDARIO_VERIFICAR_SEG una lectura de caché
+    para detectar ediciones hechas en otro proceso.
+    """
+    sid = getattr(sucursal, "pk", sucursal)
+    if sid is None:
+        return calendario_global()
+    entrada = _locales.get(sid)
+    if entrada is not None and _time.monotonic() < entrada[1]:
+        return entrada[0]
+    return calendarios_sucursales([sid])[sid]
+
+
+def calendarios_sucursales(sucursales) -> Dict[int, CalendarioSucursal]:
+    """
+    {id: calendario} para varias sucursales (instancias o ids) a la vez: un get_many de
+    versiones para las que toca verificar y una sola compilación para las que cambiaron.
+    Una sucursal inexistente recibe calendario_global().
+    """
+    ids = [getattr(s, "pk", s) for s in sucursales]
+    ahora = _time.monotonic()
+    out: Dict[int, CalendarioSucursal] = {}
+    revisar = []
+    for sid in ids:
+        entrada = _locales.get(sid)
+        if entrada is not None and ahora < entrada[1]:
+            out[sid] = entrada[0]
+        else:
+            revisar.append(sid)
+    if not revisar:
+        return out
+
+    verificar = float(getattr(settings, "CALENDARIO_VERIFICAR_SEG", 5))
+    try:
+        guardadas = cache.get_many([_version_key(sid) for sid in revisar])
+        versiones = {sid: guardadas.get(_version_key(sid)) for sid in revisar}
+    except Exception:
+        versiones = {sid: (_locales[sid][0].version if sid in _locales else None) for sid in revisar}
+
+    compilar = {}
+    for sid in revisar:
+        entrada = _locales.get(sid)
+        if entrada is not None and entrada[0].version == versiones[sid]:
+            out[sid] = entrada[0]
+        else:
+            compilar[sid] = versiones[sid]
+    if compilar:
+        out.update(_compilar_sucursales(compilar))
+
+    with _lock:
+        for sid in revisar:
+            if sid in out:
+                _locales[sid] = (out[sid], ahora + verificar)
+    for sid in revisar:
+        out.setdefault(sid, calendario_global())
+    return out
+
+
+def invalidar_calendario(sucursal_id) -> None:
+    """
+    Descarta el calendario compilado aquí y avisa a los demás procesos vía caché, al
+    confirmar la transacción: antes, otro proceso podría recompilar las filas viejas con
+    la versión nueva y quedarse con el horario anterior hasta la siguiente edición.
+    """
+    if sucursal_id is None:
+        return
+
+    def _subir():
+        with _lock:
+            _locales.pop(sucursal_id, None)
+        try:
+            cache.set(_version_key(sucursal_id), _time.time_ns(), None)
+        except Exception:
+            pass
+        # Los slots cacheados se calcularon con el horario anterior
+        slots_invalidate_prefix(f"slots:{sucursal_id}:")
+
+    transaction.on_commit(_subir)
+
+
+def _reset_calendarios(*, setting, **kwargs):
+    if setting in _SETTINGS_CALENDARIO:
+        _calendario_global.cache_clear()
+        with _lock:
+            _locales.clear()
+
+
+setting_changed.connect(_reset_calendarios)
@@ -0,0 +1,222 @@
+# reservas/folios.py
+"""
+Folios de reserva: asignación, forma canónica y búsqueda.
+
+Asignación (generar_folio / folios_del_dia): R-YYYYMMDD-XXXXXXC, fecha local de emisión,
+6 hex de consecutivo del día y un dígito de control C (Luhn mod 16 sobre fecha + consecutivo).
+  - El consecutivo sale del contador por día FolioDia: cada proceso reserva un bloque de
+    FOLIO_BLOQUE números con un solo UPSERT ... RETURNING y los reparte en memoria. No hay
+    reintentos por IntegrityError: dos procesos nunca reciben el mismo número.
+  - El bloque se reserva en autocommit (conexión aparte si el llamador está dentro de una
+    transacción): un rollback del llamador no "devuelve" números que este proceso ya tiene.
+  - El consecutivo se permuta (Feistel con FOLIO_CLAVE) para que los folios no salgan en
+    orden; la permutación es biyectiva, así que sigue siendo único. FOLIO_CLAVE no se
+    rota: con otra clave los números que quedan del día podrían dar folios ya emitidos.
+  - Los folios viejos (6 hex aleatorios) tienen otro largo: no chocan con los nuevos.
+  - Un folio de 7 con el dígito de control mal (QR o teclado) se descarta sin ir a BD.
+
+El folio se guarda siempre en mayúsculas (Reserva.save + migración 0047), así que la
+búsqueda es folio = <canónico>, que usa el índice único b-tree; folio__iexact no puede
+usarlo en PostgreSQL (compara UPPER(folio) y hace seq scan).
+
+Todas las entradas (QR, buscador de staff, acciones por folio) pasan por
+normalizar_folio(): "r-20250916-a3f91c", " R20250916A3F91C ", "20250916-A3F91C" o la URL
+completa del QR dan "R-20250916-A3F91C" (igual con los de 7).
+
+Caché corto de folios escaneados (FOLIO_CACHE_TTL): el QR de la puerta abre la ficha y
+enseguida se hace el check-in; la segunda búsqueda resuelve folio → pk desde caché y va
+directo por llave primaria.
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import re
+import threading
+from datetime import date
+from functools import lru_cache
+from typing import Iterator, List, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.utils import timezone
+
+_FOLIO_ACTUAL = re.compile(r"^R-?(\d{8})-?([0-9A-F]{6,7})$")
+
+CAPACIDAD_DIA = 1 << 24  # 6 hex de consecutivo por día, toda la cadena
+
+
+class FoliosAgotados(RuntimeError):
+    """Se acabó el consecutivo de un día (más de CAPACIDAD_DIA folios)."""
+
+
+# ---------------------------------------------------------------------------
+# Codificación: consecutivo permutado + dígito de control
+# ---------------------------------------------------------------------------
+@lru_cache(maxsize=1 << 15)  # mitad es de 12 bits: en bloques grandes casi todo es acierto
+def _ronda(dia: date, i: int, mitad: int) -> int:
+    h = hashlib.blake2b(f"{dia:%Y%m%d}:{i}:{mitad}".encode(), digest_size=2,
+                        key=str(getattr(settings, "FOLIO_CLAVE", "")).encode()[:64])
+    return int.from_bytes(h.digest(), "big") & 0xFFF
+
+
+def _permutar(dia: date, n: int) -> int:
+    """Biyección de 24 bits (Feistel de 4 rondas sobre mitades de 12 bits)."""
+    izq, der = n >> 12, n & 0xFFF
+    for i in range(4):
+        izq, der = der, izq ^ _ronda(dia, i, der)
+    return (izq << 12) | der
+
+
+def digito_control(cifras: str) -> str:
+    """Luhn mod 16: detecta cualquier carácter cambiado y casi todas las transposiciones."""
+    total, factor = 0, 2
+    for ch in reversed(cifras):
+        v = int(ch, 16) * factor
+        total += v // 16 + v % 16
+        factor = 3 - factor
+    return "%X" % ((16 - total % 16) % 16)
+
+
+def _codificar(dia: date, n: int) -> str:
+    cuerpo = f"{dia:%Y%m%d}{_permutar(dia, n):06X}"
+    return f"R-{cuerpo[:8]}-{cuerpo[8:]}{digito_control(cuerpo)}"
+
+
+def folio_valido(folio: str) -> bool:
+    """False solo si es un folio del formato actual con el dígito de control mal."""
+    m = _FOLIO_ACTUAL.match(folio or "")
+    if not m or len(m.group(2)) != 7:
+        return True  # folios viejos / otros formatos: no llevan control
+    cuerpo = m.group(1) + m.group(2)[:6]
+    return digito_control(cuerpo) == m.group(2)[6]
+
+
+# ---------------------------------------------------------------------------
+# Contador por día (bloques)
+# ---------------------------------------------------------------------------
+def _reservar(dia: date, cantidad: int):
+    """Reserva [ini, fin) del consecutivo de 'dia' con un UPSERT en autocommit."""
+    from .models import FolioDia  # import local evita ciclos
+
+    sql = (
+        f"INSERT INTO {FolioDia._meta.db_table} (dia, siguiente) VALUES (%s, %s) "
+        f"ON CONFLICT (dia) DO UPDATE SET siguiente = {FolioDia._meta.db_table}.siguiente + EXCLUDED.siguiente "
+        "RETURNING siguiente"
+    )
+    aparte = connection.in_atomic_block
+    conn = connections.create_connection(DEFAULT_DB_ALIAS) if aparte else connection
+    try:
+        with conn.cursor() as c:
+            c.execute(sql, [dia, cantidad])
+            fin = c.fetchone()[0]
+    finally:
+        if aparte:
+            conn.close()
+    ini = fin - cantidad
+    if ini >= CAPACIDAD_DIA:
+        raise FoliosAgotados(f"Sin folios para {dia:%Y-%m-%d}.")
+    return ini, min(fin, CAPACIDAD_DIA)
+
+
+_lock = threading.Lock()
+_bloques = {}  # dia -> [siguiente, fin, pid]
+
+
+def generar_folio(dia: Optional[date] = None) -> str:
+    """
+    Folio nuevo (default de Reserva.folio). 'dia' = fecha de emisión (hoy local).
+    Una query cada FOLIO_BLOQUE folios por proceso; las demás son solo memoria.
+    """
+    dia = dia or timezone.localdate()
+    pid = os.getpid()  # tras un fork el hijo no hereda el bloque del padre
+    with _lock:
+        b = _bloques.get(dia)
+        if b is None or b[2] != pid or b[0] >= b[1]:
+            if len(_bloques) > 8:
+                _bloques.clear()
+            ini, fin = _reservar(dia, max(1, int(getattr(settings, "FOLIO_BLOQUE", 50))))
+            b = _bloques[dia] = [ini, fin, pid]
+        n = b[0]
+        b[0] += 1
+    return _codificar(dia, n)
+
+
+def folios_del_dia(dia: date, bloque: int = 1000) -> Iterator[str]:
+    """Folios de 'dia' sin fin, reservando 'bloque' números por query (sembrado, importaciones)."""
+    while True:
+        ini, fin = _reservar(dia, bloque)
+        for n in range(ini, fin):
+            yield _codificar(dia, n)
+
+
+def folios_en_bloque(cantidad: int, dia: Optional[date] = None) -> List[str]:
+    """Exactamente 'cantidad' folios de 'dia' (hoy si no se indica) con una sola query."""
+    if cantidad <= 0:
+        return []
+    dia = dia or timezone.localdate()
+    ini, fin = _reservar(dia, cantidad)
+    if fin - ini < cantidad:
+        raise FoliosAgotados(f"Sin folios para {dia:%Y-%m-%d}.")
+    return [_codificar(dia, n) for n in range(ini, fin)]
+
+
+def normalizar_folio(texto) -> str:
+    """Forma canónica del folio ('' si viene vacío)."""
+    s = str(texto or "").strip()
+    if "/" in s:  # URL del QR (…/r/R-20250916-A3F91C/)
+        partes = [p for p in s.split("/") if p]
+        s = partes[-1] if partes else ""
+        if s.lower() == "checkin" and len(partes) > 1:
+            s = partes[-2]
+    s = "".join(s.split()).upper()
+    if not s:
+        return ""
+    m = _FOLIO_ACTUAL.match(s if s.startswith("R") else "R-" + s)
+    if m:
+        return f"R-{m.group(1)}-{m.group(2)}"
+    # Folios viejos (R-XXXXXXXX) u otros formatos: solo prefijo y mayúsculas
+    if not s.startswith("R-"):
+        s = "R-" + s[1:].lstrip("-") if s.startswith("R") else "R-" + s
+    return s
+
+
+def _key(folio: str) -> str:
+    return f"folio:{folio}"
+
+
+def recordar_folio(reserva) -> None:
+    """Deja folio → pk en caché (la reserva se acaba de escanear o buscar)."""
+    try:
+        cache.set(_key(reserva.folio), reserva.pk, int(getattr(settings, "FOLIO_CACHE_TTL", 300)))
+    except Exception:
+        pass
+
+
+def buscar_reserva_por_folio(folio, qs=None):
+    """
+    Reserva con ese folio (normalizado) o None. 'qs' permite select_related/only del
+    llamador. Camino normal: caché folio → pk y get por pk; si no, igualdad exacta por el
+    índice único de folio. Dígito de control mal → None sin consultar.
+    """
+    from .models import Reserva  # import local evita ciclos
+
+    canon = normalizar_folio(folio)
+    if not canon or not folio_valido(canon):
+        return None
+    qs = Reserva.objects.all() if qs is None else qs
+
+    try:
+        pk = cache.get(_key(canon))
+    except Exception:
+        pk = None
+    if pk is not None:
+        r = next(iter(qs.filter(pk=pk).order_by()[:1]), None)
+        if r is not None and r.folio == canon:
+            return r
+
+    r = next(iter(qs.filter(folio=canon).order_by()[:1]), None)  # único: sin ORDER BY
+    if r is not None:
+        recordar_folio(r)
+    return r
@@ -4,14 +4,13 @@ from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
 from django.conf import settings
 from django.utils import timezone
-from django.db import IntegrityError, transaction
 from datetime import datetime   # <--- ESTE es el que falta
 from django.forms.models import construct_instance  # <-- ESTE ES EL QUE FALTABA
 
 from django.forms import inlineformset_factory
 from .models import SucursalFoto
 from .models import Cliente, Reserva, Sucursal, Mesa
-from .utils import conflicto_y_disponible, generar_folio
+from .utils import calendario_sucursal, conflicto_y_disponible, guardar_reserva_sin_traslape
 from .emails import enviar_correo_reserva_confirmada
 from django.utils.translation import gettext_lazy as _
 from django.core.exceptions import ValidationError
@@ -78,6 +77,11 @@ class ReservaForm(forms.ModelForm):
         self.cliente = kwargs.pop("cliente", None)
         super().__init__(*args, **kwargs)
         self.fields["fecha"].input_formats = DATETIME_INPUT_FORMATS
+        # Reserva.clean() exige cliente: se asigna antes de la validación del modelo
+        if self.cliente is not None:
+            self.instance.cliente = self.cliente
+        if self.mesa is not None:
+            self.instance.mesa = self.mesa
 
     def clean_fecha(self):
         fecha = self.cleaned_data.get("fecha")
@@ -259,7 +263,7 @@ class WalkInReservaForm(forms.ModelForm):
         if not self.initial.get("fecha") and not self.data.get("fecha"):
             tz = timezone.get_current_timezone()
             now = timezone.now().astimezone(tz).replace(second=0, microsecond=0)
-            step = int(getattr(settings, "RESERVA_PASO_MINUTOS", 15))
+            step = calendario_sucursal(suc).paso_min
             extra = (step - (now.minute % step)) % step
             self.initial["fecha"] = (now + timezone.timedelta(minutes=extra))
 
@@ -313,7 +317,7 @@ class WalkInReservaForm(forms.ModelForm):
             self.add_error("num_personas", f"La mesa admite hasta {mesa.capacidad} personas.")
 
         if mesa and fecha:
-            hay, hasta = conflicto_y_disponible(mesa, fecha)
+            hay, hasta = conflicto_y_disponible(mesa, fecha, num)
             if hay:
                 self.add_error(
                     "fecha",
@@ -326,19 +330,11 @@ class WalkInReservaForm(forms.ModelForm):
     def save(self, commit=True):
         reserva = super().save(commit=False)
 
-        if not getattr(reserva, "folio", ""):
-            reserva.folio = generar_folio(reserva)
-
         if commit:
-            for _ in range(5):
-                try:
-                    with transaction.atomic():
-                        reserva.save()
-                    break
-                except IntegrityError:
-                    reserva.folio = generar_folio(reserva)
-            else:
-                raise
+            # Reserva.save() asigna el folio, único por construcción (folios.generar_folio):
+            # sin reintentos. Si otra hostess ocupó la mesa después de clean(), la exclusión
+            # de BD lo rechaza y sube MesaOcupada (la vista lo muestra como error del form).
+            guardar_reserva_sin_traslape(reserva)
 
             email = (self.cleaned_data.get("email_cliente") or "").strip()
             if email:
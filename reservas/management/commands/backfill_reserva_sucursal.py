@@ -0,0 +1,50 @@
+# reservas/management/commands/backfill_reserva_sucursal.py
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+# Un lote = rango de ids [desde, hasta): range scan por llave primaria + join a la mesa
+LOTE_SQL = """
+UPDATE reservas_reserva r
+   SET sucursal_id = m.sucursal_id
+  FROM reservas_mesa m
+ WHERE r.id >= %s AND r.id < %s
+   AND m.id = r.mesa_id
+   AND r.sucursal_id IS DISTINCT FROM m.sucursal_id
+"""
+
+PENDIENTES_SQL = """
+SELECT count(*)
+  FROM reservas_reserva r JOIN reservas_mesa m ON m.id = r.mesa_id
+ WHERE r.sucursal_id IS DISTINCT FROM m.sucursal_id
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Rellena Reserva.sucursal con la sucursal de su mesa (nulas o distintas), en lotes por id.\n"
+        "Correrlo antes de migrar a 0049 deja esa migración sin trabajo pesado; es idempotente."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=5000, help="Ids por lote/transacción (default 5000).")
+        parser.add_argument("--dry-run", action="store_true", help="Solo cuenta cuántas reservas faltan.")
+
+    def handle(self, *args, **opts):
+        with connection.cursor() as cur:
+            cur.execute(PENDIENTES_SQL)
+            pendientes = cur.fetchone()[0]
+            self.stdout.write(f"Reservas con sucursal nula o distinta a la de su mesa: {pendientes}")
+            if opts["dry_run"] or not pendientes:
+                return
+            cur.execute("SELECT min(id), max(id) FROM reservas_reserva")
+            minimo, maximo = cur.fetchone()
+
+        lote = max(1, opts["batch_size"])
+        total = 0
+        for desde in range(minimo, maximo + 1, lote):
+            with transaction.atomic(), connection.cursor() as cur:
+                cur.execute(LOTE_SQL, [desde, desde + lote])
+                total += cur.rowcount
+            if total:
+                self.stdout.write(f"  ids < {desde + lote}: {total} actualizadas", ending="\r")
+        self.stdout.write(self.style.SUCCESS(f"\nListo: {total} reservas actualizadas."))
@@ -1,13 +1,20 @@
 # reservas/management/commands/backfill_timezones_and_reservas.py
-from django.core.management.base import BaseCommand
+import json
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
 from django.core.exceptions import FieldDoesNotExist, FieldError
-from django.db import transaction
+from django.db import connection, transaction
 from django.db.models import Q
 from django.utils import timezone
 from datetime import timezone as dt_timezone
 
 from zoneinfo import ZoneInfo
 from reservas.models import Reserva, Sucursal  # ajusta si tu app/modelos tienen otro path
+from reservas.calendario import invalidar_calendario
+from reservas.utils_time import _point_key, resolve_tz_batch
 
 
 class Command(BaseCommand):
@@ -15,7 +22,8 @@ class Command(BaseCommand):
         "Backfill de campos de tiempo en reservas históricas:\n"
         "- Completa inicio_utc/fin_utc desde local_inicio/local_fin y viceversa\n"
         "- Ajusta local_service_date en hora local de la sucursal\n"
-        "Soporta: --dry-run, --only-missing, filtros por país/sucursal/fechas y tamaño de lote."
+        "Soporta: --dry-run, --only-missing, filtros por país/sucursal/fechas y tamaño de lote.\n"
+        "Con --set-based (PostgreSQL) convierte en SQL por zona horaria, en lotes por id y reanudable."
     )
 
     def add_arguments(self, parser):
@@ -30,6 +38,50 @@ class Command(BaseCommand):
         parser.add_argument("--date-to", type=str, default=None, help="ISO local date hasta (YYYY-MM-DD) contra local_inicio o inicio_utc.")
         parser.add_argument("--force", action="store_true",
                             help="Recalcula aunque existan ambos (utc y local). Úsalo con cuidado (haz backup).")
+        parser.add_argument("--no-resolve-tz", action="store_true",
+                            help="No intenta resolver el timezone de sucursales sin él (desde lat/lng).")
+        parser.add_argument("--set-based", action="store_true",
+                            help="Modo SQL (PostgreSQL): UPDATE por zona horaria en lotes keyset por id.")
+        parser.add_argument("--checkpoint", type=str, default=None,
+                            help="Archivo JSON de progreso para --set-based (default: logs/backfill_tz_checkpoint.json).")
+        parser.add_argument("--resume", action="store_true",
+                            help="Con --set-based, continúa desde el último id guardado en --checkpoint.")
+
+    def _resolve_missing_timezones(self, sucursal_id=None, dry_run=False):
+        """
+        Completa Sucursal.timezone desde lat/lng en lote (una sola resolución por
+        coordenada distinta; offline primero y HTTP concurrente solo para lo que falte).
+        """
+        qs = (Sucursal.objects
+              .filter(Q(timezone__isnull=True) | Q(timezone=""))
+              .filter(lat__isnull=False, lng__isnull=False)
+              .only("id", "lat", "lng", "timezone"))
+        if sucursal_id:
+            qs = qs.filter(pk=sucursal_id)
+        sucursales = list(qs)
+        if not sucursales:
+            return 0
+
+        resueltos = resolve_tz_batch((s.lat, s.lng) for s in sucursales)
+        cambiadas = []
+        for s in sucursales:
+            tz = resueltos.get(_point_key(s.lat, s.lng))
+            if tz:
+                s.timezone = tz
+                cambiadas.append(s)
+            else:
+                self.stderr.write(f"[suc#{s.id}] No se pudo resolver timezone para ({s.lat}, {s.lng}).")
+
+        if cambiadas and not dry_run:
+            Sucursal.objects.bulk_update(cambiadas, ["timezone"], batch_size=500)
+            # bulk_update no dispara señales: los calendarios compilados guardan la tz
+            for s in cambiadas:
+                invalidar_calendario(s.pk)
+        self.stdout.write(
+            f"Timezones de sucursal resueltos: {len(cambiadas)}/{len(sucursales)} "
+            f"{'(dry-run)' if dry_run else ''}"
+        )
+        return len(cambiadas)
 
     def handle(self, *args, **opts):
         dry_run = opts["dry_run"]
@@ -42,6 +94,12 @@ class Command(BaseCommand):
         date_to = opts["date_to"]
         force = opts["force"]
 
+        if not opts["no_resolve_tz"]:
+            self._resolve_missing_timezones(sucursal_id=sucursal_id, dry_run=dry_run)
+
+        if opts["set_based"]:
+            return self._handle_set_based(opts)
+
         qs = (Reserva.objects
               .select_related("sucursal", "sucursal__pais")
               .order_by("id"))
@@ -215,3 +273,181 @@ class Command(BaseCommand):
             f"Listo. Total={total} | Actualizadas={updated} | Sin cambios={unchanged} | Errores={errors} | "
             f"{'(dry-run)' if dry_run else ''}"
         ))
+
+    # ------------------------------------------------------------------
+    # Modo set-based (PostgreSQL)
+    # ------------------------------------------------------------------
+    def _sucursales_por_timezone(self, opts):
+        """{timezone: [sucursal_id, ...]} para las sucursales dentro de los filtros."""
+        qs = Sucursal.objects.exclude(timezone__isnull=True).exclude(timezone="")
+        if opts["sucursal_id"]:
+            qs = qs.filter(pk=opts["sucursal_id"])
+        country = opts["country"]
+        if country:
+            qs = qs.filter(
+                Q(pais__iso2__iexact=country) | Q(pais__nombre__iexact=country) | Q(pais__nombre__icontains=country)
+            )
+
+        grupos = {}
+        for suc_id, tz_name in qs.values_list("id", "timezone").order_by("id"):
+            try:
+                ZoneInfo(tz_name)
+            except Exception:
+                self.stderr.write(f"[suc#{suc_id}] ZoneInfo inválido: {tz_name}; omitiendo.")
+                continue
+            grupos.setdefault(tz_name, []).append(suc_id)
+        return grupos
+
+    def _load_checkpoint(self, path):
+        try:
+            return json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return {}
+
+    def _save_checkpoint(self, path, data):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(data, indent=2), encoding="utf-8")
+        tmp.replace(path)
+
+    def _handle_set_based(self, opts):
+        """
+        Una sentencia UPDATE por (zona horaria, lote de ids):
+          - inicio_utc/fin_utc y local_inicio/local_fin son timestamptz: se completan entre sí
+            (mismo instante) sin pasar por Python.
+          - local_service_date = (local_inicio AT TIME ZONE tz)::date
+        Solo toca filas que realmente cambian (salvo --force). Guarda el último id procesado
+        por zona horaria en --checkpoint para poder reanudar con --resume.
+        """
+        if connection.vendor != "postgresql":
+            raise CommandError("--set-based requiere PostgreSQL.")
+        if opts["limit"]:
+            self.stderr.write("--limit se ignora en modo --set-based.")
+
+        dry_run = opts["dry_run"]
+        force = opts["force"]
+        batch_size = max(1, opts["batch_size"])
+        checkpoint_path = Path(opts["checkpoint"] or Path(settings.BASE_DIR) / "logs" / "backfill_tz_checkpoint.json")
+        checkpoint = self._load_checkpoint(checkpoint_path) if opts["resume"] else {}
+
+        grupos = self._sucursales_por_timezone(opts)
+        if not grupos:
+            self.stdout.write(self.style.WARNING("No hay sucursales con timezone válido que cumplan los filtros."))
+            return
+
+        table = connection.ops.quote_name(Reserva._meta.db_table)
+
+        if force:
+            set_local_inicio = "COALESCE(inicio_utc, local_inicio)"
+            set_local_fin = "COALESCE(fin_utc, local_fin)"
+            needs_change = "TRUE"
+        else:
+            set_local_inicio = "COALESCE(local_inicio, inicio_utc)"
+            set_local_fin = "COALESCE(local_fin, fin_utc)"
+            needs_change = (
+                "(inicio_utc IS NULL AND local_inicio IS NOT NULL)"
+                " OR (fin_utc IS NULL AND local_fin IS NOT NULL)"
+                " OR (local_inicio IS NULL AND inicio_utc IS NOT NULL)"
+                " OR (local_fin IS NULL AND fin_utc IS NOT NULL)"
+                " OR (COALESCE(local_inicio, inicio_utc) IS NOT NULL AND local_service_date IS DISTINCT FROM"
+                " (COALESCE(local_inicio, inicio_utc) AT TIME ZONE %(tz)s)::date)"
+            )
+            if opts["only_missing"]:
+                needs_change = (
+                    "inicio_utc IS NULL OR fin_utc IS NULL OR local_inicio IS NULL"
+                    " OR local_fin IS NULL OR local_service_date IS NULL"
+                )
+
+        where = [
+            "sucursal_id = ANY(%(sucursales)s)",
+            "id > %(desde)s",
+            "id <= %(hasta)s",
+            f"({needs_change})",
+        ]
+        if opts["date_from"]:
+            where.append("(COALESCE(local_inicio, inicio_utc) AT TIME ZONE %(tz)s)::date >= %(date_from)s")
+        if opts["date_to"]:
+            where.append("(COALESCE(local_inicio, inicio_utc) AT TIME ZONE %(tz)s)::date <= %(date_to)s")
+        where_sql = " AND ".join(where)
+
+        update_sql = f"""
+            UPDATE {table} SET
+                inicio_utc = COALESCE(inicio_utc, local_inicio),
+                fin_utc = COALESCE(fin_utc, local_fin),
+                local_inicio = {set_local_inicio},
+                local_fin = {set_local_fin},
+                local_service_date = COALESCE(
+                    (COALESCE(local_inicio, inicio_utc) AT TIME ZONE %(tz)s)::date,
+                    local_service_date
+                )
+            WHERE {where_sql}
+        """
+        count_sql = f"SELECT COUNT(*) FROM {table} WHERE {where_sql}"
+        # Keyset: límite superior del siguiente lote usando el índice de la PK
+        next_bound_sql = f"""
+            SELECT MAX(id), COUNT(*) FROM (
+                SELECT id FROM {table}
+                WHERE sucursal_id = ANY(%(sucursales)s) AND id > %(desde)s
+                ORDER BY id
+                LIMIT %(batch)s
+            ) AS lote
+        """
+
+        total_updated = 0
+        total_scanned = 0
+        started = time.monotonic()
+
+        for tz_name, suc_ids in grupos.items():
+            last_id = int(checkpoint.get(tz_name, 0))
+            self.stdout.write(f">> {tz_name}: {len(suc_ids)} sucursal(es), desde id>{last_id}")
+            tz_updated = 0
+
+            while True:
+                params = {
+                    "tz": tz_name,
+                    "sucursales": suc_ids,
+                    "desde": last_id,
+                    "batch": batch_size,
+                    "date_from": opts["date_from"],
+                    "date_to": opts["date_to"],
+                }
+                with connection.cursor() as cur:
+                    cur.execute(next_bound_sql, params)
+                    upper, scanned = cur.fetchone()
+                if not upper:
+                    break
+                params["hasta"] = upper
+
+                with transaction.atomic():
+                    with connection.cursor() as cur:
+                        if dry_run:
+                            cur.execute(count_sql, params)
+                            n = cur.fetchone()[0]
+                        else:
+                            cur.execute(update_sql, params)
+                            n = cur.rowcount
+
+                tz_updated += n
+                total_updated += n
+                total_scanned += scanned
+                last_id = upper
+
+                if not dry_run:
+                    checkpoint[tz_name] = last_id
+                    self._save_checkpoint(checkpoint_path, checkpoint)
+
+                elapsed = time.monotonic() - started
+                rate = total_scanned / elapsed if elapsed else 0
+                self.stdout.write(
+                    f"   id<={last_id} | lote={scanned} | actualizadas={n} | "
+                    f"acumulado={total_updated}/{total_scanned} | {rate:,.0f} filas/s"
+                )
+
+            self.stdout.write(f"   {tz_name}: {tz_updated} actualizadas.")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Listo (set-based). Revisadas={total_scanned} | Actualizadas={total_updated} | "
+            f"{time.monotonic() - started:.1f}s {'(dry-run)' if dry_run else ''}"
+        ))
+        if not dry_run:
+            self.stdout.write(f"Checkpoint: {checkpoint_path}")
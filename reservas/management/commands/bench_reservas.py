@@ -0,0 +1,243 @@
+# reservas/management/commands/bench_reservas.py
+import json
+import statistics
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from reservas import seeding
+from reservas.models import Mesa, Pais, Reserva
+from reservas.utils import (
+    _auto_cancel_por_tolerancia,
+    asignar_mesa_automatica,
+    ocupacion_sucursal,
+    reservas_en_conflicto,
+)
+
+BENCH_CLIENTE = "bench_cliente"
+BENCH_STAFF = "bench_staff"
+
+# El OTP de staff redirigiría cada request de staff al login 2FA
+MIDDLEWARE_EXCLUIDO = {"reservas.middleware.StaffOTPRequiredMiddleware"}
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark reproducible de rutas calientes de reservas.\n"
+        "Siembra N sucursales × M mesas × D días (sembrar_carga) y mide tiempo y número de queries de:\n"
+        "api_slots_sucursal, api_calendario_sucursal (14 días), disponibilidad_mesa, asignar_mesa_automatica,\n"
+        "reservar, seleccionar_sucursal, conflicto_mesa, ocupacion_sucursal, barrido_pend,\n"
+        "kds_data y AnalyticsDataView. Guarda JSON y compara contra un baseline (--baseline).\n"
+        "Requiere PostgreSQL (rangos, exclusión GiST): usa la BD configurada. NO correr contra producción."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sucursales", type=int, default=5, help="Sucursales sintéticas (default 5).")
+        parser.add_argument("--mesas", type=int, default=20, help="Mesas por sucursal (default 20).")
+        parser.add_argument("--dias", type=int, default=30, help="Días sembrados (default 30).")
+        parser.add_argument("--seed", type=int, default=20251022, help="Semilla del sembrado (default 20251022).")
+        parser.add_argument("--resembrar", action="store_true",
+                            help="Borra y vuelve a sembrar aunque ya haya datos de carga.")
+        parser.add_argument("--repeat", type=int, default=20, help="Repeticiones medidas por escenario (default 20).")
+        parser.add_argument("--solo", type=str, default="",
+                            help="Lista separada por comas de escenarios a correr.")
+        parser.add_argument("--output", type=str, default=None,
+                            help="Archivo JSON de salida (default: logs/bench_reservas.json).")
+        parser.add_argument("--baseline", type=str, default=None, help="JSON previo para comparar.")
+        parser.add_argument("--max-regresion", type=float, default=None,
+                            help="Con --baseline: falla si la mediana empeora más de este %% o suben las queries.")
+
+    # ------------------------------------------------------------------ setup
+    def _preparar_datos(self, opts):
+        pais, _ = Pais.objects.get_or_create(iso2="MX", defaults={"nombre": "México"})
+        sucursales = seeding.asegurar_sucursales(opts["sucursales"], opts["mesas"], pais=pais)
+        ids = [s.id for s in sucursales]
+
+        desde = timezone.localdate() - timedelta(days=opts["dias"] // 2)
+        sembradas = Reserva.objects.filter(
+            sucursal_id__in=ids, email_contacto__endswith=f"@{seeding.SEED_EMAIL_DOMAIN}"
+        )
+        if opts["resembrar"]:
+            seeding.limpiar_sembradas(ids)
+        if opts["resembrar"] or not sembradas.exists():
+            self.stdout.write(f"Sembrando {len(ids)}×{opts['mesas']}×{opts['dias']}…")
+            seeding.sembrar(sucursales, desde, opts["dias"], seeding.asegurar_clientes(1000), seed=opts["seed"])
+        return sucursales, pais
+
+    def _usuarios(self):
+        User = get_user_model()
+        cliente, _ = User.objects.get_or_create(username=BENCH_CLIENTE, defaults={"email": "cliente@bench.local"})
+        staff, creado = User.objects.get_or_create(
+            username=BENCH_STAFF,
+            defaults={"email": "staff@bench.local", "is_staff": True, "is_superuser": True},
+        )
+        c_cli, c_staff = Client(), Client()
+        c_cli.force_login(cliente)
+        c_staff.force_login(staff)
+        return c_cli, c_staff
+
+    # -------------------------------------------------------------- escenarios
+    def _escenarios(self, sucursales, pais, c_cli, c_staff, opts):
+        suc = sucursales[0]
+        tz = suc.tz()
+        dia = timezone.localdate() + timedelta(days=1)
+        hora = datetime(dia.year, dia.month, dia.day, 13, 0, tzinfo=tz)
+        mesa = Mesa.objects.filter(sucursal=suc, capacidad__gte=4).order_by("numero").first()
+        ajax = {"HTTP_X_REQUESTED_WITH": "XMLHttpRequest"}
+
+        def reservar():
+            # Se mide el POST completo y se revierte para no acumular reservas
+            with transaction.atomic():
+                resp = c_cli.post(
+                    reverse("reservas:reservar", args=[mesa.id]),
+                    {"fecha": f"{dia:%Y-%m-%d}T19:00", "num_personas": 2},
+                )
+                transaction.set_rollback(True)
+            return resp.status_code
+
+        def barrido_pend():
+            # Barrido de PEND vencidas (corre en cada vista de reservar/listar); se revierte
+            with transaction.atomic():
+                n = _auto_cancel_por_tolerancia(minutos=6)
+                transaction.set_rollback(True)
+            return n
+
+        desde = timezone.localdate() - timedelta(days=opts["dias"] // 2)
+        hasta = desde + timedelta(days=opts["dias"] - 1)
+
+        return {
+            "api_slots_sucursal": lambda: c_cli.get(
+                reverse("reservas:api_slots_sucursal", args=[suc.id]),
+                {"fecha": dia.isoformat(), "party": 2}).status_code,
+            "api_calendario_sucursal": lambda: c_cli.get(
+                reverse("reservas:api_calendario_sucursal", args=[suc.id]),
+                {"desde": dia.isoformat(), "dias": 14, "party": 2}).status_code,
+            "disponibilidad_mesa": lambda: c_cli.get(
+                reverse("reservas:disponibilidad_mesa", args=[mesa.id]),
+                {"fecha": dia.isoformat(), "party": 2}, **ajax).status_code,
+            "asignar_mesa_automatica": lambda: getattr(asignar_mesa_automatica(suc, hora, 4), "id", None),
+            "reservar": reservar,
+            "conflicto_mesa": lambda: reservas_en_conflicto(mesa, hora, hora + timedelta(minutes=90)).exists(),
+            "ocupacion_sucursal": lambda: len(ocupacion_sucursal(suc, hora, hora + timedelta(hours=4))),
+            "barrido_pend": barrido_pend,
+            "seleccionar_sucursal": lambda: c_staff.get(
+                reverse("reservas:seleccionar_sucursal"),
+                {"date": dia.isoformat(), "time": "19:00", "party": 2}).status_code,
+            "kds_data": lambda: c_staff.get(reverse("reservas:kds_data"), {"rango": "hoy"}).status_code,
+            "analytics_data": lambda: c_staff.get(
+                reverse("reservas:chainadmin_analytics_data"),
+                {"pais": pais.id, "from": desde.isoformat(), "to": hasta.isoformat(), "g": "day"}).status_code,
+        }
+
+    def _medir(self, fn, repeat):
+        fn()  # calentamiento (imports, plantillas, caché de conexión)
+        with CaptureQueriesContext(connection) as ctx:
+            resultado = fn()
+        queries = len(ctx.captured_queries)
+
+        tiempos = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            fn()
+            tiempos.append((time.perf_counter() - t0) * 1000)
+        tiempos.sort()
+        return {
+            "resultado": resultado,
+            "queries": queries,
+            "ms_min": round(tiempos[0], 3),
+            "ms_median": round(statistics.median(tiempos), 3),
+            "ms_p95": round(tiempos[min(len(tiempos) - 1, int(len(tiempos) * 0.95))], 3),
+            "ms_max": round(tiempos[-1], 3),
+        }
+
+    # ------------------------------------------------------------ comparación
+    def _comparar(self, actual, baseline_path, max_regresion):
+        try:
+            base = json.loads(Path(baseline_path).read_text(encoding="utf-8"))
+        except (OSError, ValueError) as e:
+            raise CommandError(f"No se pudo leer el baseline: {e}")
+
+        regresiones = []
+        self.stdout.write(f"\nComparación contra {baseline_path}:")
+        for nombre, cur in actual["resultados"].items():
+            prev = base.get("resultados", {}).get(nombre)
+            if not prev:
+                self.stdout.write(f"  {nombre:<26} (sin baseline)")
+                continue
+            delta = (cur["ms_median"] - prev["ms_median"]) / max(prev["ms_median"], 1e-6) * 100
+            linea = (f"  {nombre:<26} {prev['ms_median']:>9.2f} → {cur['ms_median']:>9.2f} ms "
+                     f"({delta:+6.1f}%) | queries {prev['queries']} → {cur['queries']}")
+            peor = max_regresion is not None and (delta > max_regresion or cur["queries"] > prev["queries"])
+            if peor:
+                regresiones.append(nombre)
+                self.stdout.write(self.style.ERROR(linea))
+            elif delta < 0 or cur["queries"] < prev["queries"]:
+                self.stdout.write(self.style.SUCCESS(linea))
+            else:
+                self.stdout.write(linea)
+        return regresiones
+
+    # ------------------------------------------------------------------ main
+    def handle(self, *args, **opts):
+        if opts["repeat"] <= 0:
+            raise CommandError("--repeat debe ser mayor a 0.")
+
+        middleware = [m for m in settings.MIDDLEWARE if m not in MIDDLEWARE_EXCLUIDO]
+        with override_settings(
+            MIDDLEWARE=middleware,
+            ALLOWED_HOSTS=list(settings.ALLOWED_HOSTS) + ["testserver"],
+            EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend",
+        ):
+            sucursales, pais = self._preparar_datos(opts)
+            c_cli, c_staff = self._usuarios()
+            escenarios = self._escenarios(sucursales, pais, c_cli, c_staff, opts)
+
+            solo = [s.strip() for s in opts["solo"].split(",") if s.strip()]
+            desconocidos = set(solo) - set(escenarios)
+            if desconocidos:
+                raise CommandError(f"Escenarios desconocidos: {', '.join(sorted(desconocidos))}")
+
+            resultados = {}
+            for nombre, fn in escenarios.items():
+                if solo and nombre not in solo:
+                    continue
+                r = self._medir(fn, opts["repeat"])
+                resultados[nombre] = r
+                self.stdout.write(
+                    f"{nombre:<26} median={r['ms_median']:>9.2f} ms  p95={r['ms_p95']:>9.2f} ms  "
+                    f"queries={r['queries']:<4} resultado={r['resultado']}"
+                )
+
+        ids = [s.id for s in sucursales]
+        salida = {
+            "meta": {
+                "creado": timezone.now().isoformat(),
+                "vendor": connection.vendor,
+                "sucursales": len(ids),
+                "mesas": opts["mesas"],
+                "dias": opts["dias"],
+                "seed": opts["seed"],
+                "repeat": opts["repeat"],
+                "reservas": Reserva.objects.filter(sucursal_id__in=ids).count(),
+            },
+            "resultados": resultados,
+        }
+
+        out = Path(opts["output"] or Path(settings.BASE_DIR) / "logs" / "bench_reservas.json")
+        out.parent.mkdir(parents=True, exist_ok=True)
+        out.write_text(json.dumps(salida, indent=2, ensure_ascii=False), encoding="utf-8")
+        self.stdout.write(self.style.SUCCESS(f"Resultados en {out}"))
+
+        if opts["baseline"]:
+            regresiones = self._comparar(salida, opts["baseline"], opts["max_regresion"])
+            if regresiones:
+                raise CommandError(f"Regresiones: {', '.join(regresiones)}")
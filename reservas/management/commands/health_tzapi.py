@@ -1,14 +1,41 @@
 # reservas/management/commands/health_tzapi.py
 from django.core.management.base import BaseCommand
-from reservas.utils_time import resolve_tz_from_latlng
+from reservas.utils_time import resolve_tz_from_latlng, resolve_tz_batch, _point_key
 
 class Command(BaseCommand):
     help = "Prueba la resolución de Time Zone API / fallback"
 
+    def add_arguments(self, parser):
+        parser.add_argument("--sucursales", action="store_true",
+                            help="Resuelve en lote las coordenadas de todas las sucursales y reporta faltantes.")
+
     def handle(self, *args, **kwargs):
+        if kwargs.get("sucursales"):
+            return self._check_sucursales()
+
         tz = resolve_tz_from_latlng(19.4326, -99.1332)  # CDMX
         if tz:
             self.stdout.write(self.style.SUCCESS(f"OK timezone={tz}"))
         else:
             self.stdout.write(self.style.ERROR("FAIL timezone could not be resolved"))
             raise SystemExit(1)
+
+    def _check_sucursales(self):
+        from reservas.models import Sucursal
+
+        rows = list(Sucursal.objects.filter(lat__isnull=False, lng__isnull=False)
+                    .values_list("id", "lat", "lng", "timezone"))
+        resueltos = resolve_tz_batch((lat, lng) for _, lat, lng, _ in rows)
+
+        fallas = 0
+        for suc_id, lat, lng, actual in rows:
+            tz = resueltos.get(_point_key(lat, lng))
+            if not tz:
+                fallas += 1
+                self.stdout.write(self.style.ERROR(f"FAIL suc#{suc_id} ({lat}, {lng})"))
+            elif actual and actual != tz:
+                self.stdout.write(self.style.WARNING(f"DIFF suc#{suc_id} guardado={actual} resuelto={tz}"))
+
+        self.stdout.write(f"Sucursales={len(rows)} | Coordenadas únicas={len(resueltos)} | Fallas={fallas}")
+        if fallas:
+            raise SystemExit(1)
@@ -0,0 +1,63 @@
+# reservas/management/commands/refrescar_proximos.py
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from reservas.models import Sucursal
+from reservas.proximos import refrescar_proximos, sucursales_desfasadas
+
+
+class Command(BaseCommand):
+    help = (
+        "Precalcula los próximos horarios libres de cada sucursal activa (PROXIMOS_PARTIES) y\n"
+        "los deja en caché para el localizador y el detalle de sucursal.\n"
+        "Corre en bucle: refresco completo cada --intervalo segundos y, entre refrescos, cada\n"
+        "--tick segundos recalcula solo las sucursales cuya ocupación cambió.\n"
+        "Requiere caché compartido (Redis): con locmem las vistas no ven los snapshots."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--intervalo", type=float, default=None,
+                            help="Segundos entre refrescos completos (default PROXIMOS_INTERVALO_SEG, 60).")
+        parser.add_argument("--tick", type=float, default=5,
+                            help="Segundos entre revisiones de sucursales con cambios (default 5).")
+        parser.add_argument("--lote", type=int, default=200,
+                            help="Sucursales por pasada de cálculo (default 200).")
+        parser.add_argument("--una-vez", action="store_true", help="Un refresco completo y termina.")
+
+    def handle(self, *args, **opts):
+        intervalo = opts["intervalo"] or float(getattr(settings, "PROXIMOS_INTERVALO_SEG", 60))
+        tick, lote = opts["tick"], opts["lote"]
+        if intervalo <= 0 or tick <= 0 or lote <= 0:
+            raise CommandError("--intervalo, --tick y --lote deben ser mayores a 0.")
+        ttl = int(getattr(settings, "PROXIMOS_TTL", 120))
+        if intervalo >= ttl:
+            self.stderr.write(self.style.WARNING(
+                f"--intervalo ({intervalo:g}s) >= PROXIMOS_TTL ({ttl}s): habrá huecos sin snapshot."))
+
+        ids, siguiente_completo = [], 0.0
+        try:
+            while True:
+                close_old_connections()
+                inicio = time.monotonic()
+                if inicio >= siguiente_completo:
+                    ids = list(Sucursal.objects.filter(activo=True).order_by("id").values_list("id", flat=True))
+                    pendientes, motivo = ids, "completo"
+                    siguiente_completo = inicio + intervalo
+                else:
+                    pendientes, motivo = sucursales_desfasadas(ids), "cambios"
+
+                guardadas = sum(refrescar_proximos(pendientes[i:i + lote])
+                                for i in range(0, len(pendientes), lote))
+                if pendientes:
+                    self.stdout.write(
+                        f"[{motivo}] {guardadas}/{len(pendientes)} sucursales en "
+                        f"{(time.monotonic() - inicio) * 1000:.0f} ms")
+
+                if opts["una_vez"]:
+                    break
+                time.sleep(tick)
+        except KeyboardInterrupt:
+            self.stdout.write("Detenido.")
@@ -0,0 +1,87 @@
+# reservas/management/commands/sembrar_carga.py
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from reservas.models import Sucursal
+from reservas import seeding
+
+
+class Command(BaseCommand):
+    help = (
+        "Siembra reservas masivas para pruebas de carga (bulk_create, sin señales).\n"
+        "Arma por mesa y día agendas sin traslapes con el horario y duraciones de cada sucursal.\n"
+        "Determinista con --seed. Ej: sembrar_carga --sucursales 50 --mesas 30 --dias 365 --limpiar"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sucursales", type=int, default=5,
+                            help="Cantidad de sucursales sintéticas 'Carga NNNN' (default 5).")
+        parser.add_argument("--sucursal-id", type=int, action="append", default=None,
+                            help="Usa sucursales existentes en lugar de sintéticas (repetible).")
+        parser.add_argument("--mesas", type=int, default=20,
+                            help="Mesas por sucursal sintética; crea las que falten (default 20).")
+        parser.add_argument("--dias", type=int, default=30, help="Días a sembrar (default 30).")
+        parser.add_argument("--desde", type=str, default=None,
+                            help="Primer día YYYY-MM-DD (default: hoy - dias/2, mezcla pasado y futuro).")
+        parser.add_argument("--seed", type=int, default=20251022, help="Semilla (default 20251022).")
+        parser.add_argument("--ocupacion", type=float, default=0.7,
+                            help="Probabilidad 0..1 de ocupar cada hueco libre (default 0.7).")
+        parser.add_argument("--clientes", type=int, default=1000,
+                            help="Clientes sintéticos a repartir (default 1000).")
+        parser.add_argument("--timezone", type=str, default=None,
+                            help="IANA TZ para sucursales sintéticas nuevas (default settings.TIME_ZONE).")
+        parser.add_argument("--chunk", type=int, default=5000, help="Filas por bulk_create (default 5000).")
+        parser.add_argument("--limpiar", action="store_true",
+                            help="Borra antes las reservas sembradas de esas sucursales.")
+
+    def handle(self, *args, **opts):
+        dias = opts["dias"]
+        if dias <= 0 or opts["chunk"] <= 0:
+            raise CommandError("--dias y --chunk deben ser mayores a 0.")
+        if not 0 < opts["ocupacion"] <= 1:
+            raise CommandError("--ocupacion debe estar en (0, 1].")
+
+        if opts["desde"]:
+            try:
+                desde = date.fromisoformat(opts["desde"])
+            except ValueError:
+                raise CommandError("--desde debe ser YYYY-MM-DD.")
+        else:
+            desde = timezone.localdate() - timedelta(days=dias // 2)
+
+        if opts["sucursal_id"]:
+            sucursales = list(Sucursal.objects.filter(pk__in=opts["sucursal_id"]).order_by("id"))
+            if len(sucursales) != len(set(opts["sucursal_id"])):
+                raise CommandError("Alguna --sucursal-id no existe.")
+        else:
+            sucursales = seeding.asegurar_sucursales(opts["sucursales"], opts["mesas"], opts["timezone"])
+
+        if opts["limpiar"]:
+            borradas = seeding.limpiar_sembradas([s.id for s in sucursales])
+            self.stdout.write(f"Borradas {borradas} filas sembradas previamente.")
+
+        cliente_ids = seeding.asegurar_clientes(max(1, opts["clientes"]))
+
+        self.stdout.write(
+            f"Sembrando {len(sucursales)} sucursales × {dias} días desde {desde} "
+            f"(seed={opts['seed']}, ocupación={opts['ocupacion']}, chunk={opts['chunk']})"
+        )
+        t0 = time.monotonic()
+
+        def progreso(total):
+            dt = max(time.monotonic() - t0, 1e-6)
+            self.stdout.write(f"  → {total} reservas ({total / dt:,.0f} filas/s)")
+
+        res = seeding.sembrar(
+            sucursales, desde, dias, cliente_ids,
+            seed=opts["seed"], ocupacion=opts["ocupacion"], chunk=opts["chunk"], on_chunk=progreso,
+        )
+
+        dt = time.monotonic() - t0
+        estados = ", ".join(f"{k}={v}" for k, v in sorted(res.por_estado.items()))
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {res.reservas} reservas en {dt:.1f}s | mesas-día={res.mesas_dia} | {estados}"
+        ))
@@ -1,3 +1,5 @@
+import time
+
 from django.shortcuts import redirect
 from django.urls import reverse, resolve, NoReverseMatch
 
@@ -137,3 +139,45 @@ class RedirectNonStaffFromStaffURLs:
         if path.startswith('/staff/') and request.user.is_authenticated and not request.user.is_staff:
             return redirect(reverse('reservas:seleccionar_sucursal'))
         return self.get_response(request)
+
+
+class RequestMetricsMiddleware:
+    """
+    Mide cada request por nombre de URL: queries, tiempo en BD, hits/misses de caché
+    y tiempo total. Agrega en el ring buffer de reservas.request_metrics (ver /metricz/)
+    y loguea cuando una vista excede su budget de queries.
+    """
+    def __init__(self, get_response):
+        from django.core.exceptions import MiddlewareNotUsed
+        from django.conf import settings
+        from . import request_metrics
+
+        if not getattr(settings, "REQUEST_METRICS_ENABLED", True):
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.metrics = request_metrics
+        request_metrics.instrumentar_cache()
+
+    def __call__(self, request):
+        from contextlib import ExitStack
+        from django.db import connections
+
+        muestra, token = self.metrics.iniciar()
+        t0 = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for conn in connections.all():
+                    stack.enter_context(conn.execute_wrapper(self.metrics.db_wrapper))
+                response = self.get_response(request)
+        finally:
+            self.metrics.terminar(token)
+        wall_ms = (time.perf_counter() - t0) * 1000
+
+        match = getattr(request, "resolver_match", None)
+        if match is not None:
+            url_name = match.view_name
+            budget = self.metrics.budget_para(url_name, match.func)
+        else:
+            url_name, budget = "<sin_resolver>", None
+        self.metrics.registrar(url_name, muestra, wall_ms, response.status_code, budget)
+        return response
@@ -0,0 +1,121 @@
+from datetime import timedelta
+from zoneinfo import ZoneInfo
+
+import django.contrib.postgres.constraints
+import django.contrib.postgres.fields.ranges
+from django.conf import settings
+from django.db.backends.postgresql.psycopg_any import DateTimeTZRange
+from django.contrib.postgres.operations import BtreeGistExtension
+from django.db import migrations, models
+
+
+# Cada reserva recibe el mismo rango que calcula Reserva.rango_ocupacion(): fin guardado
+# o fin teórico con las reglas de duración (pico / fin de semana / grupo grande) en la TZ
+# de la sucursal, recortado por liberada_en. En este punto aún no hay horarios por
+# sucursal (0046), así que las reglas son las de settings. En lotes por id.
+LOTE = 2000
+
+
+def _tz(nombre):
+    try:
+        return ZoneInfo(nombre or settings.TIME_ZONE)
+    except Exception:
+        return ZoneInfo(settings.TIME_ZONE)
+
+
+def _rango(r, tz):
+    from reservas.calendario import calendario_global  # solo reglas de settings, sin BD
+
+    ini = r.inicio_utc or r.local_inicio or r.fecha
+    if ini is None:
+        return None
+    fin = r.fin_utc or r.local_fin
+    if fin is None:
+        base = r.local_inicio or r.fecha
+        fin = base + timedelta(minutes=calendario_global(tz).duracion(base, int(r.num_personas or 2)))
+    if r.liberada_en and r.liberada_en >= ini:
+        fin = min(fin, r.liberada_en)
+    return DateTimeTZRange(ini, max(fin, ini), "[)")
+
+
+def _rellenar(Reserva):
+    tzs = {}
+    ultimo = 0
+    while True:
+        lote = list(
+            Reserva.objects.filter(pk__gt=ultimo).order_by("pk")
+            .select_related("mesa__sucursal")
+            .only("id", "fecha", "inicio_utc", "local_inicio", "fin_utc", "local_fin",
+                  "num_personas", "liberada_en", "mesa__sucursal__timezone")[:LOTE]
+        )
+        if not lote:
+            return
+        for r in lote:
+            nombre = r.mesa.sucursal.timezone
+            tz = tzs.get(nombre) or tzs.setdefault(nombre, _tz(nombre))
+            r.ocupacion = _rango(r, tz)
+        Reserva.objects.bulk_update(lote, ["ocupacion"])
+        ultimo = lote[-1].pk
+
+
+def _descartar_traslapes(Reserva) -> int:
+    """
+    Reservas activas ya traslapadas (datos legados) no podrían convivir con la exclusión:
+    por mesa, en orden de inicio, se conserva cada reserva que no choca con las ya
+    conservadas; a las demás se les deja ocupacion NULL. Se compara solo contra las
+    conservadas: una reserva que solo chocaba con una descartada mantiene su rango.
+    """
+    descartar = []
+    mesa_actual, fin_conservado = None, None
+    filas = (Reserva.objects
+             .filter(estado__in=["PEND", "CONF"], ocupacion__isnull=False)
+             .order_by("mesa_id", "ocupacion", "id")
+             .values_list("id", "mesa_id", "ocupacion")
+             .iterator(chunk_size=LOTE))
+    for pk, mesa_id, rango in filas:
+        if rango.isempty:
+            continue
+        if mesa_id != mesa_actual:
+            mesa_actual, fin_conservado = mesa_id, None
+        if fin_conservado is not None and rango.lower < fin_conservado:
+            descartar.append(pk)
+        else:
+            fin_conservado = rango.upper if fin_conservado is None else max(fin_conservado, rango.upper)
+    for i in range(0, len(descartar), LOTE):
+        Reserva.objects.filter(pk__in=descartar[i:i + LOTE]).update(ocupacion=None)
+    return len(descartar)
+
+
+def backfill_ocupacion(apps, schema_editor):
+    Reserva = apps.get_model("reservas", "Reserva")
+    _rellenar(Reserva)
+    n = _descartar_traslapes(Reserva)
+    if n:
+        print(f"\n  ⚠ {n} reservas activas traslapadas quedaron sin 'ocupacion' (revisar).")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservas', '0044_ordenitem_cancelado_ordenitem_estado_and_more'),
+    ]
+
+    operations = [
+        BtreeGistExtension(),
+        migrations.AddField(
+            model_name='reserva',
+            name='ocupacion',
+            field=django.contrib.postgres.fields.ranges.DateTimeRangeField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_ocupacion, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='reserva',
+            constraint=django.contrib.postgres.constraints.ExclusionConstraint(
+                condition=models.Q(('estado__in', ['PEND', 'CONF'])),
+                expressions=[('mesa', '='), ('ocupacion', '&&')],
+                name='reserva_sin_traslape_por_mesa',
+                violation_error_code='reserva_traslape',
+                violation_error_message='La mesa ya está ocupada en ese horario.',
+            ),
+        ),
+    ]
@@ -0,0 +1,62 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservas', '0045_reserva_ocupacion_exclusion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HorarioSucursal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('paso_min', models.PositiveSmallIntegerField(blank=True, help_text='Minutos entre slots', null=True)),
+                ('duracion_normal_min', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('duracion_pico_min', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('anticipacion_min', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('anticipacion_pico_min', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('horas_pico', models.JSONField(blank=True, help_text='Ventanas pico en hora local, ej. [[7, 11], ["12:30", "15:00"]]. Vacío = HORAS_PICO.', null=True)),
+                ('fin_de_semana_pico', models.BooleanField(default=True, help_text='Sábado y domingo cuentan como pico')),
+                ('modificado', models.DateTimeField(auto_now=True)),
+                ('sucursal', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='horario', to='reservas.sucursal')),
+            ],
+            options={
+                'verbose_name': 'Horario de sucursal',
+                'verbose_name_plural': 'Horarios de sucursal',
+            },
+        ),
+        migrations.CreateModel(
+            name='HorarioDia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dia_semana', models.PositiveSmallIntegerField(choices=[(0, 'Lunes'), (1, 'Martes'), (2, 'Miércoles'), (3, 'Jueves'), (4, 'Viernes'), (5, 'Sábado'), (6, 'Domingo')])),
+                ('abre', models.TimeField(blank=True, null=True)),
+                ('cierra', models.TimeField(blank=True, null=True)),
+                ('cerrado', models.BooleanField(default=False)),
+                ('sucursal', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='horarios_dia', to='reservas.sucursal')),
+            ],
+            options={
+                'ordering': ['sucursal', 'dia_semana'],
+                'constraints': [models.UniqueConstraint(fields=('sucursal', 'dia_semana'), name='uniq_horario_dia_por_sucursal')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ExcepcionHorario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('cerrado', models.BooleanField(default=True)),
+                ('abre', models.TimeField(blank=True, null=True)),
+                ('cierra', models.TimeField(blank=True, null=True)),
+                ('motivo', models.CharField(blank=True, max_length=120)),
+                ('sucursal', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='excepciones_horario', to='reservas.sucursal')),
+            ],
+            options={
+                'ordering': ['sucursal', 'fecha'],
+                'constraints': [models.UniqueConstraint(fields=('sucursal', 'fecha'), name='uniq_excepcion_horario_por_fecha')],
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+from django.db import migrations
+
+# Folios en mayúsculas y sin espacios: Reserva.save() ya los escribe así y la búsqueda
+# (reservas/folios.py) usa igualdad exacta sobre el índice único en vez de folio__iexact.
+CANONIZAR = """
+UPDATE reservas_reserva
+   SET folio = UPPER(BTRIM(folio))
+ WHERE folio IS NOT NULL
+   AND folio <> UPPER(BTRIM(folio));
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservas', '0046_horario_sucursal'),
+    ]
+
+    operations = [
+        migrations.RunSQL(CANONIZAR, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,28 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservas', '0047_reserva_folio_canonico'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FolioDia',
+            fields=[
+                ('dia', models.DateField(primary_key=True, serialize=False)),
+                ('siguiente', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Consecutivo de folios',
+                'verbose_name_plural': 'Consecutivos de folios',
+            },
+        ),
+        # El folio lo asigna Reserva.save() desde FolioDia (reservas/folios.py)
+        migrations.AlterField(
+            model_name='reserva',
+            name='folio',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=20, unique=True),
+        ),
+    ]
@@ -0,0 +1,65 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Reserva.sucursal pasa a obligatoria y siempre igual a la sucursal de su mesa: los filtros
+# van por la FK directa (índice (sucursal, fecha)) en vez de OR/JOIN por mesa__sucursal.
+# El relleno va en lotes por id, cada uno en su transacción (atomic = False); si ya se corrió
+# `manage.py backfill_reserva_sucursal`, aquí no queda nada que actualizar.
+LOTE = 5000
+
+RELLENO_SQL = """
+UPDATE reservas_reserva r
+   SET sucursal_id = m.sucursal_id
+  FROM reservas_mesa m
+ WHERE r.id >= %s AND r.id < %s
+   AND m.id = r.mesa_id
+   AND r.sucursal_id IS DISTINCT FROM m.sucursal_id
+"""
+
+# La BD mantiene la regla: (mesa_id, sucursal_id) debe existir en reservas_mesa. Si una
+# mesa cambia de sucursal, sus reservas la siguen (ON UPDATE CASCADE).
+FK_COMPUESTA_SQL = """
+ALTER TABLE reservas_reserva
+  ADD CONSTRAINT reserva_mesa_de_su_sucursal
+  FOREIGN KEY (mesa_id, sucursal_id)
+  REFERENCES reservas_mesa (id, sucursal_id)
+  ON UPDATE CASCADE
+  DEFERRABLE INITIALLY DEFERRED;
+"""
+
+
+def rellenar_sucursal(apps, schema_editor):
+    conn = schema_editor.connection
+    with conn.cursor() as cur:
+        cur.execute("SELECT min(id), max(id) FROM reservas_reserva")
+        minimo, maximo = cur.fetchone()
+    if minimo is None:
+        return
+    for desde in range(minimo, maximo + 1, LOTE):
+        with conn.cursor() as cur:
+            cur.execute(RELLENO_SQL, [desde, desde + LOTE])
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('reservas', '0048_foliodia'),
+    ]
+
+    operations = [
+        migrations.RunPython(rellenar_sucursal, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='reserva',
+            name='sucursal',
+            field=models.ForeignKey(blank=True, on_delete=django.db.models.deletion.CASCADE, related_name='reservas', to='reservas.sucursal'),
+        ),
+        migrations.AddConstraint(
+            model_name='mesa',
+            constraint=models.UniqueConstraint(fields=('id', 'sucursal'), name='mesa_id_sucursal_uniq'),
+        ),
+        migrations.RunSQL(
+            FK_COMPUESTA_SQL,
+            "ALTER TABLE reservas_reserva DROP CONSTRAINT IF EXISTS reserva_mesa_de_su_sucursal;",
+        ),
+    ]
@@ -0,0 +1,33 @@
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+from django.db.models import Q
+
+# Índices parciales de reservas activas (PEND/CONF): las consultas calientes (conflictos,
+# ocupación, piso, check-in, barrido de PEND vencidas) ya no recorren canceladas ni no-shows.
+# CONCURRENTLY no bloquea escrituras en tablas grandes; requiere atomic = False.
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ("reservas", "0049_reserva_sucursal_obligatoria"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="reserva",
+            index=models.Index(condition=Q(estado__in=["PEND", "CONF"]), fields=["mesa", "fecha"],
+                               name="reserva_activa_mesa_fecha"),
+        ),
+        AddIndexConcurrently(
+            model_name="reserva",
+            index=models.Index(condition=Q(estado__in=["PEND", "CONF"]), fields=["sucursal", "fecha"],
+                               name="reserva_activa_suc_fecha"),
+        ),
+        AddIndexConcurrently(
+            model_name="reserva",
+            index=models.Index(condition=Q(estado__in=["PEND", "CONF"]), fields=["estado", "fecha"],
+                               name="reserva_activa_estado_fecha"),
+        ),
+    ]
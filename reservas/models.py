@@ -1,34 +1,31 @@
 # reservas/models.py
 from __future__ import annotations
-import secrets
 from datetime import datetime, timedelta
 from typing import Optional
 from zoneinfo import ZoneInfo
 
 from django.apps import apps
 from django.conf import settings
+from django.contrib.postgres.constraints import ExclusionConstraint
+from django.contrib.postgres.fields import DateTimeRangeField, RangeOperators
 from django.core.exceptions import ValidationError
 from django.core.validators import RegexValidator
 from django.db import models
+from django.db.backends.postgresql.psycopg_any import DateTimeTZRange
 from django.db.models import Avg, Count, Q
-from django.db.models.signals import post_delete, post_save, pre_save
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
 from django.dispatch import receiver
 from django.utils import timezone
 from django.utils.text import slugify
 from django.utils.timezone import is_naive
 from django_countries.fields import CountryField  # (puedes quitarlo si no lo usas)
 
+from .folios import generar_folio, normalizar_folio  # generar_folio: lo citan migraciones viejas
+
 # ==============================================================
 # Utilidades generales
 # ==============================================================
 
-def generar_folio() -> str:
-    """Folio: R-YYYYMMDD-XXXXXX (ej. R-20250916-A3F91C)"""
-    tz = timezone.get_current_timezone()
-    today_str = timezone.now().astimezone(tz).strftime("%Y%m%d")
-    suffix = secrets.token_hex(3).upper()  # 6 chars hex
-    return f"R-{today_str}-{suffix}"
-
 cp_mx_validator = RegexValidator(
     regex=r"^\d{5}$",
     message="El código postal debe tener 5 dígitos.",
@@ -42,39 +39,10 @@ User = settings.AUTH_USER_MODEL
 
 class SucursalQuerySet(models.QuerySet):
     def for_user(self, user):
-        if not getattr(user, "is_authenticated", False):
-            return self.none()
-
-        if getattr(user, "is_superuser", False) or user.has_perm("reservas.manage_branches"):
-            return self
-
-        filtros = Q(pk__in=[])
-        pais_ids = set()
-
-        perfil = getattr(user, "perfiladmin", None)
-        if perfil and hasattr(perfil, "paises"):
-            pais_ids.update(perfil.paises.values_list("id", flat=True))
-
-        scope_model = apps.get_model("reservas", "CountryAdminScope")
-        if scope_model is not None:
-            scope_qs = scope_model.objects.filter(user=user)
-            scope_fields = {f.name for f in scope_model._meta.get_fields()}
-            if "activo" in scope_fields:
-                scope_qs = scope_qs.filter(activo=True)
-            elif "is_active" in scope_fields:
-                scope_qs = scope_qs.filter(is_active=True)
-            pais_ids.update(scope_qs.values_list("pais_id", flat=True))
-
-        if pais_ids:
-            filtros |= Q(pais_id__in=pais_ids)
-
-        suc_id = getattr(perfil, "sucursal_asignada_id", None) if perfil else None
-        if suc_id:
-            filtros |= Q(pk=suc_id)
-
-        filtros |= Q(administradores=user)
-
-        return self.filter(filtros).distinct()
+        # superuser / manage_branches / M2M / sucursal asignada / países (reservas/visibilidad.py)
+        from .visibilidad import sucursal_ids_visibles  # import local evita ciclos
+        ids = sucursal_ids_visibles(user)
+        return self if ids is None else self.filter(pk__in=ids)
 
     def visibles_para(self, user):
         return self.for_user(user)
@@ -83,36 +51,30 @@ class SucursalQuerySet(models.QuerySet):
 class OwnedBySucursalQuerySet(models.QuerySet):
     """Para modelos con FK directo 'sucursal' (Mesa, BloqueoMesa, Menú, Review)."""
     def visible_for(self, user):
-        if not getattr(user, "is_authenticated", False):
-            return self.none()
-        if getattr(user, "is_superuser", False) or user.has_perm("reservas.manage_branches"):
-            return self
-        perfil = getattr(user, "perfiladmin", None)
-        if perfil and perfil.sucursal_asignada_id:
-            return self.filter(sucursal_id=perfil.sucursal_asignada_id)
-        return self.filter(sucursal__administradores=user).distinct()
+        from .visibilidad import sucursal_ids_visibles  # import local evita ciclos
+        ids = sucursal_ids_visibles(user)
+        return self if ids is None else self.filter(sucursal_id__in=ids)
 
 
 class ReservaQuerySet(models.QuerySet):
-    """Para Reserva (si filtras por mesa__sucursal o por el campo sucursal directo)."""
+    """Para Reserva: filtra por la FK directa sucursal (índice (sucursal, fecha))."""
+    def activas(self):
+        """PEND/CONF: con mesa o sucursal + fecha usa los índices parciales reserva_activa_*."""
+        return self.filter(estado__in=self.model.ESTADOS_ACTIVOS)
+
     def visible_for(self, user):
-        if not getattr(user, "is_authenticated", False):
-            return self.none()
-        if getattr(user, "is_superuser", False) or user.has_perm("reservas.manage_branches"):
-            return self
-        perfil = getattr(user, "perfiladmin", None)
-        if perfil and perfil.sucursal_asignada_id:
-            return self.filter(sucursal_id=perfil.sucursal_asignada_id)
-        return self.filter(mesa__sucursal__administradores=user).distinct()
+        from .visibilidad import sucursal_ids_visibles  # import local evita ciclos
+        ids = sucursal_ids_visibles(user)
+        return self if ids is None else self.filter(sucursal_id__in=ids)
 
 # ==============================================================
 # Helpers de duración (fallback)
 # ==============================================================
 
 try:
-    from .utils import booking_total_minutes  # (dt: datetime, party: int) -> int
+    from .utils import booking_total_minutes  # (dt: datetime, party: int, sucursal=None) -> int
 except Exception:
-    def booking_total_minutes(dt: datetime, party: int) -> int:
+    def booking_total_minutes(dt: datetime, party: int, sucursal=None) -> int:
         RESERVA_DURACION_MIN_NORM = int(getattr(settings, "RESERVA_DURACION_MIN_NORM", 90))
         RESERVA_DURACION_MIN_PICO = int(getattr(settings, "RESERVA_DURACION_MIN_PICO", 105))
         HORAS_PICO = list(getattr(settings, "HORAS_PICO", [(12, 15), (18, 21)]))
@@ -229,6 +191,101 @@ class SucursalFoto(models.Model):
         return f"{self.sucursal} · {self.alt or self.imagen.name}"
 
 
+# ==============================================================
+# Horario por sucursal (compilado en reservas.calendario)
+# ==============================================================
+
+class HorarioSucursal(models.Model):
+    """Reglas de agenda de la sucursal; los campos vacíos heredan de settings."""
+    sucursal = models.OneToOneField(Sucursal, on_delete=models.CASCADE, related_name="horario")
+    paso_min = models.PositiveSmallIntegerField(null=True, blank=True, help_text="Minutos entre slots")
+    duracion_normal_min = models.PositiveSmallIntegerField(null=True, blank=True)
+    duracion_pico_min = models.PositiveSmallIntegerField(null=True, blank=True)
+    anticipacion_min = models.PositiveSmallIntegerField(null=True, blank=True)
+    anticipacion_pico_min = models.PositiveSmallIntegerField(null=True, blank=True)
+    horas_pico = models.JSONField(
+        null=True, blank=True,
+        help_text='Ventanas pico en hora local, ej. [[7, 11], ["12:30", "15:00"]]. Vacío = HORAS_PICO.',
+    )
+    fin_de_semana_pico = models.BooleanField(default=True, help_text="Sábado y domingo cuentan como pico")
+    modificado = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Horario de sucursal"
+        verbose_name_plural = "Horarios de sucursal"
+
+    def __str__(self):
+        return f"Horario · {self.sucursal}"
+
+    def clean(self):
+        from .calendario import ventanas_en_minutos  # import local evita ciclos
+        if self.horas_pico is not None:
+            try:
+                ventanas_en_minutos(self.horas_pico)
+            except (TypeError, ValueError):
+                raise ValidationError({"horas_pico": "Usa pares [inicio, fin] con inicio < fin, ej. [[12, 15]]."})
+        if self.paso_min == 0:
+            raise ValidationError({"paso_min": "El paso debe ser mayor a 0."})
+
+
+class HorarioDia(models.Model):
+    DIAS_SEMANA = [
+        (0, "Lunes"), (1, "Martes"), (2, "Miércoles"), (3, "Jueves"),
+        (4, "Viernes"), (5, "Sábado"), (6, "Domingo"),
+    ]
+
+    sucursal = models.ForeignKey(Sucursal, on_delete=models.CASCADE, related_name="horarios_dia")
+    dia_semana = models.PositiveSmallIntegerField(choices=DIAS_SEMANA)
+    abre = models.TimeField(null=True, blank=True)
+    cierra = models.TimeField(null=True, blank=True)
+    cerrado = models.BooleanField(default=False)
+
+    class Meta:
+        ordering = ["sucursal", "dia_semana"]
+        constraints = [
+            models.UniqueConstraint(fields=["sucursal", "dia_semana"], name="uniq_horario_dia_por_sucursal"),
+        ]
+
+    def __str__(self):
+        if self.cerrado:
+            return f"{self.get_dia_semana_display()}: cerrado"
+        return f"{self.get_dia_semana_display()}: {self.abre:%H:%M}–{self.cierra:%H:%M}"
+
+    def clean(self):
+        _validar_abre_cierra(self)
+
+
+class ExcepcionHorario(models.Model):
+    """Fecha puntual cerrada o con horario especial (feriados, eventos)."""
+    sucursal = models.ForeignKey(Sucursal, on_delete=models.CASCADE, related_name="excepciones_horario")
+    fecha = models.DateField()
+    cerrado = models.BooleanField(default=True)
+    abre = models.TimeField(null=True, blank=True)
+    cierra = models.TimeField(null=True, blank=True)
+    motivo = models.CharField(max_length=120, blank=True)
+
+    class Meta:
+        ordering = ["sucursal", "fecha"]
+        constraints = [
+            models.UniqueConstraint(fields=["sucursal", "fecha"], name="uniq_excepcion_horario_por_fecha"),
+        ]
+
+    def __str__(self):
+        return f"{self.sucursal} · {self.fecha} ({'cerrado' if self.cerrado else 'horario especial'})"
+
+    def clean(self):
+        _validar_abre_cierra(self)
+
+
+def _validar_abre_cierra(obj):
+    if obj.cerrado:
+        return
+    if obj.abre is None or obj.cierra is None:
+        raise ValidationError("Indica hora de apertura y de cierre, o marca 'cerrado'.")
+    if obj.cierra <= obj.abre:
+        raise ValidationError({"cierra": "La hora de cierre debe ser posterior a la de apertura."})
+
+
 class Mesa(models.Model):
     ESTADOS = [
         ("disponible", "Disponible"),
@@ -255,6 +312,8 @@ class Mesa(models.Model):
     class Meta:
         constraints = [
             models.UniqueConstraint(fields=["sucursal", "numero"], name="uniq_mesa_por_sucursal"),
+            # Destino de la FK compuesta reserva (mesa, sucursal) → mesa (id, sucursal) (0049)
+            models.UniqueConstraint(fields=["id", "sucursal"], name="mesa_id_sucursal_uniq"),
         ]
         ordering = ["sucursal", "numero"]
 
@@ -406,10 +465,49 @@ def sucursal_autoslug(sender, instance: "Sucursal", **kwargs):
             instance.slug = _unique_slugify(instance, instance.nombre)
 
 
+@receiver([post_save, post_delete], sender=HorarioSucursal)
+@receiver([post_save, post_delete], sender=HorarioDia)
+@receiver([post_save, post_delete], sender=ExcepcionHorario)
+def _horario_cambiado(sender, instance, **kwargs):
+    from .calendario import invalidar_calendario  # import local evita ciclos
+    invalidar_calendario(instance.sucursal_id)
+
+
+@receiver(post_save, sender=Sucursal)
+def _sucursal_tz_cambiada(sender, instance, update_fields=None, **kwargs):
+    # rating/reviews se guardan con update_fields: solo importa si pudo cambiar la TZ
+    if update_fields is not None and "timezone" not in update_fields:
+        return
+    from .calendario import invalidar_calendario  # import local evita ciclos
+    invalidar_calendario(instance.pk)
+
+
+@receiver(post_save, sender=Sucursal)
+def _sucursal_plano_cambiado(sender, instance, update_fields=None, **kwargs):
+    # El plano solo depende del punto de recepción (rating/reviews no lo tocan)
+    if update_fields is not None and not ({"recepcion_x", "recepcion_y"} & set(update_fields)):
+        return
+    from .plano import invalidar_plano  # import local evita ciclos
+    invalidar_plano(instance.pk)
+
+
 # ==============================================================
 # RESERVAS (UTC + locales)
 # ==============================================================
 
+class FolioDia(models.Model):
+    """Consecutivo de folios por día de emisión; se reserva por bloques (reservas/folios.py)."""
+    dia = models.DateField(primary_key=True)
+    siguiente = models.BigIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Consecutivo de folios"
+        verbose_name_plural = "Consecutivos de folios"
+
+    def __str__(self):
+        return f"{self.dia:%Y-%m-%d}: {self.siguiente}"
+
+
 class Reserva(models.Model):
     PEND = "PEND"
     CONF = "CONF"
@@ -425,8 +523,10 @@ class Reserva(models.Model):
     cliente = models.ForeignKey("Cliente", on_delete=models.CASCADE)
     mesa = models.ForeignKey("Mesa", on_delete=models.CASCADE)
 
+    # Siempre la sucursal de la mesa (save() + FK compuesta en la BD, migración 0049):
+    # los filtros van por aquí, no por mesa__sucursal
     sucursal = models.ForeignKey(
-        "Sucursal", on_delete=models.CASCADE, related_name="reservas", null=True, blank=True
+        "Sucursal", on_delete=models.CASCADE, related_name="reservas", blank=True
     )
 
     # LEGADO: fecha local
@@ -442,7 +542,7 @@ class Reserva(models.Model):
     num_personas = models.PositiveSmallIntegerField(default=1)
     estado = models.CharField(max_length=4, choices=ESTADOS, default=PEND)
 
-    folio = models.CharField(max_length=20, unique=True, default=generar_folio, editable=False, db_index=True)
+    folio = models.CharField(max_length=20, unique=True, default="", editable=False, db_index=True)
 
     creado = models.DateTimeField(auto_now_add=True)
     modificado = models.DateTimeField(auto_now=True)
@@ -457,8 +557,17 @@ class Reserva(models.Model):
     telefono_contacto = models.CharField(max_length=30, blank=True, default="")
     liberada_en = models.DateTimeField(null=True, blank=True, db_index=True)
 
+    # Ocupación materializada [inicio, fin efectivo) — la calcula save(); la usa la exclusión
+    ocupacion = DateTimeRangeField(null=True, blank=True, editable=False)
+
     objects = ReservaQuerySet.as_manager()
 
+    ESTADOS_ACTIVOS = (PEND, CONF)
+    CONSTRAINT_TRASLAPE = "reserva_sin_traslape_por_mesa"
+    # Campos de los que depende 'ocupacion' (para save(update_fields=...))
+    CAMPOS_OCUPACION = {"fecha", "inicio_utc", "fin_utc", "local_inicio", "local_fin",
+                        "num_personas", "liberada_en"}
+
     class Meta:
         ordering = ["-fecha", "-creado"]
         indexes = [
@@ -468,11 +577,30 @@ class Reserva(models.Model):
             models.Index(fields=["sucursal", "fecha"]),
             models.Index(fields=["inicio_utc"]),
             models.Index(fields=["local_service_date"]),
+            # Parciales: solo reservas activas (el historial CANC/NOSH no entra). Las usan las
+            # consultas con ReservaQuerySet.activas(); el predicado debe implicar la condición.
+            models.Index(fields=["mesa", "fecha"], name="reserva_activa_mesa_fecha",
+                         condition=Q(estado__in=["PEND", "CONF"])),
+            models.Index(fields=["sucursal", "fecha"], name="reserva_activa_suc_fecha",
+                         condition=Q(estado__in=["PEND", "CONF"])),
+            # Barrido de PEND vencidas (estado="PEND", fecha <= límite)
+            models.Index(fields=["estado", "fecha"], name="reserva_activa_estado_fecha",
+                         condition=Q(estado__in=["PEND", "CONF"])),
+        ]
+        constraints = [
+            # Requiere btree_gist (migración 0045). Solo reservas activas ocupan la mesa.
+            ExclusionConstraint(
+                name="reserva_sin_traslape_por_mesa",
+                expressions=[("mesa", RangeOperators.EQUAL), ("ocupacion", RangeOperators.OVERLAPS)],
+                condition=Q(estado__in=["PEND", "CONF"]),
+                violation_error_code="reserva_traslape",
+                violation_error_message="La mesa ya está ocupada en ese horario.",
+            ),
         ]
 
     def __str__(self):
         try:
-            suc = self.sucursal.nombre if self.sucursal_id else self.mesa.sucursal.nombre
+            suc = self.sucursal.nombre
             dt_show = self.local_inicio or self.fecha
             return f"{self.folio} - Mesa {self.mesa.numero} ({suc}) - {dt_show:%Y-%m-%d %H:%M}"
         except Exception:
@@ -491,7 +619,7 @@ class Reserva(models.Model):
     def fin_teorico(self, party: Optional[int] = None):
         p = int(party or getattr(self, "num_personas", 2) or 2)
         base_dt = self.local_inicio or self.fecha
-        mins = int(booking_total_minutes(base_dt, p))
+        mins = int(booking_total_minutes(base_dt, p, sucursal=self.sucursal_id))
         return base_dt + timedelta(minutes=mins)
 
     def fin_efectivo(self, party: Optional[int] = None):
@@ -524,15 +652,66 @@ class Reserva(models.Model):
         self.local_service_date = li.date()
         self.fecha = li
 
+    def rango_ocupacion(self):
+        """[inicio, fin efectivo) de la mesa; respeta liberada_en igual que fin_efectivo()."""
+        ini = self.inicio_utc or self.local_inicio or self.fecha
+        if ini is None:
+            return None
+        fin = self.fin_utc or self.local_fin or self.fin_teorico()
+        lib = self.liberada_en
+        if lib and lib >= ini:
+            fin = min(fin, lib)
+        return DateTimeTZRange(ini, max(fin, ini), "[)")
+
     def save(self, *args, **kwargs):
         validate = kwargs.pop("validate", True)
-        if not self.sucursal_id and self.mesa_id:
+        # sucursal = la de la mesa (nueva, o la mesa cargada cambió de sucursal al mover)
+        if self.mesa_id and (not self.sucursal_id or (
+                type(self).mesa.is_cached(self) and self.mesa.sucursal_id != self.sucursal_id)):
             self.sucursal_id = self.mesa.sucursal_id
+            if kwargs.get("update_fields") is not None:
+                kwargs["update_fields"] = set(kwargs["update_fields"]) | {"sucursal"}
+        if "folio" not in self.get_deferred_fields():
+            # Folio canónico (mayúsculas): la búsqueda es igualdad exacta por el índice único.
+            # Las nuevas lo toman aquí del consecutivo, no al instanciar: Reserva() no toca BD.
+            self.folio = normalizar_folio(self.folio) or generar_folio()
+        self.ocupacion = self.rango_ocupacion()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and self.CAMPOS_OCUPACION.intersection(update_fields):
+            kwargs["update_fields"] = set(update_fields) | {"ocupacion"}
         if validate:
-            self.full_clean()
+            # La exclusión de traslapes la hace cumplir la BD (ver utils.guardar_reserva_sin_traslape)
+            self.full_clean(validate_constraints=False)
         return super().save(*args, **kwargs)
 
 
+@receiver([post_save, post_delete], sender=Reserva)
+def _reserva_ocupacion_cambiada(sender, instance, update_fields=None, **kwargs):
+    # check-in, contacto, etc. no mueven la ocupación de la mesa
+    if update_fields is not None and not ({"estado", "mesa", "ocupacion"} & set(update_fields)):
+        return
+    from .ocupacion import invalidar_ocupacion  # import local evita ciclos
+    invalidar_ocupacion(instance.sucursal_id)
+
+
+@receiver([post_save, post_delete], sender=Reserva)
+def _reserva_tarjeta_cambiada(sender, instance, **kwargs):
+    from .tarjeta import invalidar_tarjeta  # import local evita ciclos
+    invalidar_tarjeta(instance.folio)
+
+
+@receiver([post_save, post_delete], sender=BloqueoMesa)
+def _bloqueo_cambiado(sender, instance, **kwargs):
+    from .ocupacion import invalidar_ocupacion  # import local evita ciclos
+    invalidar_ocupacion(instance.sucursal_id)
+
+
+@receiver([post_save, post_delete], sender=Mesa)
+def _mesa_cambiada(sender, instance, **kwargs):
+    from .plano import invalidar_plano  # import local evita ciclos
+    invalidar_plano(instance.sucursal_id)
+
+
 class CountryAdminScope(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="country_scopes")
     pais  = models.ForeignKey("Pais", on_delete=models.CASCADE, related_name="country_admins")
@@ -545,3 +724,39 @@ class CountryAdminScope(models.Model):
 
     def __str__(self):
         return f"{self.user} @ {self.pais}"
+
+
+# ==============================================================
+# Visibilidad de sucursales en caché (reservas/visibilidad.py)
+# ==============================================================
+
+@receiver(post_save, sender=Sucursal)
+def _sucursal_visibilidad(sender, instance, created=False, update_fields=None, **kwargs):
+    # Alta o cambio de país: mueve lo que ven los admins de país
+    if not created and update_fields is not None and "pais" not in update_fields:
+        return
+    from .visibilidad import invalidar_visibles  # import local evita ciclos
+    invalidar_visibles()
+
+
+@receiver(post_delete, sender=Sucursal)
+@receiver([post_save, post_delete], sender=PerfilAdmin)
+@receiver([post_save, post_delete], sender=CountryAdminScope)
+def _alcance_admin_cambiado(sender, **kwargs):
+    from .visibilidad import invalidar_visibles  # import local evita ciclos
+    invalidar_visibles()
+
+
+@receiver(m2m_changed)
+def _m2m_visibilidad(sender, action, **kwargs):
+    # administradores de Sucursal, y permisos/grupos (manage_branches = ve todas)
+    if not action.startswith("post_"):
+        return
+    from django.contrib.auth import get_user_model
+    from django.contrib.auth.models import Group
+
+    U = get_user_model()
+    if sender in (Sucursal.administradores.through, U.groups.through,
+                  U.user_permissions.through, Group.permissions.through):
+        from .visibilidad import invalidar_visibles  # import local evita ciclos
+        invalidar_visibles()
@@ -0,0 +1,276 @@
+# reservas/ocupacion.py
+"""
+Mapa de ocupación por mesa y día de servicio.
+
+Para cada (sucursal, día local) se guarda en el caché compartido un entero por mesa que
+funciona como bitset: el bit i es la cubeta [00:00 + i·OCUPACION_CUBETA_MIN) del día en
+la TZ de la sucursal. El mapa cubre de 00:00 a 30:00 (día + 6 h) para que los slots que
+cruzan medianoche se resuelvan con un solo mapa.
+
+  - "¿la mesa está libre en [t, t+d)?" → (bits_mesa | bits_sucursal) & máscara == 0
+  - disponibilidad de la sucursal       → OR/AND de esos enteros
+
+Si la consulta está alineada a la cubeta (slots de 15 min, duraciones en múltiplos de 5)
+la respuesta del bitset es exacta; si no, un choque de bits se confirma contra los
+intervalos guardados en el mismo mapa.
+
+Cada escritura de Reserva/BloqueoMesa sube la versión de la sucursal (señales en
+models.py); un mapa guardado con otra versión se reconstruye en la siguiente lectura con
+utils.ocupacion_sucursal (2 queries por sucursal-día, o por tramo de días con
+ocupacion_rango). Los update()/bulk_create que no
+disparan señales deben llamar invalidar_ocupacion(). La exclusión de BD sigue siendo la
+fuente de verdad al guardar; esto solo acelera las consultas de disponibilidad.
+"""
+from __future__ import annotations
+
+import time as _time
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .calendario import MINUTOS_DIA, calendario_sucursal
+
+VENTANA_MIN = MINUTOS_DIA + 6 * 60  # 00:00 → 06:00 del día siguiente
+
+
+def _cubeta_min() -> int:
+    return max(1, int(getattr(settings, "OCUPACION_CUBETA_MIN", 5)))
+
+
+def _version_key(sucursal_id) -> str:
+    return f"ocupacion:v:{sucursal_id}"
+
+
+def _mapa_key(sucursal_id, dia, cubeta) -> str:
+    return f"ocupacion:{sucursal_id}:{dia.isoformat()}:{cubeta}"
+
+
+class OcupacionDia:
+    """
+    Bitsets de un día de servicio de la sucursal (inmutable).
+    mesas: {mesa_id: int}; general: bits de bloqueos de toda la sucursal.
+    intervalos: {mesa_id | None: ((ini_min, fin_min), ...)} en minutos desde la medianoche
+    local, para confirmar consultas no alineadas a la cubeta.
+    """
+
+    __slots__ = ("sucursal_id", "dia", "tz", "base", "cubeta", "mesas", "general", "intervalos")
+
+    def __init__(self, *, sucursal_id, dia, tz, cubeta, mesas, general, intervalos):
+        self.sucursal_id = sucursal_id
+        self.dia = dia
+        self.tz = tz
+        self.base = datetime(dia.year, dia.month, dia.day)  # medianoche local (naive, hora de pared)
+        self.cubeta = cubeta
+        self.mesas = mesas
+        self.general = general
+        self.intervalos = intervalos
+
+    def __repr__(self):
+        return f"<OcupacionDia sucursal={self.sucursal_id} dia={self.dia} mesas={len(self.mesas)}>"
+
+    # ------------------------------------------------------------------ cubetas
+    def minuto(self, dt) -> float:
+        """Minutos de pared desde la medianoche local del día (puede ser <0 o >VENTANA_MIN)."""
+        return (dt.astimezone(self.tz).replace(tzinfo=None) - self.base).total_seconds() / 60
+
+    def mascara(self, ini_min: float, fin_min: float) -> int:
+        """Bits de las cubetas que toca [ini_min, fin_min), recortado a la ventana."""
+        c = self.cubeta
+        lo = max(0, int(ini_min // c))
+        hi = min(VENTANA_MIN // c, int(-(-fin_min // c)))
+        if hi <= lo:
+            return 0
+        return ((1 << (hi - lo)) - 1) << lo
+
+    def bits(self, mesa_id) -> int:
+        return self.mesas.get(mesa_id, 0) | self.general
+
+    # ------------------------------------------------------------------ consultas
+    def libre(self, mesa_id, inicio_dt, fin_dt) -> bool:
+        a, b = self.minuto(inicio_dt), self.minuto(fin_dt)
+        if a < 0 or b > VENTANA_MIN:
+            return self._libre_bd(mesa_id, inicio_dt, fin_dt)
+        if not (self.bits(mesa_id) & self.mascara(a, b)):
+            return True
+        if a % self.cubeta == 0 and b % self.cubeta == 0:
+            return False  # alineada: el bitset es exacto
+        for llave in (mesa_id, None):
+            for ini, fin in self.intervalos.get(llave, ()):
+                if ini < b and fin > a:
+                    return False
+        return True
+
+    def mesas_libres(self, mesa_ids: Iterable[int], inicio_dt, fin_dt) -> List[int]:
+        """Ids (en el orden recibido) libres en [inicio_dt, fin_dt)."""
+        a, b = self.minuto(inicio_dt), self.minuto(fin_dt)
+        if a < 0 or b > VENTANA_MIN or a % self.cubeta or b % self.cubeta:
+            return [mid for mid in mesa_ids if self.libre(mid, inicio_dt, fin_dt)]
+        m = self.mascara(a, b)
+        if self.general & m:
+            return []
+        mesas = self.mesas
+        return [mid for mid in mesa_ids if not (mesas.get(mid, 0) & m)]
+
+    def alguna_libre(self, mesa_ids: Iterable[int], inicio_dt, fin_dt) -> bool:
+        """True si al menos una de las mesas está libre (corta en la primera)."""
+        a, b = self.minuto(inicio_dt), self.minuto(fin_dt)
+        if a < 0 or b > VENTANA_MIN or a % self.cubeta or b % self.cubeta:
+            return any(self.libre(mid, inicio_dt, fin_dt) for mid in mesa_ids)
+        m = self.mascara(a, b)
+        if self.general & m:
+            return False
+        mesas = self.mesas
+        return any(not (mesas.get(mid, 0) & m) for mid in mesa_ids)
+
+    def _libre_bd(self, mesa_id, inicio_dt, fin_dt) -> bool:
+        # Fuera de la ventana del mapa (reservas de más de 6 h pasada la medianoche): a BD
+        from .utils import _mesa_libre, ocupacion_sucursal  # import local evita ciclos
+        ocupado = ocupacion_sucursal(self.sucursal_id, inicio_dt, fin_dt, mesa_ids=[mesa_id])
+        return _mesa_libre(ocupado, mesa_id, inicio_dt, fin_dt)
+
+
+def _ventana(dia, tz):
+    base = datetime(dia.year, dia.month, dia.day)
+    return base.replace(tzinfo=tz), (base + timedelta(minutes=VENTANA_MIN)).replace(tzinfo=tz)
+
+
+def _datos_dia(sucursal_id, dia, tz, cubeta, ocupado) -> dict:
+    """Bitsets del día a partir de {mesa_id | None: [(ini, fin), ...]} (de ocupacion_sucursal)."""
+    vacio = OcupacionDia(sucursal_id=sucursal_id, dia=dia, tz=tz, cubeta=cubeta,
+                         mesas={}, general=0, intervalos={})
+    mesas: Dict[Optional[int], int] = {}
+    intervalos: Dict[Optional[int], List[Tuple[float, float]]] = {}
+    for mesa_id, rangos in ocupado.items():
+        bits = 0
+        for ini, fin in rangos:
+            a, b = vacio.minuto(ini), vacio.minuto(fin)
+            if b <= 0 or a >= VENTANA_MIN:
+                continue  # el rango pedido abarcaba más días
+            bits |= vacio.mascara(a, b)
+            intervalos.setdefault(mesa_id, []).append((a, b))
+        if bits:
+            mesas[mesa_id] = bits
+    general = mesas.pop(None, 0)
+    return {
+        "mesas": mesas,
+        "general": general,
+        "intervalos": {k: tuple(v) for k, v in intervalos.items()},
+    }
+
+
+def _envolver(sid, dia, cal, cubeta, datos) -> OcupacionDia:
+    return OcupacionDia(sucursal_id=sid, dia=dia, tz=cal.tz, cubeta=cubeta,
+                        mesas=datos["mesas"], general=datos["general"],
+                        intervalos=datos["intervalos"])
+
+
+def ocupacion_dias(pares) -> Dict[Tuple[int, object], OcupacionDia]:
+    """
+    Mapas para varios (sucursal_id, dia) a la vez, en una sola pasada: un get_many de caché
+    (versiones + mapas) y, para los que falten o estén desfasados, una sola lectura de
+    utils.ocupacion_sucursales (2 queries) que cubre todas esas sucursales y días.
+    """
+    from .calendario import calendarios_sucursales
+    from .utils import ocupacion_sucursales  # import local evita ciclos
+
+    pares = [(getattr(s, "pk", s), d) for s, d in pares]
+    if not pares:
+        return {}
+    sids = list(dict.fromkeys(sid for sid, _ in pares))
+    cals = calendarios_sucursales(sids)
+    cubeta = _cubeta_min()
+
+    claves = {p: _mapa_key(p[0], p[1], cubeta) for p in pares}
+    vkeys = {sid: _version_key(sid) for sid in sids}
+    try:
+        guardado = cache.get_many([*vkeys.values(), *claves.values()])
+    except Exception:
+        guardado = {}
+    firmas = {sid: (guardado.get(vkeys[sid]), cals[sid].version) for sid in sids}
+
+    datos = {}
+    faltan = []
+    for p in pares:
+        d = guardado.get(claves[p])
+        if d is not None and d.get("firma") == firmas[p[0]]:
+            datos[p] = d
+        else:
+            faltan.append(p)
+
+    if faltan:
+        ventanas = [_ventana(dia, cals[sid].tz) for sid, dia in faltan]
+        ocupado = ocupacion_sucursales(
+            list(dict.fromkeys(sid for sid, _ in faltan)),
+            min(v[0] for v in ventanas), max(v[1] for v in ventanas),
+        )
+        nuevos = {}
+        for sid, dia in faltan:
+            d = _datos_dia(sid, dia, cals[sid].tz, cubeta, ocupado.get(sid, {}))
+            d["firma"] = firmas[sid]
+            datos[(sid, dia)] = nuevos[claves[(sid, dia)]] = d
+        try:
+            cache.set_many(nuevos, int(getattr(settings, "OCUPACION_TTL", 300)))
+        except Exception:
+            pass
+
+    return {p: _envolver(p[0], p[1], cals[p[0]], cubeta, datos[p]) for p in pares}
+
+
+def ocupacion_rango(sucursal, desde, dias: int) -> List[OcupacionDia]:
+    """Mapas de 'dias' días locales consecutivos desde 'desde' (ver ocupacion_dias)."""
+    sid = getattr(sucursal, "pk", sucursal)
+    fechas = [desde + timedelta(days=i) for i in range(max(0, int(dias)))]
+    mapas = ocupacion_dias([(sid, f) for f in fechas])
+    return [mapas[(sid, f)] for f in fechas]
+
+
+def ocupacion_dia(sucursal, dia) -> OcupacionDia:
+    """
+    Mapa de ocupación de la sucursal (instancia o id) para el día local 'dia'.
+    Camino normal: una lectura de caché (versión + mapa en el mismo get_many).
+    """
+    return ocupacion_rango(sucursal, dia, 1)[0]
+
+
+def versiones_ocupacion(sucursal_ids) -> Dict[int, object]:
+    """{sucursal_id: versión actual} en un get_many (None si nunca se ha escrito)."""
+    sids = list(sucursal_ids)
+    try:
+        guardadas = cache.get_many([_version_key(sid) for sid in sids])
+    except Exception:
+        guardadas = {}
+    return {sid: guardadas.get(_version_key(sid)) for sid in sids}
+
+
+def version_ocupacion(sucursal_id):
+    """Versión actual de la ocupación de la sucursal (None si nunca se ha escrito)."""
+    try:
+        return cache.get(_version_key(sucursal_id))
+    except Exception:
+        return None
+
+
+def ocupacion_para(sucursal, dt) -> OcupacionDia:
+    """Mapa del día local (TZ de la sucursal) en que cae dt."""
+    cal = calendario_sucursal(getattr(sucursal, "pk", sucursal))
+    return ocupacion_dia(sucursal, dt.astimezone(cal.tz).date())
+
+
+def invalidar_ocupacion(sucursal_id) -> None:
+    """
+    Sube la versión de la sucursal al confirmar la transacción: los mapas guardados dejan
+    de coincidir y se reconstruyen en la siguiente lectura (aquí y en los demás procesos).
+    """
+    if sucursal_id is None:
+        return
+
+    def _subir():
+        try:
+            cache.set(_version_key(sucursal_id), _time.time_ns(), None)
+        except Exception:
+            pass
+
+    transaction.on_commit(_subir)
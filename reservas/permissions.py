@@ -37,30 +37,15 @@ def user_country_ids(user):
 
 def user_can_manage_sucursal(user, sucursal):
     """
-    Determina si el usuario puede gestionar la sucursal indicada.
-    Reglas: superuser / manage_branches / M2M / sucursal_asignada / países permitidos.
+    Determina si el usuario puede gestionar la sucursal indicada (instancia o id).
+    Reglas: superuser / manage_branches / M2M / sucursal_asignada / países permitidos,
+    resueltas como pertenencia al conjunto en caché de reservas/visibilidad.py.
     """
+    from .visibilidad import puede_ver_sucursal  # import local evita ciclos
+
     if not getattr(user, "is_authenticated", False):
         return False
-
-    # Superuser o permiso global
-    if getattr(user, "is_superuser", False) or user.has_perm("reservas.manage_branches"):
-        return True
-
-    # Admin M2M explícito
-    if sucursal.administradores.filter(pk=user.pk).exists():
-        return True
-
-    # Sucursal asignada directamente en perfil
-    perfil = getattr(user, "perfiladmin", None)
-    if perfil and getattr(perfil, "sucursal_asignada_id", None) == sucursal.id:
-        return True
-
-    # Alcance por países
-    country_ids = user_country_ids(user)
-    if country_ids is None:  # sin restricción
-        return True
-    return sucursal.pais_id in country_ids
+    return puede_ver_sucursal(user, sucursal)
 
 
 def assert_user_can_manage_sucursal(user, sucursal):
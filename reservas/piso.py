@@ -0,0 +1,123 @@
+# reservas/piso.py
+"""
+Estado del piso de una sucursal para la tablet de recepción.
+
+Una sola consulta: cada Mesa viene anotada con subconsultas correlacionadas que devuelven
+un objeto JSON (JSONObject de PostgreSQL) con la reserva en curso, la siguiente, el
+bloqueo vigente y la orden abierta. Con índices (mesa, fecha) y (sucursal, inicio) cada
+subconsulta es un index scan corto; el costo no crece en round trips con las mesas.
+
+La "versión" es un hash del contenido: la tablet la manda de vuelta (If-None-Match o ?v=)
+y si nada cambió recibe 304 sin cuerpo. Como el contenido depende de la hora (qué reserva
+está en curso, si ya se puede confirmar la llegada), el hash cambia también con el tiempo.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import DateTimeField, F, Func, OuterRef, Q, Subquery, Value
+from django.db.models.fields.json import JSONField
+from django.db.models.functions import Coalesce, JSONObject, NullIf
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import BloqueoMesa, Mesa, Reserva
+from .models_orders import Orden
+
+ORDENES_ABIERTAS = (Orden.ESTADO_ABIERTA, Orden.ESTADO_EN_COCINA, Orden.ESTADO_SERVIDA)
+
+
+def _json(qs, **campos):
+    """Primera fila de qs como objeto JSON (None si no hay)."""
+    return Subquery(qs.values(_j=JSONObject(**campos))[:1], output_field=JSONField())
+
+
+def _reserva_json(qs):
+    return _json(
+        qs,
+        id="id",
+        folio="folio",
+        fecha="fecha",
+        # fin efectivo (el que hace cumplir la exclusión); fin_utc no lo llenan todas las altas
+        fin=Func(F("ocupacion"), function="upper", output_field=DateTimeField()),
+        personas="num_personas",
+        estado="estado",
+        llego="llego",
+        checkin_at="checkin_at",
+        nombre=Coalesce(NullIf("nombre_contacto", Value("")), "cliente__nombre"),
+    )
+
+
+def _mesas_con_estado(sucursal_id, ahora):
+    activas = Reserva.objects.activas().filter(mesa=OuterRef("pk"))
+    return (
+        Mesa.objects.filter(sucursal_id=sucursal_id)
+        .order_by("numero", "id")
+        .annotate(
+            r_actual=_reserva_json(activas.filter(ocupacion__contains=ahora).order_by("fecha")),
+            r_siguiente=_reserva_json(activas.filter(fecha__gt=ahora).order_by("fecha")),
+            bloqueo=_json(
+                BloqueoMesa.objects.filter(
+                    Q(mesa=OuterRef("pk")) | Q(mesa__isnull=True),
+                    sucursal_id=sucursal_id, inicio__lte=ahora, fin__gt=ahora,
+                ).order_by("-fin"),
+                id="id", motivo="motivo", fin="fin", mesa_id="mesa_id",
+            ),
+            orden=_json(
+                Orden.objects.filter(mesa=OuterRef("pk"), estado__in=ORDENES_ABIERTAS)
+                .order_by("-creada_en"),
+                id="id", estado="estado", total="total",
+            ),
+        )
+        .values("id", "numero", "capacidad", "zona", "pos_x", "pos_y", "bloqueada",
+                "r_actual", "r_siguiente", "bloqueo", "orden")
+    )
+
+
+def _checkin(reserva, ahora, tol):
+    """Estado de llegada de la reserva en curso (misma regla que admin_mesa_detalle)."""
+    if reserva is None:
+        return None
+    if reserva["llego"]:
+        return "llego"
+    fecha = parse_datetime(reserva["fecha"])
+    if fecha - timedelta(minutes=tol) <= ahora <= fecha + timedelta(minutes=tol):
+        return "por_confirmar"
+    return "esperando" if ahora < fecha else "retrasada"
+
+
+def estado_piso(sucursal, ahora=None) -> dict:
+    """
+    {"sucursal", "generado", "version", "mesas": [...]} con, por mesa: estado derivado
+    (libre / reservada / ocupada / bloqueada), reserva actual y siguiente, check-in,
+    bloqueo y orden abierta. Una consulta a la BD.
+    """
+    sid = getattr(sucursal, "pk", sucursal)
+    ahora = ahora or timezone.now()
+    tol = int(getattr(settings, "CHECKIN_TOLERANCIA_MIN", 5))
+
+    mesas = []
+    for m in _mesas_con_estado(sid, ahora):
+        actual = m.pop("r_actual")
+        if m["bloqueada"] or m["bloqueo"]:
+            estado = "bloqueada"
+        elif (actual and actual["llego"]) or m["orden"]:
+            estado = "ocupada"
+        elif actual:
+            estado = "reservada"
+        else:
+            estado = "libre"
+        m.update(estado=estado, actual=actual, siguiente=m.pop("r_siguiente"),
+                 checkin=_checkin(actual, ahora, tol))
+        mesas.append(m)
+
+    cuerpo = json.dumps(mesas, sort_keys=True, default=str).encode()
+    return {
+        "sucursal": sid,
+        "generado": ahora.isoformat(),
+        "version": hashlib.sha1(cuerpo).hexdigest()[:16],
+        "mesas": mesas,
+    }
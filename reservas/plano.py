@@ -0,0 +1,183 @@
+# reservas/plano.py
+"""
+Plano (layout) de mesas de una sucursal: posiciones pos_x/pos_y de cada mesa y punto de
+recepción, en porcentaje 0..100 del canvas.
+
+guardar_plano() valida el layout completo y lo persiste en una transacción: un solo UPDATE
+(CASE por id, vía bulk_update) para todas las mesas y otro para la recepción. Cada cambio
+sube la versión del plano (caché compartido, igual que ocupacion.py); los GET del mapa la
+usan como ETag para responder 304 entre ediciones.
+
+snapshot_plano() guarda el plano ya serializado (bytes JSON) por versión: los GET del mapa
+lo sirven tal cual sin consultar ni serializar mesas; se regenera solo cuando la versión
+sube (señales de Mesa/Sucursal, guardar_plano).
+"""
+from __future__ import annotations
+
+import json
+import time as _time
+from typing import Iterable, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+from .models import Mesa, Sucursal
+
+
+class PlanoInvalido(ValueError):
+    """Payload de layout inválido (se responde 400 con el mensaje)."""
+
+
+class PlanoDesfasado(Exception):
+    """El cliente editó sobre una versión vieja del plano (se responde 409)."""
+
+
+def _version_key(sucursal_id) -> str:
+    return f"plano:v:{sucursal_id}"
+
+
+def version_plano(sucursal_id) -> str:
+    """Versión actual del plano. Si no hay (caché frío) se crea una nueva: nunca repite ETag."""
+    key = _version_key(sucursal_id)
+    try:
+        v = cache.get(key)
+        if v is None:
+            cache.add(key, _time.time_ns(), None)
+            v = cache.get(key)
+    except Exception:
+        v = None
+    return str(v if v is not None else _time.time_ns())
+
+
+def _subir_version(sucursal_id) -> None:
+    try:
+        cache.set(_version_key(sucursal_id), _time.time_ns(), None)
+    except Exception:
+        pass
+
+
+def invalidar_plano(sucursal_id) -> None:
+    """Sube la versión del plano al confirmar la transacción."""
+    if sucursal_id is None:
+        return
+    transaction.on_commit(lambda: _subir_version(sucursal_id))
+
+
+CAMPOS_MESA = ("id", "numero", "zona", "pos_x", "pos_y", "capacidad", "estado", "bloqueada")
+
+
+def _snapshot_key(sucursal_id, version) -> str:
+    return f"plano:{sucursal_id}:{version}"
+
+
+def snapshot_plano(sucursal_id) -> Tuple[str, bytes]:
+    """
+    (versión, JSON en bytes) del plano: {"sucursal", "version", "recepcion", "mesas"}.
+    Camino normal: 2 lecturas de caché (versión + blob). Si falta: 2 queries y se guarda.
+    """
+    version = version_plano(sucursal_id)
+    key = _snapshot_key(sucursal_id, version)
+    try:
+        blob = cache.get(key)
+    except Exception:
+        blob = None
+    if blob is not None:
+        return version, blob
+
+    rx, ry = Sucursal.objects.filter(pk=sucursal_id).values_list("recepcion_x", "recepcion_y").first() or (0, 0)
+    mesas = list(Mesa.objects.filter(sucursal_id=sucursal_id).order_by("numero", "id").values(*CAMPOS_MESA))
+    blob = json.dumps(
+        {"sucursal": sucursal_id, "version": version,
+         "recepcion": {"pos_x": rx, "pos_y": ry}, "mesas": mesas},
+        cls=DjangoJSONEncoder, separators=(",", ":"),
+    ).encode()
+    try:
+        cache.set(key, blob, int(getattr(settings, "PLANO_TTL", 3600)))
+    except Exception:
+        pass
+    return version, blob
+
+
+def _coord(valor, campo) -> int:
+    try:
+        v = float(valor)
+    except (TypeError, ValueError):
+        raise PlanoInvalido(f"{campo} debe ser numérico.")
+    if v != v:  # NaN
+        raise PlanoInvalido(f"{campo} debe ser numérico.")
+    return int(round(max(0.0, min(100.0, v))))
+
+
+def _punto(item, etiqueta):
+    # pos_x/pos_y; se aceptan x/y del payload viejo del mapa
+    x = item.get("pos_x", item.get("x"))
+    y = item.get("pos_y", item.get("y"))
+    if x is None or y is None:
+        raise PlanoInvalido(f"{etiqueta}: faltan pos_x/pos_y.")
+    return _coord(x, f"{etiqueta}.pos_x"), _coord(y, f"{etiqueta}.pos_y")
+
+
+def guardar_plano(sucursal: Sucursal, mesas: Iterable[dict] = (), recepcion: Optional[dict] = None,
+                  version: Optional[str] = None) -> str:
+    """
+    Valida y guarda el layout. mesas: [{"id", "pos_x", "pos_y"}, ...] (todas de la sucursal,
+    sin repetir); recepcion: {"pos_x", "pos_y"} o None. Si se pasa 'version' y no es la
+    actual → PlanoDesfasado. Devuelve la versión nueva.
+    Costo: candado de la sucursal + 1 SELECT de mesas + 1 UPDATE de mesas + 1 UPDATE de
+    recepción (si viene).
+    """
+    if not isinstance(mesas, (list, tuple)):
+        raise PlanoInvalido("'mesas' debe ser una lista.")
+    posiciones = {}
+    for item in mesas:
+        if not isinstance(item, dict):
+            raise PlanoInvalido("Cada mesa debe ser un objeto con id, pos_x y pos_y.")
+        try:
+            mesa_id = int(item.get("id"))
+        except (TypeError, ValueError):
+            raise PlanoInvalido("Mesa sin id válido.")
+        if mesa_id in posiciones:
+            raise PlanoInvalido(f"Mesa {mesa_id} repetida.")
+        posiciones[mesa_id] = _punto(item, f"mesa {mesa_id}")
+    if recepcion is not None and not isinstance(recepcion, dict):
+        raise PlanoInvalido("'recepcion' debe ser un objeto con pos_x y pos_y.")
+    punto_recepcion = _punto(recepcion, "recepcion") if recepcion is not None else None
+
+    with transaction.atomic():
+        # Candado por sucursal antes de comparar versiones: dos guardados con la misma
+        # versión se serializan aquí y el segundo ve la versión que subió el primero
+        Sucursal.objects.select_for_update().filter(pk=sucursal.pk).values_list("pk").first()
+        if version is not None and str(version) != version_plano(sucursal.pk):
+            raise PlanoDesfasado(version_plano(sucursal.pk))
+
+        objs = list(
+            Mesa.objects.select_for_update()
+            .filter(sucursal=sucursal, pk__in=posiciones)
+            .only("id", "pos_x", "pos_y")
+        )
+        faltan = set(posiciones) - {m.pk for m in objs}
+        if faltan:
+            raise PlanoInvalido(f"Mesas que no son de esta sucursal: {sorted(faltan)}")
+
+        cambiadas = []
+        for m in objs:
+            x, y = posiciones[m.pk]
+            if (m.pos_x, m.pos_y) != (x, y):
+                m.pos_x, m.pos_y = x, y
+                cambiadas.append(m)
+        if cambiadas:
+            Mesa.objects.bulk_update(cambiadas, ["pos_x", "pos_y"], batch_size=500)
+
+        if punto_recepcion is not None:
+            rx, ry = punto_recepcion
+            Sucursal.objects.filter(pk=sucursal.pk).update(recepcion_x=rx, recepcion_y=ry)
+            sucursal.recepcion_x, sucursal.recepcion_y = rx, ry
+
+        if cambiadas or punto_recepcion is not None:
+            # Se sube ya (con el candado tomado) para que quien espera el candado vea la
+            # versión nueva, y otra vez al confirmar para descartar snapshots armados antes
+            _subir_version(sucursal.pk)
+            invalidar_plano(sucursal.pk)
+    return version_plano(sucursal.pk)
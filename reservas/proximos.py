@@ -0,0 +1,115 @@
+# reservas/proximos.py
+"""
+Snapshot de "próximos horarios libres" por sucursal.
+
+El comando refrescar_proximos calcula en segundo plano, para cada sucursal activa, los
+siguientes PROXIMOS_N inicios libres para los tamaños de grupo PROXIMOS_PARTIES y los deja
+en caché con vida corta (PROXIMOS_TTL). El localizador (seleccionar_sucursal sin fecha) y
+sucursal_detalle solo leen estos snapshots: la vista nunca corre la lógica de disponibilidad.
+
+Cada snapshot guarda la versión de ocupación con la que se calculó (ocupacion.py). En cada
+tick el refrescador compara contra la versión actual con un get_many y recalcula antes de
+tiempo las sucursales con reservas o bloqueos nuevos.
+"""
+from __future__ import annotations
+
+from typing import Dict, Iterable, List
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .ocupacion import versiones_ocupacion
+
+
+def _key(sucursal_id) -> str:
+    return f"proximos:{sucursal_id}"
+
+
+def parties() -> tuple:
+    return tuple(sorted(int(p) for p in getattr(settings, "PROXIMOS_PARTIES", (2, 4, 6))))
+
+
+def _party_snapshot(party: int):
+    """Tamaño guardado que cubre 'party': el menor >= party (mesas más grandes, mismo bloque)."""
+    for p in parties():
+        if p >= party:
+            return p
+    return None
+
+
+def refrescar_proximos(sucursal_ids: Iterable[int]) -> int:
+    """Recalcula y guarda el snapshot de esas sucursales. Devuelve cuántas se guardaron."""
+    from .utils import siguientes_libres_sucursales  # import local evita ciclos
+
+    sids = list(sucursal_ids)
+    if not sids:
+        return 0
+    # La versión se lee ANTES de calcular: si entra una reserva a media pasada, el
+    # snapshot queda con la versión vieja y el siguiente tick lo recalcula
+    versiones = versiones_ocupacion(sids)
+    n = int(getattr(settings, "PROXIMOS_N", 5))
+    por_party = {p: siguientes_libres_sucursales(sids, party=p, n=n) for p in parties()}
+
+    generado = timezone.now()
+    snapshots = {
+        _key(sid): {
+            "version": versiones[sid],
+            "generado": generado,
+            "slots": {p: por_party[p].get(sid, []) for p in parties()},
+        }
+        for sid in sids
+    }
+    try:
+        cache.set_many(snapshots, int(getattr(settings, "PROXIMOS_TTL", 120)))
+    except Exception:
+        return 0
+    return len(snapshots)
+
+
+def sucursales_desfasadas(sucursal_ids: Iterable[int]) -> List[int]:
+    """Ids sin snapshot o cuyo snapshot se calculó con otra versión de ocupación."""
+    sids = list(sucursal_ids)
+    try:
+        guardado = cache.get_many([_key(sid) for sid in sids])
+    except Exception:
+        return sids
+    versiones = versiones_ocupacion(sids)
+    out = []
+    for sid in sids:
+        snap = guardado.get(_key(sid))
+        if snap is None or snap.get("version") != versiones[sid]:
+            out.append(sid)
+    return out
+
+
+def leer_proximos(sucursal_ids: Iterable[int], party: int = 2, n: int = 3) -> Dict[int, List]:
+    """
+    {sucursal_id: [inicio_dt, ...]} desde los snapshots (un get_many), sin los inicios que
+    ya pasaron. Sucursal sin snapshot (expiró o aún no se genera) o party mayor al máximo
+    guardado → se calcula en vivo solo para esas; una lista vacía significaría "sin lugar".
+    """
+    sids = list(sucursal_ids)
+    party = int(party or 2)
+    p = _party_snapshot(party)
+    guardado = {}
+    if p is not None:
+        try:
+            guardado = cache.get_many([_key(sid) for sid in sids])
+        except Exception:
+            guardado = {}
+    ahora = timezone.now()
+    out, faltan = {}, []
+    for sid in sids:
+        snap = guardado.get(_key(sid))
+        if snap is None:
+            faltan.append(sid)
+            continue
+        out[sid] = [dt for dt in snap["slots"].get(p, []) if dt > ahora][:n]
+    if faltan:
+        from .utils import siguientes_libres_sucursales  # import local evita ciclos
+
+        vivos = siguientes_libres_sucursales(faltan, party=party, n=n)
+        for sid in faltan:
+            out[sid] = list(vivos.get(sid, []))[:n]
+    return out
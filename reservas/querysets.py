@@ -2,7 +2,7 @@
 from __future__ import annotations
 
 from datetime import datetime, time, timedelta
-from django.db.models import QuerySet, Q
+from django.db.models import QuerySet
 from django.utils import timezone
 
 
@@ -18,7 +18,7 @@ class ReservaQuerySet(QuerySet):
         - Dueño de cadena (superuser o perm 'reservas.manage_branches'): ve todo
         - Staff: reservas de sucursales donde es administrador
         - Anónimo: nada
-        Nota: usa relaciones hacia 'sucursal__administradores' y 'mesa__sucursal__administradores'
+        Nota: filtra por la FK directa 'sucursal' (obligatoria y consistente con la mesa)
         para no importar modelos aquí y evitar ciclos.
         """
         if not getattr(user, "is_authenticated", False):
@@ -26,10 +26,7 @@ class ReservaQuerySet(QuerySet):
         if user.is_superuser or user.has_perm("reservas.manage_branches"):
             return self
         return (
-            self.filter(
-                Q(sucursal__administradores=user)
-                | Q(mesa__sucursal__administradores=user)
-            )
+            self.filter(sucursal__administradores=user)
             .distinct()
         )
 
@@ -56,8 +53,8 @@ class ReservaQuerySet(QuerySet):
 
     # Utilidades
     def for_branch(self, sucursal_id):
-        """Por sucursal (FK directa) o vía mesa.sucursal, por si falta el campo."""
-        return self.filter(Q(sucursal_id=sucursal_id) | Q(mesa__sucursal_id=sucursal_id))
+        """Por sucursal (FK directa, índice sucursal+fecha)."""
+        return self.filter(sucursal_id=sucursal_id)
 
     def for_client(self, cliente_id):
         return self.filter(cliente_id=cliente_id)
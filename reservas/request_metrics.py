@@ -0,0 +1,207 @@
+# reservas/request_metrics.py
+"""
+Métricas por vista en memoria del proceso (sin APM externo).
+
+RequestMetricsMiddleware (reservas.middleware) mide cada request y la agrega aquí,
+por nombre de URL resuelto ("reservas:ver_mesas"):
+  - número de queries y tiempo total en BD (connection.execute_wrapper)
+  - hits/misses de caché (get/get_many de los backends configurados)
+  - tiempo total de pared
+
+Cada vista guarda las últimas REQUEST_METRICS_WINDOW muestras en un ring buffer
+(deque con maxlen). Los budgets de queries se declaran con @query_budget(n) o en
+settings.QUERY_BUDGETS = {"reservas:ver_mesas": 20}; si se exceden se loguea warning.
+"""
+from __future__ import annotations
+
+import contextvars
+import logging
+import statistics
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional
+
+from django.conf import settings
+
+logger = logging.getLogger("reservas.metrics")
+
+_lock = threading.Lock()
+_buffers: Dict[str, deque] = {}
+_budgets: Dict[str, Optional[int]] = {}
+
+# Contadores del request en curso (None = fuera de un request medido)
+_actual: contextvars.ContextVar[Optional["MuestraRequest"]] = contextvars.ContextVar(
+    "reservas_request_metrics", default=None
+)
+
+
+class MuestraRequest:
+    __slots__ = ("queries", "db_ms", "cache_hits", "cache_misses")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_ms = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+
+def query_budget(n: int):
+    """Declara el máximo de queries esperado para una vista (función o as_view)."""
+    def deco(view):
+        view.query_budget = int(n)
+        return view
+    return deco
+
+
+def budget_para(url_name: str, func) -> Optional[int]:
+    budgets = getattr(settings, "QUERY_BUDGETS", {}) or {}
+    if url_name in budgets:
+        return int(budgets[url_name])
+    b = getattr(func, "query_budget", None)
+    if b is None:
+        b = getattr(getattr(func, "view_class", None), "query_budget", None)
+    return b
+
+
+# ---------------------------------------------------------------- captura
+def iniciar() -> tuple:
+    muestra = MuestraRequest()
+    return muestra, _actual.set(muestra)
+
+
+def terminar(token) -> None:
+    _actual.reset(token)
+
+
+def db_wrapper(execute, sql, params, many, context):
+    """Se instala con connection.execute_wrapper() durante el request."""
+    muestra = _actual.get()
+    t0 = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        if muestra is not None:
+            muestra.queries += 1
+            muestra.db_ms += (time.perf_counter() - t0) * 1000
+
+
+_MISSING = object()
+_cache_instrumentado = False
+
+
+def instrumentar_cache():
+    """
+    Envuelve get/get_many de las clases de backend configuradas (una vez por proceso).
+    Fuera de un request medido el costo es una lectura de contextvar.
+    """
+    global _cache_instrumentado
+    if _cache_instrumentado:
+        return
+    from django.core.cache import caches
+
+    with _lock:
+        if _cache_instrumentado:
+            return
+        for alias in getattr(settings, "CACHES", {}):
+            try:
+                cls = type(caches[alias])
+            except Exception:
+                continue
+            if getattr(cls, "_reservas_metrics", False):
+                continue
+            _envolver_backend(cls)
+        _cache_instrumentado = True
+
+
+def _envolver_backend(cls):
+    orig_get = cls.get
+    orig_get_many = cls.get_many
+
+    def get(self, key, default=None, *args, **kwargs):
+        val = orig_get(self, key, _MISSING, *args, **kwargs)
+        muestra = _actual.get()
+        if muestra is not None:
+            if val is _MISSING:
+                muestra.cache_misses += 1
+            else:
+                muestra.cache_hits += 1
+        return default if val is _MISSING else val
+
+    def get_many(self, keys, *args, **kwargs):
+        keys = list(keys)
+        muestra = _actual.get()
+        # BaseCache.get_many llama a self.get(): se apaga la captura para no contar doble
+        token = _actual.set(None)
+        try:
+            out = orig_get_many(self, keys, *args, **kwargs)
+        finally:
+            _actual.reset(token)
+        if muestra is not None:
+            muestra.cache_hits += len(out)
+            muestra.cache_misses += len(keys) - len(out)
+        return out
+
+    cls.get = get
+    cls.get_many = get_many
+    cls._reservas_metrics = True
+
+
+# ------------------------------------------------------------- agregación
+def registrar(url_name: str, muestra: MuestraRequest, wall_ms: float, status: int, budget: Optional[int]):
+    window = int(getattr(settings, "REQUEST_METRICS_WINDOW", 200))
+    fila = (wall_ms, muestra.queries, muestra.db_ms, muestra.cache_hits, muestra.cache_misses, status)
+    with _lock:
+        buf = _buffers.get(url_name)
+        if buf is None or buf.maxlen != window:
+            buf = _buffers[url_name] = deque(buf or (), maxlen=window)
+        buf.append(fila)
+        _budgets[url_name] = budget
+
+    if budget is not None and muestra.queries > budget:
+        logger.warning(
+            "Query budget excedido en %s: %s queries (budget %s), db=%.1fms, total=%.1fms",
+            url_name, muestra.queries, budget, muestra.db_ms, wall_ms,
+        )
+
+
+def _pct(valores, p):
+    if not valores:
+        return 0.0
+    return valores[min(len(valores) - 1, int(len(valores) * p))]
+
+
+def resumen() -> Dict[str, dict]:
+    """Agregado por vista sobre las muestras del ring buffer."""
+    with _lock:
+        copia = {k: list(v) for k, v in _buffers.items()}
+        budgets = dict(_budgets)
+
+    out = {}
+    for url_name, filas in sorted(copia.items()):
+        wall = sorted(f[0] for f in filas)
+        queries = [f[1] for f in filas]
+        hits = sum(f[3] for f in filas)
+        misses = sum(f[4] for f in filas)
+        budget = budgets.get(url_name)
+        out[url_name] = {
+            "n": len(filas),
+            "wall_ms_p50": round(statistics.median(wall), 2),
+            "wall_ms_p95": round(_pct(wall, 0.95), 2),
+            "wall_ms_max": round(wall[-1], 2),
+            "queries_avg": round(sum(queries) / len(queries), 2),
+            "queries_max": max(queries),
+            "db_ms_avg": round(sum(f[2] for f in filas) / len(filas), 2),
+            "cache_hits": hits,
+            "cache_misses": misses,
+            "errores_5xx": sum(1 for f in filas if f[5] >= 500),
+            "budget": budget,
+            "sobre_budget": sum(1 for q in queries if budget is not None and q > budget),
+        }
+    return out
+
+
+def reset():
+    with _lock:
+        _buffers.clear()
+        _budgets.clear()
@@ -0,0 +1,313 @@
+# reservas/seeding.py
+"""
+Motor de sembrado masivo de reservas (pruebas de carga / benchmarks).
+
+- Por cada mesa y día arma en memoria una agenda SIN traslapes (empaquetado de
+  intervalos) dentro del horario de la sucursal, con las duraciones y el paso de su
+  calendario compilado (reservas.calendario).
+- Escribe con bulk_create en bloques: no pasa por save()/full_clean ni dispara
+  pre_save/post_save (correos, invalidación de slots, SELECT del estado previo).
+- Determinista: misma semilla + mismos parámetros ⇒ mismas reservas (salvo el folio,
+  que sale del consecutivo del día en bloques de 1000: reservas.folios.folios_del_dia).
+
+Las filas sembradas se marcan con email_contacto "@{SEED_EMAIL_DOMAIN}" para poder
+limpiarlas con limpiar_sembradas().
+"""
+from __future__ import annotations
+
+import random
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from itertools import islice
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+from zoneinfo import ZoneInfo
+
+from django.conf import settings
+from django.db import transaction
+from django.db.backends.postgresql.psycopg_any import DateTimeTZRange
+from django.utils import timezone
+
+SEED_EMAIL_DOMAIN = "carga.local"
+SEED_SUCURSAL_PREFIX = "Carga"
+
+# Capacidades típicas de un salón (se reparten cíclicamente al crear mesas)
+CAPACIDADES_MESA = (2, 2, 4, 4, 4, 4, 6, 6, 8)
+
+UTC = ZoneInfo("UTC")
+
+
+@dataclass
+class ResultadoSembrado:
+    reservas: int = 0
+    mesas_dia: int = 0
+    sucursales: int = 0
+    por_estado: Dict[str, int] = field(default_factory=dict)
+
+
+# ---------------------------------------------------------------------------
+# Planeación (pura, sin BD)
+# ---------------------------------------------------------------------------
+def _party_para(rng: random.Random, capacidad: int) -> int:
+    """Tamaño de grupo realista: sesgado a 2 personas, nunca mayor a la capacidad."""
+    capacidad = max(1, int(capacidad or 1))
+    r = rng.random()
+    if r < 0.45:
+        party = 2
+    elif r < 0.70:
+        party = rng.randint(3, 4)
+    elif r < 0.85:
+        party = 1
+    else:
+        party = rng.randint(5, 8)
+    return min(party, capacidad)
+
+
+def planear_dia(
+    rng: random.Random,
+    capacidad: int,
+    apertura_min: int,
+    cierre_min: int,
+    duracion: Callable[[int, int], int],
+    ocupacion: float = 0.7,
+    intervalo: int = 15,
+) -> List[Tuple[int, int, int]]:
+    """
+    Agenda de una mesa para un día: [(minuto_inicio, duracion_min, party), ...].
+    - Minutos contados desde 00:00 local, alineados a `intervalo`.
+    - Cada reserva empieza cuando termina la anterior (o después): nunca se traslapan.
+    - `ocupacion` (0..1) es la probabilidad de ocupar el siguiente hueco libre.
+    - `duracion(minuto, party)` devuelve los minutos de ocupación.
+    """
+    intervalo = max(1, int(intervalo))
+    out: List[Tuple[int, int, int]] = []
+    cursor = apertura_min
+    while cursor < cierre_min:
+        if rng.random() >= ocupacion:
+            cursor += intervalo * rng.randint(1, 4)
+            continue
+        party = _party_para(rng, capacidad)
+        dur = int(duracion(cursor, party))
+        if cursor + dur > cierre_min:
+            break
+        out.append((cursor, dur, party))
+        # siguiente inicio: al terminar, redondeado hacia arriba al intervalo
+        fin = cursor + dur
+        cursor = -(-fin // intervalo) * intervalo
+    return out
+
+
+def _estado_para(rng: random.Random, pasado: bool) -> str:
+    from .models import Reserva  # import local evita ciclos
+
+    r = rng.random()
+    if pasado:
+        if r < 0.80:
+            return Reserva.CONF
+        if r < 0.88:
+            return Reserva.NOSH
+        return Reserva.CANC
+    if r < 0.40:
+        return Reserva.PEND
+    if r < 0.95:
+        return Reserva.CONF
+    return Reserva.CANC
+
+
+# ---------------------------------------------------------------------------
+# Datos base (sucursales, mesas, clientes)
+# ---------------------------------------------------------------------------
+def asegurar_sucursales(n: int, mesas_por_sucursal: int, tz_name: str = None, pais=None):
+    """
+    Devuelve n sucursales sintéticas "Carga 0001".. con al menos `mesas_por_sucursal`
+    mesas cada una. Lo que falte se crea con bulk_create (sin señales de slug/mesas).
+    """
+    from django.utils.text import slugify
+    from .models import Sucursal  # import local evita ciclos
+
+    tz_name = tz_name or settings.TIME_ZONE
+    nombres = [f"{SEED_SUCURSAL_PREFIX} {i:04d}" for i in range(1, n + 1)]
+    existentes = {s.nombre: s for s in Sucursal.objects.filter(nombre__in=nombres)}
+    nuevas = [
+        Sucursal(nombre=nom, slug=slugify(nom), timezone=tz_name, pais=pais, activo=True)
+        for nom in nombres if nom not in existentes
+    ]
+    if nuevas:
+        Sucursal.objects.bulk_create(nuevas, batch_size=500)
+        existentes.update({s.nombre: s for s in Sucursal.objects.filter(nombre__in=nombres)})
+    sucursales = [existentes[nom] for nom in nombres]
+    asegurar_mesas(sucursales, mesas_por_sucursal)
+    return sucursales
+
+
+def asegurar_mesas(sucursales: Sequence, mesas_por_sucursal: int):
+    from .models import Mesa  # import local evita ciclos
+
+    ids = [s.id for s in sucursales]
+    tomados = set(Mesa.objects.filter(sucursal_id__in=ids).values_list("sucursal_id", "numero"))
+    nuevas = []
+    for s in sucursales:
+        for numero in range(1, mesas_por_sucursal + 1):
+            if (s.id, numero) in tomados:
+                continue
+            nuevas.append(Mesa(
+                sucursal_id=s.id,
+                numero=numero,
+                capacidad=CAPACIDADES_MESA[(numero - 1) % len(CAPACIDADES_MESA)],
+                pos_x=(numero * 7) % 100,
+                pos_y=(numero * 13) % 100,
+            ))
+    if nuevas:
+        from .plano import invalidar_plano  # import local evita ciclos
+        Mesa.objects.bulk_create(nuevas, batch_size=2000)
+        for sid in {m.sucursal_id for m in nuevas}:
+            invalidar_plano(sid)  # bulk_create no dispara la señal de Mesa
+
+
+def asegurar_clientes(n: int) -> List[int]:
+    """IDs de n clientes sintéticos (cargaNNNNNN@carga.local); crea los que falten."""
+    from .models import Cliente  # import local evita ciclos
+
+    emails = [f"carga{i:06d}@{SEED_EMAIL_DOMAIN}" for i in range(1, n + 1)]
+    existentes = dict(Cliente.objects.filter(email__in=emails).values_list("email", "id"))
+    nuevos = [
+        Cliente(nombre=f"Cliente Carga {i:06d}", email=e, telefono=f"55{i:08d}")
+        for i, e in enumerate(emails, start=1) if e not in existentes
+    ]
+    if nuevos:
+        Cliente.objects.bulk_create(nuevos, batch_size=2000)
+        existentes = dict(Cliente.objects.filter(email__in=emails).values_list("email", "id"))
+    return [existentes[e] for e in emails]
+
+
+def limpiar_sembradas(sucursal_ids: Optional[Iterable[int]] = None) -> int:
+    """Borra reservas sembradas por este motor (opcionalmente solo de ciertas sucursales)."""
+    from .models import Reserva  # import local evita ciclos
+
+    qs = Reserva.objects.filter(email_contacto__endswith=f"@{SEED_EMAIL_DOMAIN}")
+    if sucursal_ids is not None:
+        qs = qs.filter(sucursal_id__in=list(sucursal_ids))
+    borradas, _ = qs.delete()
+    return borradas
+
+
+# ---------------------------------------------------------------------------
+# Generación y escritura
+# ---------------------------------------------------------------------------
+def generar_reservas(
+    sucursales: Sequence,
+    desde: date,
+    dias: int,
+    cliente_ids: Sequence[int],
+    seed: int = 0,
+    ocupacion: float = 0.7,
+    resultado: Optional[ResultadoSembrado] = None,
+) -> Iterator:
+    """
+    Genera instancias Reserva (sin guardar) día por día, sucursal por sucursal, mesa por mesa.
+    Cada (mesa, día) usa su propio Random(seed:mesa:día): el resultado no depende del orden
+    ni del tamaño de bloque.
+    """
+    from .calendario import calendario_sucursal
+    from .folios import folios_del_dia
+    from .models import Mesa, Reserva  # import local evita ciclos
+
+    hoy = timezone.localdate()
+    resultado = resultado if resultado is not None else ResultadoSembrado()
+
+    mesas_por_suc: Dict[int, list] = {}
+    for m in (Mesa.objects.filter(sucursal_id__in=[s.id for s in sucursales])
+              .order_by("sucursal_id", "numero").values("id", "sucursal_id", "capacidad")):
+        mesas_por_suc.setdefault(m["sucursal_id"], []).append(m)
+
+    for offset in range(dias):
+        dia = desde + timedelta(days=offset)
+        folios = folios_del_dia(dia)
+        pasado = dia < hoy
+
+        for suc in sucursales:
+            cal = calendario_sucursal(suc)
+            jornada = cal.jornada(dia)
+            if jornada is None:  # la sucursal no abre ese día
+                continue
+            reglas = cal.reglas(dia)
+
+            def duracion(minuto, party, _r=reglas):
+                return (_r.dur_grande if party >= 5 else _r.dur_normal)[minuto]
+
+            base_local = datetime(dia.year, dia.month, dia.day, tzinfo=cal.tz)
+            for mesa in mesas_por_suc.get(suc.id, []):
+                rng = random.Random(f"{seed}:{mesa['id']}:{dia.isoformat()}")
+                agenda = planear_dia(rng, mesa["capacidad"], jornada[0], jornada[1], duracion,
+                                     ocupacion=ocupacion, intervalo=cal.paso_min)
+                resultado.mesas_dia += 1
+                for minuto, dur, party in agenda:
+                    # wall clock local → aware (misma regla que Reserva.set_from_local)
+                    li = base_local.replace(hour=minuto // 60, minute=minuto % 60)
+                    lf = li + timedelta(minutes=dur)
+
+                    folio = next(folios)
+
+                    estado = _estado_para(rng, pasado)
+                    llego = pasado and estado == Reserva.CONF
+                    cliente_id = cliente_ids[rng.randrange(len(cliente_ids))]
+                    resultado.por_estado[estado] = resultado.por_estado.get(estado, 0) + 1
+
+                    yield Reserva(
+                        cliente_id=cliente_id,
+                        mesa_id=mesa["id"],
+                        sucursal_id=suc.id,
+                        fecha=li,
+                        inicio_utc=li.astimezone(UTC),
+                        fin_utc=lf.astimezone(UTC),
+                        local_service_date=dia,
+                        local_inicio=li,
+                        local_fin=lf,
+                        ocupacion=DateTimeTZRange(li, lf, "[)"),
+                        num_personas=party,
+                        estado=estado,
+                        folio=folio,
+                        llego=llego,
+                        checkin_at=li if llego else None,
+                        arrived_at=li if llego else None,
+                        creada_por_staff=True,
+                        nombre_contacto=f"Cliente Carga {cliente_id}",
+                        email_contacto=f"carga{cliente_id}@{SEED_EMAIL_DOMAIN}",
+                    )
+
+
+def sembrar(
+    sucursales: Sequence,
+    desde: date,
+    dias: int,
+    cliente_ids: Sequence[int],
+    seed: int = 0,
+    ocupacion: float = 0.7,
+    chunk: int = 5000,
+    on_chunk: Optional[Callable[[int], None]] = None,
+) -> ResultadoSembrado:
+    """
+    Escribe lo que produce generar_reservas() con bulk_create en bloques de `chunk`,
+    una transacción por bloque. Al final invalida la caché de slots y el mapa de ocupación
+    una vez por sucursal (bulk_create no dispara señales).
+    """
+    from .models import Reserva  # import local evita ciclos
+    from .cache_utils import slots_invalidate_prefix
+    from .ocupacion import invalidar_ocupacion
+
+    resultado = ResultadoSembrado(sucursales=len(sucursales))
+    gen = generar_reservas(sucursales, desde, dias, cliente_ids, seed=seed,
+                           ocupacion=ocupacion, resultado=resultado)
+    while True:
+        bloque = list(islice(gen, chunk))
+        if not bloque:
+            break
+        with transaction.atomic():
+            Reserva.objects.bulk_create(bloque, batch_size=chunk)
+        resultado.reservas += len(bloque)
+        if on_chunk:
+            on_chunk(resultado.reservas)
+
+    for s in sucursales:
+        slots_invalidate_prefix(f"slots:{s.id}:")
+        invalidar_ocupacion(s.id)
+    return resultado
@@ -68,6 +68,8 @@ def crear_mesas(sender, instance: Sucursal, created, **kwargs):
             [Mesa(sucursal=instance, numero=i, capacidad=capacidad_def) for i in range(1, total + 1)],
             ignore_conflicts=True,
         )
+        from .plano import invalidar_plano  # import local evita ciclos
+        invalidar_plano(instance.pk)  # bulk_create no dispara la señal de Mesa
 
 
 # ==============================================================================
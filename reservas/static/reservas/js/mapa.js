@@ -31,11 +31,32 @@
     });
     if (!res.ok) {
       const txt = await res.text().catch(() => "");
-      throw new Error(`HTTP ${res.status} ${txt}`);
+      const err = new Error(`HTTP ${res.status} ${txt}`);
+      err.status = res.status;
+      throw err;
     }
     return res.json().catch(() => ({}));
   }
 
+  // Layout: todo se guarda por la API de plano (una transacción, un UPDATE por request)
+  const apiSave = canvas.dataset.apiSave;
+  // Se manda la versión con la que se dibujó: si otro guardó antes, el server responde 409
+  // y se recarga el plano en vez de pisar sus cambios.
+  async function guardarPlano(payload) {
+    let data;
+    try {
+      data = await postJSON(apiSave, { ...payload, version: canvas.dataset.planoVersion });
+    } catch (err) {
+      if (err.status === 409) {
+        alert("Alguien más cambió el plano. Se recargará con la versión actual.");
+        window.location.reload();
+      }
+      throw err;
+    }
+    if (data && data.version) canvas.dataset.planoVersion = data.version;
+    return data;
+  }
+
   // ============================================================
   //  Candado de diseño (editable ON/OFF) guardado en localStorage
   // ============================================================
@@ -190,7 +211,7 @@
 
     makeDraggable(node, {
       onDrop: async ({ pos_x, pos_y }) => {
-        await postJSON(node.dataset.updateUrl, { pos_x, pos_y });
+        await guardarPlano({ mesas: [{ id: Number(node.dataset.id), pos_x, pos_y }] });
         node.dataset.x = String(pos_x);
         node.dataset.y = String(pos_y);
       },
@@ -209,7 +230,7 @@
 
     makeDraggable(recepcion, {
       onDrop: async ({ pos_x, pos_y }) => {
-        await postJSON(recepcion.dataset.updateUrl, { pos_x, pos_y });
+        await guardarPlano({ recepcion: { pos_x, pos_y } });
         recepcion.dataset.x = String(pos_x);
         recepcion.dataset.y = String(pos_y);
       },
@@ -0,0 +1,155 @@
+# reservas/tarjeta.py
+"""
+Tarjeta de reserva: lo que muestran el QR de recepción (reserva_scan_entry), el ticket
+(reserva_detalle / reserva_exito) y el check-in, ya calculado y guardado en caché por folio.
+
+Escaneo en caliente: una lectura de caché; sin joins (sucursal, mesa, cliente, user), sin
+conversiones de zona ni fallbacks de contacto. Si falta, se arma con una query y se guarda
+TARJETA_TTL segundos.
+
+  - La clave lleva el idioma activo (fecha_txt se formatea con el locale).
+  - Reserva post_save / post_delete la borra al confirmar la transacción (models.py).
+    Los .update() masivos y las ediciones de Cliente/Sucursal no pasan por ahí: quedan
+    acotados por el TTL.
+"""
+from __future__ import annotations
+
+from typing import Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import formats, timezone, translation
+
+from .folios import buscar_reserva_por_folio, normalizar_folio
+
+
+def _key(folio: str, idioma: Optional[str] = None) -> str:
+    return f"tarjeta:{folio}:{idioma or translation.get_language() or settings.LANGUAGE_CODE}"
+
+
+def _key_pk(pk) -> str:
+    return f"tarjeta:pk:{pk}"
+
+
+def contacto_reserva(reserva) -> dict:
+    """
+    Devuelve un dict con nombre/email/tel usando fallbacks:
+    Reserva -> Cliente -> User.
+    """
+    cliente = getattr(reserva, "cliente", None)
+    user = getattr(cliente, "user", None)
+
+    nombre = (
+        (reserva.nombre_contacto or "").strip()
+        or (getattr(cliente, "nombre", "") or "").strip()
+        or (
+            (" ".join([
+                (getattr(user, "first_name", "") or "").strip(),
+                (getattr(user, "last_name", "") or "").strip()
+            ])).strip() if user else ""
+        )
+        or (getattr(user, "username", "") if user else "")
+        or ""
+    )
+    email = (
+        (reserva.email_contacto or "").strip()
+        or (getattr(cliente, "email", "") or "").strip()
+        or (getattr(user, "email", "") if user else "")
+        or ""
+    )
+    tel = (
+        (reserva.telefono_contacto or "").strip()
+        or (getattr(cliente, "telefono", "") or "").strip()
+        or ""
+    )
+    return {"contacto_nombre": nombre, "contacto_email": email, "contacto_tel": tel}
+
+
+def _construir(r) -> dict:
+    from .calendario import calendario_sucursal  # import local evita ciclos
+
+    sucursal = r.sucursal
+    tz = calendario_sucursal(sucursal).tz
+    # local_inicio/local_fin vuelven de la BD en UTC: se pasan a la hora de la sucursal
+    li = r.local_inicio or r.inicio_utc or r.fecha
+    # reservar y walk-in no llenan fin_utc/local_fin: fin materializado o el teórico
+    lf = r.local_fin or r.fin_utc or (r.ocupacion.upper if r.ocupacion else None) or r.fin_teorico()
+    li = timezone.localtime(li, tz) if li else None
+    lf = timezone.localtime(lf, tz) if lf else None
+    return {
+        "pk": r.pk,
+        "folio": r.folio,
+        "sucursal_id": sucursal.pk,
+        "sucursal": sucursal.nombre,
+        "mesa": r.mesa.numero or r.mesa_id,
+        "personas": r.num_personas,
+        "estado": r.estado,
+        "estado_txt": str(r.get_estado_display()),
+        "llego": bool(r.llego),
+        "fecha": r.fecha.isoformat(),
+        "fecha_txt": formats.date_format(li.date(), "DATE_FORMAT") if li else "",
+        "hora_txt": li.strftime("%H:%M") if li else "",
+        "duracion_min": int((lf - li).total_seconds() // 60) if (li and lf) else 0,
+        "cliente_user_id": getattr(r.cliente, "user_id", None),
+        **contacto_reserva(r),
+    }
+
+
+def _qs():
+    from .models import Reserva  # import local evita ciclos
+
+    return Reserva.objects.select_related("sucursal", "mesa", "cliente", "cliente__user")
+
+
+def _guardar(t: dict) -> dict:
+    ttl = int(getattr(settings, "TARJETA_TTL", 300))
+    try:
+        cache.set_many({_key(t["folio"]): t, _key_pk(t["pk"]): t["folio"]}, ttl)
+    except Exception:
+        pass
+    return t
+
+
+def tarjeta_reserva(folio) -> Optional[dict]:
+    """Tarjeta de la reserva con ese folio (cualquier forma que acepte normalizar_folio) o None."""
+    canon = normalizar_folio(folio)
+    if not canon:
+        return None
+    try:
+        t = cache.get(_key(canon))
+    except Exception:
+        t = None
+    if t is not None:
+        return t
+    r = buscar_reserva_por_folio(canon, _qs())
+    return _guardar(_construir(r)) if r is not None else None
+
+
+def tarjeta_por_pk(pk) -> Optional[dict]:
+    """Igual que tarjeta_reserva() pero por id (ticket /reserva/<pk>/)."""
+    try:
+        folio = cache.get(_key_pk(pk))
+    except Exception:
+        folio = None
+    if folio:
+        t = tarjeta_reserva(folio)
+        if t is not None and t["pk"] == pk:
+            return t
+    r = _qs().filter(pk=pk).first()
+    return _guardar(_construir(r)) if r is not None else None
+
+
+def invalidar_tarjeta(folio: str) -> None:
+    """Borra la tarjeta (todos los idiomas) al confirmar la transacción."""
+    if not folio:
+        return
+
+    def _borrar():
+        try:
+            idiomas = {codigo for codigo, _ in settings.LANGUAGES} | {settings.LANGUAGE_CODE}
+            cache.delete_many([_key(folio, idioma) for idioma in idiomas])
+        except Exception:
+            pass
+
+    transaction.on_commit(_borrar)
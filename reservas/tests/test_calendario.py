@@ -0,0 +1,49 @@
+from datetime import date, datetime, time
+from types import SimpleNamespace
+from zoneinfo import ZoneInfo
+
+import pytest
+
+from reservas.calendario import compilar_calendario, ventanas_en_minutos
+
+TZ = ZoneInfo("America/Bogota")
+
+
+def test_compilar_calendario_sobreescribe_settings_por_sucursal(settings):
+    settings.HORARIO_APERTURA = 8
+    settings.HORARIO_CIERRE = 22
+    settings.RESERVA_DURACION_MIN_NORM = 90
+    settings.RESERVA_DURACION_MIN_PICO = 105
+    settings.HORAS_PICO = [(18, 21)]
+
+    horario = SimpleNamespace(
+        paso_min=30, duracion_normal_min=60, duracion_pico_min=None,
+        anticipacion_min=None, anticipacion_pico_min=None,
+        horas_pico=[["13:30", "15:00"]], fin_de_semana_pico=False,
+    )
+    dias = [SimpleNamespace(dia_semana=0, abre=time(12), cierra=time(23), cerrado=False),
+            SimpleNamespace(dia_semana=1, abre=None, cierra=None, cerrado=True)]
+    excepciones = [SimpleNamespace(fecha=date(2025, 10, 22), cerrado=False, abre=time(10), cierra=time(14))]
+
+    cal = compilar_calendario(TZ, horario=horario, dias=dias, excepciones=excepciones, sucursal_id=7)
+
+    assert cal.paso_min == 30
+    assert cal.jornada(date(2025, 10, 20)) == (12 * 60, 23 * 60)   # lunes
+    assert cal.jornada(date(2025, 10, 21)) is None                 # martes cerrado
+    assert cal.jornada(date(2025, 10, 22)) == (10 * 60, 14 * 60)   # excepción
+    assert cal.jornada(date(2025, 10, 23)) == (8 * 60, 22 * 60)    # hereda settings
+
+    assert cal.duracion(datetime(2025, 10, 23, 12, 0, tzinfo=TZ)) == 60
+    assert cal.duracion(datetime(2025, 10, 23, 14, 0, tzinfo=TZ)) == 105
+    assert cal.duracion(datetime(2025, 10, 23, 14, 0, tzinfo=TZ), party=6) == 120
+    # Sin fin de semana pico y fuera de ventana: normal aunque sea sábado
+    assert not cal.es_pico(datetime(2025, 10, 25, 19, 0, tzinfo=TZ))
+
+    inicio, fin = cal.jornada_dt(date(2025, 10, 20))
+    assert (inicio.hour, fin.hour, inicio.tzinfo) == (12, 23, TZ)
+
+
+def test_ventanas_en_minutos_rechaza_ventanas_invertidas():
+    assert ventanas_en_minutos([(7, 11), ["12:30", "15:00"]]) == ((420, 660), (750, 900))
+    with pytest.raises(ValueError):
+        ventanas_en_minutos([(15, 12)])
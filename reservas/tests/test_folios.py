@@ -0,0 +1,51 @@
+import pytest
+
+from reservas.folios import normalizar_folio
+
+
+@pytest.mark.parametrize("entrada", [
+    "R-20250916-A3F91C",
+    "r-20250916-a3f91c",
+    "  R20250916A3F91C ",
+    "20250916-a3f91c",
+    "R-20250916 A3F91C",
+    "https://ihop.example/r/R-20250916-A3F91C/",
+    "https://ihop.example/r/r-20250916-a3f91c/checkin/",
+])
+def test_formas_del_folio_actual_dan_el_canonico(entrada):
+    assert normalizar_folio(entrada) == "R-20250916-A3F91C"
+
+
+def test_folios_viejos_y_vacios():
+    assert normalizar_folio("r-ab12cd34") == "R-AB12CD34"
+    assert normalizar_folio("AB12CD34") == "R-AB12CD34"
+    assert normalizar_folio("  ") == ""
+    assert normalizar_folio(None) == ""
+
+
+def test_folios_nuevos_unicos_y_con_control():
+    from datetime import date
+
+    from reservas.folios import _FOLIO_ACTUAL, _codificar, folio_valido
+
+    dia = date(2026, 10, 19)
+    folios = [_codificar(dia, n) for n in range(5000)]
+    assert len(set(folios)) == len(folios)
+    assert folios[:3] != sorted(folios[:3]) or folios[0][11:17] != "000000"  # permutado
+    for f in folios[:200]:
+        assert _FOLIO_ACTUAL.match(f) and len(f) == 18
+        assert normalizar_folio(f.lower().replace("-", "")) == f
+        assert folio_valido(f)
+
+
+def test_digito_de_control_detecta_un_caracter_cambiado():
+    from datetime import date
+
+    from reservas.folios import _codificar, folio_valido
+
+    folio = _codificar(date(2026, 10, 19), 1234)
+    for i in list(range(2, 10)) + list(range(11, 18)):
+        for ch in ("0123456789" if i < 10 else "0123456789ABCDEF"):
+            if ch != folio[i]:
+                assert not folio_valido(folio[:i] + ch + folio[i + 1:])
+    assert folio_valido("R-20250916-A3F91C")  # formato viejo: sin control
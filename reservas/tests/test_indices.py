@@ -0,0 +1,12 @@
+from reservas.models import Reserva
+
+
+def test_activas_coincide_con_la_condicion_de_los_indices_parciales():
+    # Meta no puede usar ESTADOS_ACTIVOS: si cambia uno y no el otro, el planner deja de
+    # poder usar los índices reserva_activa_*
+    parciales = [i for i in Reserva._meta.indexes if i.name.startswith("reserva_activa_")]
+    assert len(parciales) == 3
+    for indice in parciales:
+        assert indice.condition.children == [("estado__in", list(Reserva.ESTADOS_ACTIVOS))]
+    where = Reserva.objects.activas().query.where.children[0]
+    assert list(where.rhs) == list(Reserva.ESTADOS_ACTIVOS)
@@ -0,0 +1,18 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from reservas.listados import _cursor, _leer_cursor
+from reservas.models import Reserva
+
+
+def test_cursor_ida_y_vuelta_conserva_microsegundos():
+    r = Reserva(pk=42, fecha=datetime(2026, 3, 1, 13, 45, 7, 123456, tzinfo=timezone.utc))
+    assert _leer_cursor(_cursor(r)) == (r.fecha, 42)
+
+
+@pytest.mark.parametrize("cursor", ["", "abc", "123", "1.x"])
+def test_cursor_alterado_es_value_error(cursor):
+    with pytest.raises(ValueError):
+        _leer_cursor(cursor)
+
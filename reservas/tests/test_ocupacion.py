@@ -0,0 +1,44 @@
+from datetime import date, datetime
+from zoneinfo import ZoneInfo
+
+from reservas.ocupacion import OcupacionDia
+
+TZ = ZoneInfo("America/Mexico_City")
+DIA = date(2025, 10, 21)
+
+
+def _mapa(mesas_intervalos, general=()):
+    vacio = OcupacionDia(sucursal_id=1, dia=DIA, tz=TZ, cubeta=5, mesas={}, general=0, intervalos={})
+    mesas, intervalos = {}, {}
+    for mesa_id, rangos in list(mesas_intervalos.items()) + [(None, general)]:
+        bits = 0
+        for a, b in rangos:
+            bits |= vacio.mascara(a, b)
+            intervalos.setdefault(mesa_id, []).append((a, b))
+        mesas[mesa_id] = bits
+    return OcupacionDia(sucursal_id=1, dia=DIA, tz=TZ, cubeta=5, mesas=mesas,
+                        general=mesas.pop(None), intervalos=intervalos)
+
+
+def _dt(h, m=0):
+    return datetime(2025, 10, 21, h, m, tzinfo=TZ)
+
+
+def test_libre_es_and_de_bits_y_confirma_consultas_no_alineadas():
+    # Mesa 7 ocupada 10:00–11:32 (liberada a media cubeta)
+    occ = _mapa({7: [(600, 692)]})
+
+    assert not occ.libre(7, _dt(11, 0), _dt(12, 0))
+    assert occ.libre(7, _dt(11, 35), _dt(13, 0))
+    assert occ.libre(8, _dt(10, 0), _dt(11, 0))
+    # 11:33 cae en la misma cubeta que el fin (11:30–11:35) pero no se traslapa
+    assert occ.libre(7, _dt(11, 33), _dt(12, 0))
+    assert not occ.libre(7, _dt(11, 31), _dt(12, 0))
+
+
+def test_bloqueo_de_sucursal_ocupa_todas_las_mesas():
+    occ = _mapa({7: [(600, 690)]}, general=[(18 * 60, 19 * 60)])
+
+    assert occ.mesas_libres([7, 8, 9], _dt(12, 0), _dt(13, 0)) == [7, 8, 9]
+    assert occ.mesas_libres([7, 8, 9], _dt(10, 30), _dt(12, 0)) == [8, 9]
+    assert occ.mesas_libres([7, 8, 9], _dt(18, 30), _dt(20, 0)) == []
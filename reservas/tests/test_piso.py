@@ -0,0 +1,17 @@
+from datetime import datetime, timedelta, timezone
+
+from reservas.piso import _checkin
+
+
+def test_checkin_segun_tolerancia():
+    ahora = datetime(2026, 1, 10, 14, 0, tzinfo=timezone.utc)
+
+    def reserva(minutos, llego=False):
+        return {"fecha": (ahora + timedelta(minutes=minutos)).isoformat(), "llego": llego}
+
+    assert _checkin(None, ahora, 5) is None
+    assert _checkin(reserva(-30, llego=True), ahora, 5) == "llego"
+    assert _checkin(reserva(3), ahora, 5) == "por_confirmar"
+    assert _checkin(reserva(-5), ahora, 5) == "por_confirmar"
+    assert _checkin(reserva(20), ahora, 5) == "esperando"
+    assert _checkin(reserva(-6), ahora, 5) == "retrasada"
@@ -0,0 +1,22 @@
+import pytest
+
+from reservas.plano import PlanoInvalido, _punto, guardar_plano
+
+
+def test_punto_acota_redondea_y_acepta_xy_viejos():
+    assert _punto({"pos_x": 120, "pos_y": -3}, "mesa") == (100, 0)
+    assert _punto({"pos_x": "12.6", "pos_y": 40.4}, "mesa") == (13, 40)
+    assert _punto({"x": 5, "y": 6}, "mesa") == (5, 6)
+
+
+@pytest.mark.parametrize("mesas", [
+    [{"id": 1, "pos_x": "a", "pos_y": 1}],
+    [{"id": 1, "pos_x": float("nan"), "pos_y": 1}],
+    [{"id": 1, "pos_x": 1}],
+    [{"id": 1, "pos_x": 1, "pos_y": 1}, {"id": "1", "pos_x": 2, "pos_y": 2}],
+    [{"pos_x": 1, "pos_y": 1}],
+    {"id": 1},
+])
+def test_layout_invalido_se_rechaza_completo_antes_de_tocar_la_bd(mesas):
+    with pytest.raises(PlanoInvalido):
+        guardar_plano(object(), mesas=mesas)
@@ -0,0 +1,30 @@
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from reservas.proximos import _key, leer_proximos
+
+
+def test_leer_proximos_usa_el_party_que_lo_cubre_y_descarta_pasados(settings, monkeypatch):
+    settings.CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                                   "LOCATION": "test-proximos"}}
+    settings.PROXIMOS_PARTIES = (2, 4, 6)
+    ahora = timezone.now()
+    pasado, luego, despues = ahora - timedelta(minutes=5), ahora + timedelta(minutes=30), ahora + timedelta(hours=1)
+    cache.set(_key(7), {"version": None, "generado": ahora,
+                        "slots": {2: [pasado, luego, despues], 4: [despues], 6: []}})
+
+    assert leer_proximos([7], party=2) == {7: [luego, despues]}
+    assert leer_proximos([7], party=3) == {7: [despues]}      # 3 → snapshot de 4
+    # Más grande que lo guardado, o sucursal sin snapshot: se calcula en vivo, no "sin lugar"
+    vivos = []
+
+    def en_vivo(sids, party, n):
+        vivos.append(list(sids))
+        return {sid: [luego] for sid in sids}
+
+    monkeypatch.setattr("reservas.utils.siguientes_libres_sucursales", en_vivo)
+    assert leer_proximos([7, 8], party=8) == {7: [luego], 8: [luego]}
+    assert leer_proximos([7, 8], party=2, n=1) == {7: [luego], 8: [luego]}
+    assert vivos == [[7, 8], [8]]      # con snapshot, la 7 no se recalcula
@@ -0,0 +1,37 @@
+from datetime import date, datetime
+from zoneinfo import ZoneInfo
+
+from reservas import utils
+
+TZ = ZoneInfo("America/Mexico_City")
+
+
+def test_reglas_duracion_pico_fin_de_semana_y_grupo(settings):
+    settings.HORAS_PICO = [(12, 15)]
+    settings.RESERVA_DURACION_MIN_NORM = 90
+    settings.RESERVA_DURACION_MIN_PICO = 105
+    settings.RESERVA_ANTICIPACION_MIN = 20
+    settings.RESERVA_ANTICIPACION_MIN_PICO = 40
+
+    martes = utils.reglas_duracion(date(2025, 10, 21), TZ)
+    assert martes.duracion(datetime(2025, 10, 21, 9, 0, tzinfo=TZ), 2) == 90
+    assert martes.duracion(datetime(2025, 10, 21, 12, 30, tzinfo=TZ), 2) == 105
+    assert martes.duracion(datetime(2025, 10, 21, 12, 30, tzinfo=TZ), 6) == 120
+    assert martes.anticipacion[13 * 60] == 40 and martes.anticipacion[9 * 60] == 20
+
+    # Sábado: pico todo el día para duración, pero la anticipación solo sigue HORAS_PICO
+    sabado = utils.reglas_duracion(date(2025, 10, 25), TZ)
+    assert sabado.pico[9 * 60] and sabado.dur_normal[9 * 60] == 105
+    assert sabado.anticipacion[9 * 60] == 20
+
+    # Un dt de otro día local se resuelve con las reglas de ese día
+    assert martes.es_pico(datetime(2025, 10, 25, 9, 0, tzinfo=TZ))
+
+
+def test_reglas_duracion_se_recompilan_al_cambiar_settings(settings):
+    settings.RESERVA_DURACION_MIN_NORM = 90
+    dt = datetime(2025, 10, 21, 16, 0, tzinfo=TZ)
+    assert utils.reglas_duracion(dt.date(), TZ).duracion(dt) == 90
+
+    settings.RESERVA_DURACION_MIN_NORM = 75
+    assert utils.reglas_duracion(dt.date(), TZ).duracion(dt) == 75
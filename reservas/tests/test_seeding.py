@@ -0,0 +1,28 @@
+import random
+
+from reservas.seeding import planear_dia
+
+
+def _duracion(minuto, party):
+    return 105 if 12 * 60 <= minuto < 15 * 60 else 90
+
+
+def test_planear_dia_sin_traslapes_y_dentro_de_horario():
+    agenda = planear_dia(random.Random("s:1:2025-01-01"), 4, 8 * 60, 22 * 60, _duracion,
+                         ocupacion=0.9, intervalo=15)
+
+    assert agenda
+    fin_anterior = 8 * 60
+    for inicio, dur, party in agenda:
+        assert inicio >= fin_anterior
+        assert inicio % 15 == 0
+        assert inicio + dur <= 22 * 60
+        assert dur == _duracion(inicio, party)
+        assert 1 <= party <= 4
+        fin_anterior = inicio + dur
+
+
+def test_planear_dia_determinista_por_semilla():
+    a = planear_dia(random.Random("7:3:2025-02-01"), 6, 480, 1320, _duracion)
+    b = planear_dia(random.Random("7:3:2025-02-01"), 6, 480, 1320, _duracion)
+    assert a == b
@@ -0,0 +1,34 @@
+from datetime import datetime, timezone as dt_tz
+from types import SimpleNamespace
+
+from reservas.models import Cliente, Mesa, Reserva, Sucursal
+from reservas.tarjeta import _construir, contacto_reserva
+from reservas.utils import booking_total_minutes
+
+
+def _reserva(nombre="", email="", tel="", cliente=None):
+    return SimpleNamespace(nombre_contacto=nombre, email_contacto=email, telefono_contacto=tel,
+                           cliente=cliente)
+
+
+def test_contacto_toma_primero_la_reserva():
+    cliente = SimpleNamespace(nombre="Cliente", email="c@x.mx", telefono="55", user=None)
+    c = contacto_reserva(_reserva(" Ana ", "ana@x.mx", "", cliente))
+    assert c == {"contacto_nombre": "Ana", "contacto_email": "ana@x.mx", "contacto_tel": "55"}
+
+
+def test_contacto_cae_al_usuario():
+    user = SimpleNamespace(first_name="Luis", last_name="Pérez", username="lp", email="lp@x.mx")
+    cliente = SimpleNamespace(nombre="", email="", telefono="", user=user)
+    c = contacto_reserva(_reserva(cliente=cliente))
+    assert c == {"contacto_nombre": "Luis Pérez", "contacto_email": "lp@x.mx", "contacto_tel": ""}
+
+
+def test_tarjeta_sin_fin_guardado_usa_la_duracion_de_la_reserva():
+    # Como las crea reservar / walk-in: solo 'fecha', sin fin_utc, local_fin ni ocupacion
+    r = Reserva(folio="R-20251021-A3F91C", fecha=datetime(2025, 10, 21, 19, 0, tzinfo=dt_tz.utc),
+                num_personas=2, estado=Reserva.CONF,
+                sucursal=Sucursal(nombre="Centro"), mesa=Mesa(numero=4), cliente=Cliente(nombre="Ana"))
+    t = _construir(r)
+    assert t["duracion_min"] == booking_total_minutes(r.fecha, 2) > 0
+    assert t["mesa"] == 4 and t["contacto_nombre"] == "Ana"
@@ -0,0 +1,55 @@
+from datetime import timedelta
+
+import pytest
+from django.utils import timezone
+
+from reservas import seeding
+from reservas.models import Reserva
+from reservas.utils import MesaOcupada, guardar_reserva_sin_traslape
+
+# Necesita PostgreSQL con btree_gist (exclusión reserva_sin_traslape_por_mesa, migración 0045)
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def mesa():
+    sucursal = seeding.asegurar_sucursales(1, 1)[0]
+    return sucursal.mesas.get()
+
+
+@pytest.fixture
+def cliente_id():
+    return seeding.asegurar_clientes(1)[0]
+
+
+def _reserva(mesa, cliente_id, inicio, estado=Reserva.CONF):
+    return Reserva(mesa=mesa, cliente_id=cliente_id, fecha=inicio, num_personas=2, estado=estado)
+
+
+def test_traslape_en_la_misma_mesa_es_mesa_ocupada(mesa, cliente_id):
+    inicio = (timezone.now() + timedelta(days=1)).replace(second=0, microsecond=0)
+    primera = guardar_reserva_sin_traslape(_reserva(mesa, cliente_id, inicio))
+
+    segunda = _reserva(mesa, cliente_id, inicio + timedelta(minutes=30))
+    with pytest.raises(MesaOcupada) as exc:
+        guardar_reserva_sin_traslape(segunda)
+
+    assert exc.value.mesa_id == mesa.pk
+    assert exc.value.disponible_desde == primera.ocupacion.upper
+    assert segunda.pk is None
+    assert Reserva.objects.filter(mesa=mesa).count() == 1
+
+
+def test_reactivar_cancelada_sobre_horario_tomado(mesa, cliente_id):
+    inicio = (timezone.now() + timedelta(days=1)).replace(second=0, microsecond=0)
+    cancelada = guardar_reserva_sin_traslape(_reserva(mesa, cliente_id, inicio))
+    cancelada.estado = Reserva.CANC
+    cancelada.save(update_fields=["estado"])
+    guardar_reserva_sin_traslape(_reserva(mesa, cliente_id, inicio))  # alguien tomó el horario
+
+    cancelada.estado = Reserva.PEND
+    with pytest.raises(MesaOcupada):
+        guardar_reserva_sin_traslape(cancelada, update_fields=["estado"])
+
+    cancelada.refresh_from_db()
+    assert cancelada.estado == Reserva.CANC
@@ -0,0 +1,47 @@
+from reservas import utils_time
+
+
+def test_resolve_tz_batch_deduplica_y_resuelve_offline(monkeypatch, settings):
+    settings.GOOGLE_TIMEZONE_API_KEY = ""
+    utils_time.cache.clear()
+
+    llamadas = []
+
+    def fake_fallback(lat, lng):
+        llamadas.append((lat, lng))
+        return "America/Mexico_City"
+
+    monkeypatch.setattr(utils_time, "_fallback_timezone", fake_fallback)
+
+    puntos = [(19.4326, -99.1332), (19.432600001, -99.1332), (None, 1.0)]
+    out = utils_time.resolve_tz_batch(puntos)
+
+    assert out == {(19.4326, -99.1332): "America/Mexico_City"}
+    assert llamadas == [(19.4326, -99.1332)]
+
+    # Segunda pasada: sale de caché, sin volver a resolver
+    utils_time.resolve_tz_batch(puntos)
+    assert len(llamadas) == 1
+
+
+def test_resolve_tz_batch_solo_http_para_no_resueltos(monkeypatch, settings):
+    settings.GOOGLE_TIMEZONE_API_KEY = "k"
+    utils_time.cache.clear()
+
+    monkeypatch.setattr(
+        utils_time, "_fallback_timezone",
+        lambda lat, lng: "America/Bogota" if lat > 0 else None,
+    )
+    http = []
+
+    def fake_google(lat, lng, ts, key):
+        http.append((lat, lng))
+        return "America/Argentina/Buenos_Aires"
+
+    monkeypatch.setattr(utils_time, "_google_timezone", fake_google)
+
+    out = utils_time.resolve_tz_batch([(4.71, -74.07), (-34.6, -58.38)])
+
+    assert out[(4.71, -74.07)] == "America/Bogota"
+    assert out[(-34.6, -58.38)] == "America/Argentina/Buenos_Aires"
+    assert http == [(-34.6, -58.38)]
@@ -0,0 +1,18 @@
+from types import SimpleNamespace
+
+from reservas.visibilidad import puede_ver_sucursal, sucursal_ids_visibles
+
+
+def test_anonimo_y_superuser_sin_consultas():
+    assert sucursal_ids_visibles(SimpleNamespace(is_authenticated=False)) == frozenset()
+    jefe = SimpleNamespace(is_authenticated=True, is_superuser=True)
+    assert sucursal_ids_visibles(jefe) is None
+    assert puede_ver_sucursal(jefe, 123)
+
+
+def test_pertenencia_usa_el_conjunto_memorizado_en_el_usuario():
+    u = SimpleNamespace(is_authenticated=True, is_superuser=False, pk=7,
+                        _sucursal_ids_visibles=frozenset({2, 3}))
+    assert puede_ver_sucursal(u, 2)
+    assert puede_ver_sucursal(u, SimpleNamespace(pk=3))
+    assert not puede_ver_sucursal(u, 4)
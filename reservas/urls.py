@@ -69,6 +69,7 @@ from .views_chainadmin import (
 )
 
 from .views_mesas_api import api_mesas_sucursal  # API mesas para mapa
+from .views_export import exportar_ordenes_csv, exportar_reservas_csv
 
 # Chain Global (roles por país)
 from .views_chain_global import (
@@ -135,6 +136,7 @@ urlpatterns = [
     # Mapa y mesas (vista protegida)
     path("staff/sucursal/<int:sucursal_id>/mapa/", AdminMapaSucursalView.as_view(), name="admin_mapa_sucursal"),
     path("staff/mesa/<int:mesa_id>/", views.admin_mesa_detalle, name="admin_mesa_detalle"),
+    path("staff/api/sucursal/<int:sucursal_id>/piso/", views.api_estado_piso, name="api_estado_piso"),
     path("staff/mesa/<int:mesa_id>/editar/", views.admin_mesa_editar, name="admin_editar_mesa"),
     path("staff/sucursal/<int:sucursal_id>/mesa/crear/", views.admin_mesa_crear, name="admin_mesa_crear"),
 
@@ -160,6 +162,8 @@ urlpatterns = [
 
     # Reservas staff
     path("staff/reservas/", views.admin_reservas, name="admin_reservas"),
+    path("staff/exportar/reservas.csv", exportar_reservas_csv, name="exportar_reservas_csv"),
+    path("staff/exportar/ordenes.csv", exportar_ordenes_csv, name="exportar_ordenes_csv"),
     path("staff/reservas/<int:reserva_id>/finalizar/", views.admin_finalizar_reserva, name="admin_finalizar_reserva"),
     path("staff/reservas/<int:reserva_id>/reasignar/", views.admin_reasignar_reserva, name="admin_reasignar_reserva"),
     path("staff/reserva/<int:reserva_id>/confirmar-llegada/", views.admin_confirmar_llegada, name="admin_confirmar_llegada"),
@@ -178,6 +182,8 @@ urlpatterns = [
     path("api/sucursales.json", SucursalesJsonView.as_view(), name="api_sucursales"),
     path("api/sucursales/nearby/", api_sucursales_nearby, name="api_sucursales_nearby"),
     path("api/sucursal/<int:sucursal_id>/slots/", views.api_slots_sucursal, name="api_slots_sucursal"),
+    path("api/sucursal/<int:sucursal_id>/calendario/", views.api_calendario_sucursal, name="api_calendario_sucursal"),
+    path("api/disponibilidad/buscar/", views.api_buscar_disponibilidad, name="api_buscar_disponibilidad"),
     path("api/reservas/create_from_local/", ReservaCreateFromLocalView.as_view(), name="api_reservas_create_from_local"),
 
     # Selector de país
@@ -186,6 +192,7 @@ urlpatterns = [
     # Health checks
     path("healthz/", views.healthz, name="healthz"),
     path("readyz/", views.readyz, name="readyz"),
+    path("metricz/", views.metricz, name="metricz"),
 
     # ===== ChainAdmin — Administradores =====
     path("chainadmin/admins/", ChainAdminAdminsListView.as_view(), name="chainadmin_admins"),
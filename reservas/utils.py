@@ -5,17 +5,27 @@ from typing import TYPE_CHECKING
 if TYPE_CHECKING:  # Solo para type hints; no se ejecuta en runtime
     from .models import Reserva, PerfilAdmin, Mesa  # noqa: F401
 
-import secrets
 from datetime import datetime, time, timedelta
 
 from django.conf import settings
 from django.utils import timezone
-from django.db import transaction  # si lo usas en otros helpers
-from django.db.models import Q
+from django.db import IntegrityError, transaction
+from django.db.models import (
+    Case, DateTimeField, DurationField, ExpressionWrapper, F, Func, Max, Q, Value, When,
+)
+from django.db.models.functions import Coalesce, Least
 from django.core.mail import send_mail  # si lo usas en notificaciones
 from django.shortcuts import get_object_or_404
 from django.contrib.auth import get_user_model
 
+from .calendario import (  # noqa: F401 (reexport)
+    calendario_global, calendario_sucursal, calendarios_sucursales, reglas_duracion,
+)
+from .folios import generar_folio  # noqa: F401 (reexport)
+from .ocupacion import (  # noqa: F401 (reexport)
+    invalidar_ocupacion, ocupacion_dia, ocupacion_para, ocupacion_rango,
+)
+
 
 # ---------------------------
 # Reglas de vigencia/bloqueo
@@ -81,35 +91,78 @@ def _puede_ver_sucursal(user, sucursal) -> bool:
 # ---------------------------
 # Disponibilidad / Choques
 # ---------------------------
-def conflicto_y_disponible(mesa, fecha):
+def _duracion_maxima_min(cal=None) -> int:
     """
-    Devuelve (hay_conflicto: bool, proxima_hora_disponible: datetime)
+    Cota superior de booking_total_minutes (pico + grupo grande) en el calendario dado
+    (default: settings); acota las búsquedas por fecha. RESERVA_DURACION_MAX_MIN la sube
+    si hay reservas más largas (API con dur_minutes).
+    """
+    cal = cal or calendario_global()
+    return max(cal.duracion_maxima, int(getattr(settings, "RESERVA_DURACION_MAX_MIN", 0) or 0))
 
-    Considera TODAS las reservas que solapan con el bloque [inicio, fin)
-    y, si hay choque, regresa como 'próxima disponible' el mayor fin de
-    todas ellas (no la primera), para que el mensaje sea correcto.
+
+def _fin_efectivo_expr(cal=None):
+    """
+    fin_efectivo() en SQL: upper(ocupacion) si está materializada; si no (filas legadas),
+    fecha + duración máxima por tamaño de grupo del calendario, recortada por liberada_en.
+    """
+    cal = cal or calendario_global()
+    pico = max(cal.dur_normal, cal.dur_pico)
+    fin_legado = ExpressionWrapper(
+        F("fecha") + Case(
+            When(num_personas__gte=5, then=Value(timedelta(minutes=pico + 15))),
+            default=Value(timedelta(minutes=pico)),
+            output_field=DurationField(),
+        ),
+        output_field=DateTimeField(),
+    )
+    return Coalesce(
+        Func(F("ocupacion"), function="upper", output_field=DateTimeField()),
+        Case(
+            When(liberada_en__gte=F("fecha"), then=Least(fin_legado, F("liberada_en"))),
+            default=fin_legado,
+            output_field=DateTimeField(),
+        ),
+        output_field=DateTimeField(),
+    )
+
+
+def reservas_en_conflicto(mesa, inicio_dt, fin_dt, exclude_reserva_id=None):
+    """
+    Reservas activas de la mesa que de verdad se traslapan con [inicio_dt, fin_dt).
+    Acota por el índice parcial reserva_activa_mesa_fecha a [inicio − duración máxima, fin)
+    y anota 'fin_ef' (fin efectivo) en SQL: la BD devuelve solo conflictos, sin recorrer el
+    historial.
     """
     from .models import Reserva  # import local evita ciclos
 
-    dur_min = int(getattr(settings, 'RESERVA_TOTAL_MINUTOS', 70))
-    dur = timedelta(minutes=dur_min)
+    cal = calendario_sucursal(getattr(mesa, "sucursal_id", None))
+    qs = (Reserva.objects.activas()
+          .filter(mesa=mesa,
+                  fecha__gte=inicio_dt - timedelta(minutes=_duracion_maxima_min(cal)),
+                  fecha__lt=fin_dt)
+          .annotate(fin_ef=_fin_efectivo_expr(cal))
+          .filter(fin_ef__gt=inicio_dt)
+          .order_by())
+    if exclude_reserva_id:
+        qs = qs.exclude(id=exclude_reserva_id)
+    return qs
 
-    inicio = fecha
-    fin = fecha + dur
 
-    # Un bloqueo (r) solapa si: r.fecha < fin  y  (r.fecha + dur) > inicio
-    qs = (Reserva.objects
-          .filter(mesa=mesa, estado__in=['PEND', 'CONF'])
-          .order_by('fecha'))
+def conflicto_y_disponible(mesa, fecha, party: int = 2):
+    """
+    Devuelve (hay_conflicto: bool, proxima_hora_disponible: datetime)
 
-    max_fin = None
-    for r in qs:
-        r_inicio = r.fecha
-        r_fin = r.fecha + dur
-        if r_inicio < fin and r_fin > inicio:  # hay solapamiento
-            if max_fin is None or r_fin > max_fin:
-                max_fin = r_fin
+    Considera TODAS las reservas que solapan con el bloque [inicio, fin)
+    y, si hay choque, regresa como 'próxima disponible' el mayor fin de
+    todas ellas (no la primera), para que el mensaje sea correcto.
+    Una sola query acotada por fecha (ver reservas_en_conflicto).
+    """
+    inicio = fecha
+    dur_min = booking_total_minutes(fecha, party, sucursal=getattr(mesa, "sucursal_id", None))
+    fin = fecha + timedelta(minutes=dur_min)
 
+    max_fin = reservas_en_conflicto(mesa, inicio, fin).aggregate(m=Max("fin_ef"))["m"]
     if max_fin:
         # hay conflicto: la próxima hora disponible es cuando termine el último solape
         return True, max_fin
@@ -118,6 +171,73 @@ def conflicto_y_disponible(mesa, fecha):
     return False, fecha
 
 
+# ---------------------------
+# Exclusión de traslapes en BD (Reserva.ocupacion)
+# ---------------------------
+class MesaOcupada(Exception):
+    """La BD rechazó la reserva por traslape; disponible_desde = próximo inicio libre."""
+
+    def __init__(self, mesa_id, disponible_desde=None):
+        self.mesa_id = mesa_id
+        self.disponible_desde = disponible_desde
+        super().__init__(f"Mesa {mesa_id} ocupada; disponible desde {disponible_desde}")
+
+
+def es_traslape(exc) -> bool:
+    """True si el IntegrityError viene de la exclusión reserva_sin_traslape_por_mesa."""
+    from .models import Reserva  # import local evita ciclos
+
+    diag = getattr(getattr(exc, "__cause__", None), "diag", None)
+    nombre = getattr(diag, "constraint_name", None)
+    return nombre == Reserva.CONSTRAINT_TRASLAPE or Reserva.CONSTRAINT_TRASLAPE in str(exc)
+
+
+def siguiente_disponible(mesa_id, inicio_dt, fin_dt, exclude_reserva_id=None):
+    """
+    Primer instante >= inicio_dt en el que cabe [t, t + (fin_dt - inicio_dt)) en la mesa
+    sin chocar con reservas activas. Recorre los rangos materializados del día en orden.
+    """
+    from .models import Reserva  # import local evita ciclos
+
+    dur = fin_dt - inicio_dt
+    qs = (Reserva.objects.activas()
+          .filter(mesa_id=mesa_id,
+                  ocupacion__endswith__gt=inicio_dt,
+                  ocupacion__startswith__lt=inicio_dt + timedelta(days=1))
+          .order_by("ocupacion"))
+    if exclude_reserva_id:
+        qs = qs.exclude(id=exclude_reserva_id)
+
+    t = inicio_dt
+    for rango in qs.values_list("ocupacion", flat=True):
+        if rango.isempty:
+            continue
+        if rango.lower >= t + dur:
+            break
+        if rango.upper > t:
+            t = rango.upper
+    return t
+
+
+def guardar_reserva_sin_traslape(reserva, **save_kwargs):
+    """
+    Intenta el INSERT/UPDATE directo (sin lock de mesa); si la exclusión de BD lo
+    rechaza, lanza MesaOcupada con la próxima hora disponible de esa mesa.
+    """
+    try:
+        with transaction.atomic():
+            reserva.save(**save_kwargs)
+    except IntegrityError as e:
+        if not es_traslape(e):
+            raise
+        rango = reserva.ocupacion
+        raise MesaOcupada(
+            reserva.mesa_id,
+            siguiente_disponible(reserva.mesa_id, rango.lower, rango.upper, exclude_reserva_id=reserva.pk),
+        ) from e
+    return reserva
+
+
 # ---------------------------
 # Auto-cancelación por tolerancia
 # ---------------------------
@@ -152,8 +272,8 @@ def _bloques_ocupados_mesa(mesa, dt_date):
     from .models import Reserva  # import local evita ciclos
 
     start_day, end_day = _local_date_range(dt_date)
-    qs = (Reserva.objects
-          .filter(mesa=mesa, estado__in=['PEND', 'CONF'],
+    qs = (Reserva.objects.activas()
+          .filter(mesa=mesa,
                   fecha__gte=start_day, fecha__lt=end_day)
           .order_by('fecha'))
 
@@ -176,33 +296,27 @@ def _ceil_to_step(dt: datetime, step_min: int) -> datetime:
     return dt
 
 
-def _slots_disponibles(mesa, fecha_d):
+def _slots_disponibles(mesa, fecha_d, party=2, ocupacion=None):
     """
     Genera datetimes (aware) de inicio posibles para 'fecha_d' en la mesa dada.
     Filtra:
-      - fuera de apertura/cierre
+      - fuera del horario de la sucursal ese día (con la duración dinámica del slot)
       - en el pasado (si fecha_d es hoy, con buffer y redondeo)
-      - solapes con PEND/CONF
-    """
-    from .models import Reserva  # import local evita ciclos
-
-    tz = timezone.get_current_timezone()
-    dur_min = int(getattr(settings, "RESERVA_TOTAL_MINUTOS", 70))
-    paso_min = int(getattr(settings, "RESERVA_PASO_MINUTOS", 15))
+      - solapes con PEND/CONF (fin efectivo, respeta liberada_en) y bloqueos
+    Horario, paso y duraciones salen del calendario compilado de la sucursal; los choques,
+    del mapa de ocupación del día (ocupacion_dia). Quien recorre varias mesas de la misma
+    sucursal puede pasar 'ocupacion' ya cargada.
+    """
+    cal = calendario_sucursal(mesa.sucursal_id)
+    jornada = cal.jornada_dt(fecha_d)
+    if jornada is None:
+        return []  # la sucursal no abre ese día
+    inicio_jornada, fin_jornada = jornada
+
+    tz = cal.tz
+    paso_min = cal.paso_min
     buffer_min = int(getattr(settings, "RESERVA_BUFFER_MINUTOS", 10))
 
-    # Horario del local
-    apertura_h = int(getattr(settings, "HORARIO_APERTURA", 8))
-    cierre_h = int(getattr(settings, "HORARIO_CIERRE", 22))
-
-    inicio_jornada = timezone.make_aware(datetime.combine(fecha_d, time(apertura_h, 0)), tz)
-    fin_jornada = timezone.make_aware(datetime.combine(fecha_d, time(cierre_h, 0)), tz)
-
-    # No podemos arrancar una reserva que termine después de cerrar
-    fin_slot_max_inicio = fin_jornada - timedelta(minutes=dur_min)
-    if inicio_jornada > fin_slot_max_inicio:
-        return []  # no caben reservas ese día
-
     # Si es HOY, arrancamos desde ahora + buffer, redondeado al paso
     ahora = timezone.now().astimezone(tz)
     if fecha_d == ahora.date():
@@ -211,28 +325,21 @@ def _slots_disponibles(mesa, fecha_d):
     else:
         inicio = inicio_jornada
 
+    reglas = cal.reglas(fecha_d)
+    duraciones = reglas.dur_grande if int(party or 2) >= 5 else reglas.dur_normal
+    ocupacion = ocupacion or ocupacion_dia(mesa.sucursal_id, fecha_d)
+
     # Iteramos slots
     slots = []
     cursor = inicio
-    dur_td = timedelta(minutes=dur_min)
-
-    while cursor <= fin_slot_max_inicio:
-        slot_fin = cursor + dur_td
-
-        # ¿Se solapa con alguna reserva existente?
-        qs = Reserva.objects.filter(
-            mesa=mesa,
-            estado__in=["PEND", "CONF"],
-            fecha__lt=slot_fin,  # comienzan antes de que termine este slot
-        ).order_by("fecha")
-
-        solapa = False
-        for r in qs:
-            if (r.fecha + dur_td) > cursor:
-                solapa = True
-                break
-
-        if not solapa:
+    while cursor < fin_jornada:
+        slot_fin = cursor + timedelta(minutes=duraciones[cursor.hour * 60 + cursor.minute])
+        # No podemos arrancar una reserva que termine después de cerrar
+        if slot_fin > fin_jornada:
+            break
+
+        # ¿Se solapa con alguna reserva o bloqueo?
+        if ocupacion.libre(mesa.id, cursor, slot_fin):
             slots.append(cursor)
 
         cursor += timedelta(minutes=paso_min)
@@ -240,21 +347,157 @@ def _slots_disponibles(mesa, fecha_d):
     return slots
 
 
-def _esta_en_horas_pico(dt_local):
-    for h_ini, h_fin in getattr(settings, "HORAS_PICO", []):
-        if h_ini <= dt_local.hour < h_fin:
-            return True
-    return False
+def _inicios_libres(cal, ocupacion, mesa_ids, party, ahora, desde=None, hasta=None):
+    """
+    Genera, en orden, los inicios (aware, TZ de la sucursal) del día de 'ocupacion' en que
+    al menos una de mesa_ids está libre, con las mismas reglas que _slots_disponibles:
+    dentro de la jornada, desde ahora + RESERVA_BUFFER_MINUTOS redondeado al paso y,
+    si se indican, entre desde y hasta.
+    """
+    jornada = cal.jornada_dt(ocupacion.dia) if mesa_ids else None
+    if jornada is None:
+        return
+    cursor, fin_jornada = jornada
+    paso = cal.paso_min
+    buffer_min = int(getattr(settings, "RESERVA_BUFFER_MINUTOS", 10))
+    cursor = max(cursor, _ceil_to_step(ahora.astimezone(cal.tz) + timedelta(minutes=buffer_min), paso))
+    if desde is not None:
+        cursor = max(cursor, _ceil_to_step(desde, paso))
+    limite = fin_jornada if hasta is None else min(fin_jornada, hasta)
+
+    reglas = cal.reglas(ocupacion.dia)
+    duraciones = reglas.dur_grande if int(party or 2) >= 5 else reglas.dur_normal
+    while cursor <= limite:
+        slot_fin = cursor + timedelta(minutes=duraciones[cursor.hour * 60 + cursor.minute])
+        # No podemos arrancar una reserva que termine después de cerrar
+        if slot_fin > fin_jornada:
+            break
+        if ocupacion.alguna_libre(mesa_ids, cursor, slot_fin):
+            yield cursor
+        cursor += timedelta(minutes=paso)
+
+
+def _mesas_por_sucursal(sids, party):
+    from .models import Mesa  # import local evita ciclos
+
+    mesas = {}
+    for sid, mid in (Mesa.objects.filter(sucursal_id__in=list(sids), capacidad__gte=int(party or 2))
+                     .order_by("id").values_list("sucursal_id", "id")):
+        mesas.setdefault(sid, []).append(mid)
+    return mesas
+
+
+def resumen_disponibilidad(sucursal, desde, dias: int, party=2):
+    """
+    Resumen por día de la UNIÓN de mesas (capacidad >= party), con las mismas reglas que
+    _slots_disponibles: [{"fecha", "primero", "ultimo", "libres"}, ...], primero/ultimo
+    como datetimes aware (None si no hay lugar).
+    Una pasada para todo el rango: 1 query de mesas + ocupacion_rango (caché o 2 queries).
+    """
+    sid = getattr(sucursal, "pk", sucursal)
+    cal = calendario_sucursal(sid)
+    mesa_ids = _mesas_por_sucursal([sid], party).get(sid, [])
+    ahora = timezone.now()
 
+    out = []
+    for ocupacion in ocupacion_rango(sid, desde, dias):
+        libres = list(_inicios_libres(cal, ocupacion, mesa_ids, party, ahora))
+        out.append({
+            "fecha": ocupacion.dia,
+            "primero": libres[0] if libres else None,
+            "ultimo": libres[-1] if libres else None,
+            "libres": len(libres),
+        })
+    return out
+
+
+def proximos_libres_sucursales(sucursales, fecha=None, hora=None, party=2, n=3):
+    """
+    Búsqueda multi-sucursal: hasta n inicios libres (unión de mesas con capacidad >= party)
+    más cercanos a fecha+hora en la TZ de cada sucursal, dentro de ±BUSQUEDA_VENTANA_MIN.
+    Sin fecha se busca alrededor de "ahora" local; sin hora, a las 19:00.
+    Devuelve {sucursal_id: [(inicio_dt, distancia_min), ...]} en orden cronológico.
+    Una sola pasada para todas: calendarios_sucursales, 1 query de mesas y ocupacion_dias
+    (caché o 2 queries).
+    """
+    from .ocupacion import ocupacion_dias
+
+    sids = [getattr(s, "pk", s) for s in sucursales]
+    if not sids:
+        return {}
+    cals = calendarios_sucursales(sids)
+    mesas = _mesas_por_sucursal(sids, party)
+    ventana = timedelta(minutes=int(getattr(settings, "BUSQUEDA_VENTANA_MIN", 120)))
+    ahora = timezone.now()
+
+    objetivos = {}
+    for sid in sids:
+        tz = cals[sid].tz
+        if fecha is not None:
+            objetivos[sid] = timezone.make_aware(datetime.combine(fecha, hora or time(19, 0)), tz)
+        else:
+            objetivos[sid] = ahora.astimezone(tz)
+    mapas = ocupacion_dias([(sid, objetivos[sid].date()) for sid in sids if sid in mesas])
+
+    out = {}
+    for sid in sids:
+        objetivo = objetivos[sid]
+        if sid not in mesas:
+            out[sid] = []
+            continue
+        candidatos = [
+            (dt, abs((dt - objetivo).total_seconds()) / 60)
+            for dt in _inicios_libres(cals[sid], mapas[(sid, objetivo.date())], mesas[sid], party,
+                                      ahora, desde=objetivo - ventana, hasta=objetivo + ventana)
+        ]
+        candidatos.sort(key=lambda c: (c[1], c[0]))
+        out[sid] = sorted(candidatos[:n])
+    return out
+
+
+def siguientes_libres_sucursales(sucursales, party=2, n=5, dias=2):
+    """
+    Los siguientes n inicios libres desde ahora (unión de mesas con capacidad >= party) de
+    cada sucursal, mirando hasta 'dias' días locales. {sucursal_id: [inicio_dt, ...]}.
+    Misma pasada por lotes que proximos_libres_sucursales.
+    """
+    from itertools import islice
+    from .ocupacion import ocupacion_dias
+
+    sids = [getattr(s, "pk", s) for s in sucursales]
+    if not sids:
+        return {}
+    cals = calendarios_sucursales(sids)
+    mesas = _mesas_por_sucursal(sids, party)
+    ahora = timezone.now()
 
-def anticipacion_minima_para(dt_local):
+    dias_por_sucursal = {}
+    for sid in sids:
+        hoy = ahora.astimezone(cals[sid].tz).date()
+        dias_por_sucursal[sid] = [hoy + timedelta(days=i) for i in range(max(1, int(dias)))]
+    mapas = ocupacion_dias([(sid, d) for sid in sids if sid in mesas for d in dias_por_sucursal[sid]])
+
+    out = {}
+    for sid in sids:
+        libres = []
+        for d in dias_por_sucursal[sid] if sid in mesas else ():
+            libres += islice(_inicios_libres(cals[sid], mapas[(sid, d)], mesas[sid], party, ahora),
+                             n - len(libres))
+            if len(libres) >= n:
+                break
+        out[sid] = libres
+    return out
+
+
+def anticipacion_minima_para(dt_local, sucursal=None):
     """
     dt_local: datetime aware en la TZ local del restaurante.
-    Devuelve los minutos de anticipación requeridos para esa hora.
+    Devuelve los minutos de anticipación requeridos para esa hora
+    (del calendario de la sucursal si se indica).
     """
-    base = int(getattr(settings, "RESERVA_ANTICIPACION_MIN", 20))
-    pico = int(getattr(settings, "RESERVA_ANTICIPACION_MIN_PICO", base))
-    return pico if _esta_en_horas_pico(dt_local) else base
+    if sucursal is not None:
+        return calendario_sucursal(sucursal).anticipacion(dt_local)
+    return calendario_global(dt_local.tzinfo or timezone.get_current_timezone()).anticipacion(dt_local)
 
 
 def _auto_cancel_por_tolerancia(minutos: int = 6) -> int:
@@ -263,54 +506,45 @@ def _auto_cancel_por_tolerancia(minutos: int = 6) -> int:
     Evita select_for_update para poder invocarse desde cualquier vista.
     """
     from .models import Reserva  # import local evita ciclos
+    from .tarjeta import invalidar_tarjeta  # import local evita ciclos
 
     ahora = timezone.now()
     limite = ahora - timezone.timedelta(minutes=minutos)
-    return (
-        Reserva.objects
-        .filter(estado="PEND", fecha__lte=limite)
-        .update(estado="CANC")
-    )
-
-
-def generar_folio(reserva) -> str:
-    """
-    R-YYYYMMDD-ABC123 basado en la fecha local de la reserva.
-    """
-    f = reserva.fecha.astimezone(timezone.get_current_timezone())
-    suf = secrets.token_hex(3).upper()  # 6 chars
-    return f"R-{f:%Y%m%d}-{suf}"
-
-
-def _is_peak(dt):
-    """True si la hora local cae en horas pico o fin de semana (sáb/dom)."""
+    vencidas = Reserva.objects.filter(estado="PEND", fecha__lte=limite)
+    # update() no dispara señales: se avisa al mapa de ocupación de cada sucursal tocada y
+    # se borra la tarjeta de cada folio. Solo se cancelan las filas leídas aquí.
+    filas = list(vencidas.order_by().values_list("pk", "sucursal_id", "folio"))
+    if not filas:
+        return 0
+    n = vencidas.filter(pk__in=[pk for pk, _, _ in filas]).update(estado="CANC")
+    for sid in {sid for _, sid, _ in filas}:
+        invalidar_ocupacion(sid)
+    for _, _, folio in filas:
+        invalidar_tarjeta(folio)
+    return n
+
+
+def _is_peak(dt, sucursal=None):
+    """True si la hora local cae en ventana pico o fin de semana (sáb/dom)."""
+    if sucursal is not None:
+        return calendario_sucursal(sucursal).es_pico(dt)
     tz = timezone.get_current_timezone()
-    loc = dt.astimezone(tz)
-    for h1, h2 in getattr(settings, "HORAS_PICO", []):
-        if h1 <= loc.hour < h2:
-            return True
-    if loc.weekday() in (5, 6):  # 5=sábado, 6=domingo
-        return True
-    return False
+    return calendario_global(tz).es_pico(dt)
 
 
-def booking_total_minutes(dt, party=2):
+def booking_total_minutes(dt, party=2, sucursal=None):
     """
     Minutos de ocupación de mesa (orden, comer, pago, limpieza).
-    90 min normal, 105 min pico; +15 min si grupo ≥ 5 (ajustable por settings).
-    Requiere en settings:
+    90 min normal, 105 min pico; +15 min si grupo ≥ 5.
+    Con 'sucursal' (instancia o id) usa su calendario (TZ, duraciones y ventanas pico);
+    sin ella, settings en la TZ actual:
       RESERVA_DURACION_MIN_NORM
       RESERVA_DURACION_MIN_PICO
+    En loops calientes conviene tomar calendario.reglas(dia) una vez.
     """
-    base = getattr(
-        settings,
-        "RESERVA_DURACION_MIN_PICO" if _is_peak(dt) else "RESERVA_DURACION_MIN_NORM",
-        90 if not _is_peak(dt) else 105,
-    )
-    base = int(base)
-    if int(party or 2) >= 5:
-        base += 15
-    return base
+    if sucursal is not None:
+        return calendario_sucursal(sucursal).duracion(dt, party)
+    return calendario_global(timezone.get_current_timezone()).duracion(dt, party)
 
 
 def _aware_or_now(dt):
@@ -361,55 +595,191 @@ def checa_choque_reserva_o_bloqueo(mesa, inicio_dt, fin_dt, party: int, exclude_
     True si EXISTE conflicto (reserva o bloqueo).
     Ahora permite excluir una reserva (útil al moverla de mesa).
     """
-    from .models import Reserva, BloqueoMesa  # import local evita ciclos
+    from .models import BloqueoMesa  # import local evita ciclos
 
-    res_qs = (Reserva.objects
-              .filter(mesa=mesa, estado__in=["PEND", "CONF"])
-              .only("id", "fecha", "num_personas", "liberada_en"))
-    if exclude_reserva_id:
-        res_qs = res_qs.exclude(id=exclude_reserva_id)
-
-    for r in res_qs:
-        r_ini = r.fecha
-        r_fin = r.fin_efectivo(getattr(r, "num_personas", party) or party)
-        if r_ini < fin_dt and r_fin > inicio_dt:
-            return True
+    if reservas_en_conflicto(mesa, inicio_dt, fin_dt, exclude_reserva_id).exists():
+        return True
 
     bloq_qs = (BloqueoMesa.objects
-               .filter(sucursal=mesa.sucursal)
+               .filter(sucursal_id=mesa.sucursal_id)
                .filter(Q(mesa__isnull=True) | Q(mesa=mesa))
                .filter(inicio__lt=fin_dt, fin__gt=inicio_dt))
     return bloq_qs.exists()
 
 
-def asignar_mesa_automatica(sucursal, inicio_dt, party: int):
+def ocupacion_sucursal(sucursal, desde, hasta, mesa_ids=None, exclude_reserva_id=None):
     """
-    Devuelve una mesa “mínima suficiente” respetando protección/waste,
-    sin choques. None si no hay.
+    Intervalos ocupados [ini, fin) de la sucursal que tocan [desde, hasta), en 2 queries
+    (reservas activas + bloqueos) sin importar cuántas mesas haya.
+    Devuelve {mesa_id: [(ini, fin), ...]}; la llave None son bloqueos de toda la sucursal.
     """
-    from .models import Mesa  # import local evita ciclos
+    sid = getattr(sucursal, "pk", sucursal)
+    return ocupacion_sucursales([sid], desde, hasta, mesa_ids=mesa_ids,
+                                exclude_reserva_id=exclude_reserva_id).get(sid, {})
 
-    party = int(party or 2)
-    dur_min = booking_total_minutes(inicio_dt, party)
-    fin_dt = inicio_dt + timedelta(minutes=dur_min)
+
+def ocupacion_sucursales(sucursal_ids, desde, hasta, mesa_ids=None, exclude_reserva_id=None):
+    """
+    Igual que ocupacion_sucursal() para varias sucursales con las mismas 2 queries.
+    Devuelve {sucursal_id: {mesa_id | None: [(ini, fin), ...]}}.
+    """
+    from django.db.backends.postgresql.psycopg_any import DateTimeTZRange
+    from .models import Reserva, BloqueoMesa  # import local evita ciclos
+
+    sids = list(sucursal_ids)
+    ocupado = {sid: {} for sid in sids}
+    if not sids:
+        return ocupado
+    cals = calendarios_sucursales(sids)
+    atras = max(_duracion_maxima_min(c) for c in cals.values())
+
+    res_qs = Reserva.objects.activas()
+    res_qs = (res_qs.filter(mesa_id__in=list(mesa_ids)) if mesa_ids is not None
+              else res_qs.filter(sucursal_id__in=sids))
+    if exclude_reserva_id:
+        res_qs = res_qs.exclude(id=exclude_reserva_id)
+    # 'ocupacion' materializada (índice GiST de la exclusión); las filas legadas sin rango
+    # se acotan por fecha y se calculan como fin_efectivo()
+    res_qs = res_qs.filter(
+        Q(ocupacion__overlap=DateTimeTZRange(desde, hasta, "[)"))
+        | Q(ocupacion__isnull=True,
+            fecha__lt=hasta, fecha__gte=desde - timedelta(minutes=atras))
+    )
+    for sid, mesa_id, rango, fecha, num, lib in res_qs.values_list(
+            "sucursal_id", "mesa_id", "ocupacion", "fecha", "num_personas", "liberada_en"):
+        if sid not in ocupado:
+            continue
+        if rango is not None:
+            if rango.isempty:
+                continue
+            ini, fin = rango.lower, rango.upper
+        else:
+            ini = fecha
+            fin = fecha + timedelta(minutes=cals[sid].duracion(fecha, num or 2))
+            if lib and lib >= ini:
+                fin = min(fin, lib)
+        if ini < hasta and fin > desde:
+            ocupado[sid].setdefault(mesa_id, []).append((ini, fin))
+
+    for sid, mesa_id, ini, fin in (BloqueoMesa.objects
+                                   .filter(sucursal_id__in=sids, inicio__lt=hasta, fin__gt=desde)
+                                   .values_list("sucursal_id", "mesa_id", "inicio", "fin")):
+        ocupado[sid].setdefault(mesa_id, []).append((ini, fin))
+
+    return ocupado
+
+
+def _mesa_libre(ocupado, mesa_id, inicio_dt, fin_dt) -> bool:
+    for ini, fin in ocupado.get(mesa_id, ()):
+        if ini < fin_dt and fin > inicio_dt:
+            return False
+    for ini, fin in ocupado.get(None, ()):
+        if ini < fin_dt and fin > inicio_dt:
+            return False
+    return True
+
+
+def _mesas_candidatas(sucursal, party_min: int, excluir_ids=()):
+    from .models import Mesa  # import local evita ciclos
 
     mesas = (Mesa.objects
-             .filter(sucursal=sucursal, capacidad__gte=party)
+             .filter(sucursal=sucursal, capacidad__gte=party_min)
              .order_by("capacidad", "numero", "id"))
 
     # Opcional: evita mesas bloqueadas si tu modelo tiene ese campo
     if hasattr(Mesa, "bloqueada"):
         mesas = mesas.filter(Q(bloqueada=False) | Q(bloqueada__isnull=True))
+    if excluir_ids:
+        mesas = mesas.exclude(id__in=list(excluir_ids))
+    return list(mesas)
+
 
+def _mejor_mesa(mesas, libre, inicio_dt, fin_dt, party: int):
+    """
+    Primera mesa (ya ordenada por capacidad) elegible y libre = mínima suficiente.
+    libre(mesa_id, inicio_dt, fin_dt) -> bool.
+    """
     for m in mesas:
-        if not mesa_elegible_para_party(m, party, inicio_dt):
+        if m.capacidad < party or not mesa_elegible_para_party(m, party, inicio_dt):
             continue
-        # chequea en vivo si hay conflicto
-        if not checa_choque_reserva_o_bloqueo(m, inicio_dt, fin_dt, party):
+        if libre(m.id, inicio_dt, fin_dt):
             return m
     return None
 
 
+def asignar_mesa_automatica(sucursal, inicio_dt, party: int, excluir_ids=()):
+    """
+    Devuelve una mesa “mínima suficiente” respetando protección/waste,
+    sin choques. None si no hay. excluir_ids: mesas ya intentadas (reintento tras traslape).
+    Costo fijo: 1 query (mesas) + el mapa de ocupación del día, que sale del caché
+    (o se reconstruye con 2 queries tras una escritura en la sucursal).
+    """
+    party = int(party or 2)
+    dur_min = booking_total_minutes(inicio_dt, party, sucursal=sucursal)
+    fin_dt = inicio_dt + timedelta(minutes=dur_min)
+
+    mesas = _mesas_candidatas(sucursal, party, excluir_ids)
+    if not mesas:
+        return None
+    return _mejor_mesa(mesas, ocupacion_para(sucursal, inicio_dt).libre, inicio_dt, fin_dt, party)
+
+
+def asignar_mesas_en_lote(sucursal, solicitudes):
+    """
+    Asigna muchas solicitudes a la vez (p. ej. fila de walk-ins), en el orden recibido.
+    solicitudes: iterable de (inicio_dt, party).
+    Devuelve [(mesa | None, inicio_dt, fin_dt), ...] alineado con la entrada; no guarda nada.
+    Cada asignación ocupa su intervalo en memoria para las siguientes, así que el lote
+    nunca se asigna a sí mismo la misma mesa en horarios traslapados.
+    """
+    cal = calendario_sucursal(sucursal)
+    pedidos = []
+    for inicio_dt, party in solicitudes:
+        party = int(party or 2)
+        fin_dt = inicio_dt + timedelta(minutes=cal.duracion(inicio_dt, party))
+        pedidos.append((inicio_dt, fin_dt, party))
+    if not pedidos:
+        return []
+
+    mesas = _mesas_candidatas(sucursal, min(p for _, _, p in pedidos))
+    desde = min(i for i, _, _ in pedidos)
+    hasta = max(f for _, f, _ in pedidos)
+    ocupado = ocupacion_sucursal(sucursal, desde, hasta, mesa_ids=[m.id for m in mesas]) if mesas else {}
+
+    def libre(mesa_id, ini, fin):
+        return _mesa_libre(ocupado, mesa_id, ini, fin)
+
+    out = []
+    for inicio_dt, fin_dt, party in pedidos:
+        mesa = _mejor_mesa(mesas, libre, inicio_dt, fin_dt, party)
+        if mesa is not None:
+            ocupado.setdefault(mesa.id, []).append((inicio_dt, fin_dt))
+        out.append((mesa, inicio_dt, fin_dt))
+    return out
+
+
+def crear_reserva_autoasignada(sucursal, inicio_dt, party: int, construir, reintentos=None):
+    """
+    Autoasigna mesa e inserta sin lock; si la exclusión de BD rechaza la mesa (otra
+    petición la ganó) reintenta con la siguiente candidata.
+    construir(mesa) -> Reserva sin guardar.
+    Devuelve (reserva | None, siguiente_disponible | None).
+    """
+    reintentos = int(reintentos or getattr(settings, "RESERVA_AUTO_REINTENTOS", 3))
+    intentadas, siguiente = [], None
+    for _ in range(reintentos):
+        mesa = asignar_mesa_automatica(sucursal, inicio_dt, party, excluir_ids=intentadas)
+        if mesa is None:
+            break
+        try:
+            return guardar_reserva_sin_traslape(construir(mesa)), None
+        except MesaOcupada as e:
+            intentadas.append(mesa.id)
+            if siguiente is None or e.disponible_desde < siguiente:
+                siguiente = e.disponible_desde
+    return None, siguiente
+
+
 def mesas_disponibles_para_reserva(reserva, forzar: bool = False):
     """
     Devuelve lista de mesas candidatas ordenadas por:
@@ -421,27 +791,25 @@ def mesas_disponibles_para_reserva(reserva, forzar: bool = False):
 
     party = int(getattr(reserva, "num_personas", 2) or 2)
     inicio = reserva.fecha
-    dur_min = booking_total_minutes(inicio, party)
+    dur_min = booking_total_minutes(inicio, party, sucursal=reserva.sucursal_id)
     fin = inicio + timedelta(minutes=dur_min)
 
     big_cap = int(getattr(settings, "BIG_CAP", 8))
     waste_max = int(getattr(settings, "WASTE_MAX", 3))
 
-    mesas = (Mesa.objects
-             .filter(sucursal=reserva.mesa.sucursal, capacidad__gte=party)
-             .order_by("capacidad", "numero", "id"))
+    mesas = list(Mesa.objects
+                 .filter(sucursal_id=reserva.sucursal_id, capacidad__gte=party)
+                 .order_by("capacidad", "numero", "id"))
+    # Choques de todas las mesas en una sola lectura (excluyendo la propia reserva al mover)
+    ocupado = ocupacion_sucursal(reserva.sucursal, inicio, fin,
+                                 mesa_ids=[m.id for m in mesas], exclude_reserva_id=reserva.id)
 
     cands = []
     for m in mesas:
         # Elegibilidad por protección/waste (si no es forzado)
         if not forzar and not mesa_elegible_para_party(m, party, inicio):
             continue
-
-        # Choques (excluyendo la propia reserva al mover)
-        hay_conflicto = checa_choque_reserva_o_bloqueo(
-            m, inicio, fin, party, exclude_reserva_id=reserva.id
-        )
-        if hay_conflicto:
+        if not _mesa_libre(ocupado, m.id, inicio, fin):
             continue
 
         waste = int(m.capacidad) - party
@@ -454,12 +822,14 @@ def mesas_disponibles_para_reserva(reserva, forzar: bool = False):
 def mover_reserva(reserva, nueva_mesa, forzar: bool = False):
     """
     Intenta mover la reserva a 'nueva_mesa'.
-    Valida protección/waste/choques (a menos que forzar=True).
+    Valida protección/waste (a menos que forzar=True) y choques; forzar no salta la
+    exclusión de BD: una mesa ocupada (o ganada por otro entre el chequeo y el UPDATE)
+    regresa (False, motivo) en vez de IntegrityError.
     Retorna (ok: bool, motivo: str).
     """
     party = int(getattr(reserva, "num_personas", 2) or 2)
     inicio = reserva.fecha
-    dur_min = booking_total_minutes(inicio, party)
+    dur_min = booking_total_minutes(inicio, party, sucursal=nueva_mesa.sucursal_id)
     fin = inicio + timedelta(minutes=dur_min)
 
     if not forzar and not mesa_elegible_para_party(nueva_mesa, party, inicio):
@@ -471,8 +841,17 @@ def mover_reserva(reserva, nueva_mesa, forzar: bool = False):
         return False, "La mesa tiene un conflicto en ese horario."
 
     # OK: mover
+    mesa_anterior = reserva.mesa
     reserva.mesa = nueva_mesa
-    reserva.save(update_fields=["mesa"])
+    try:
+        guardar_reserva_sin_traslape(reserva, update_fields=["mesa"])
+    except MesaOcupada as e:
+        reserva.mesa = mesa_anterior
+        reserva.sucursal_id = mesa_anterior.sucursal_id
+        if e.disponible_desde:
+            hora = timezone.localtime(e.disponible_desde, nueva_mesa.sucursal.tz()).strftime("%H:%M")
+            return False, f"La mesa está ocupada en ese horario; disponible desde las {hora}."
+        return False, "La mesa está ocupada en ese horario."
     return True, "Reserva reasignada correctamente."
 
 
@@ -492,14 +871,13 @@ def sucursales_visibles_qs(user, Sucursal):
     """
     QS de sucursales que el usuario puede ver.
     - Dueño de cadena → todas
-    - Staff normal   → solo donde es administrador
+    - Staff normal   → sus sucursales (M2M, asignada, países; reservas/visibilidad.py)
     - Otros          → vacío
     """
-    if not user.is_authenticated:
-        return Sucursal.objects.none()
-    if is_chain_owner(user):
-        return Sucursal.objects.all()
-    return Sucursal.objects.filter(administradores=user).distinct()
+    from .visibilidad import sucursal_ids_visibles  # import local evita ciclos
+
+    ids = sucursal_ids_visibles(user)
+    return Sucursal.objects.all() if ids is None else Sucursal.objects.filter(pk__in=ids)
 
 
 def get_visible_object_or_404(user, model, **lookup):
@@ -515,9 +893,9 @@ def get_visible_object_or_404(user, model, **lookup):
         qs = sucursales_visibles_qs(user, Sucursal)
     else:
         # Asumimos que el model tiene FK 'sucursal'
-        if is_chain_owner(user):
-            qs = model.objects.all()
-        else:
-            qs = model.objects.filter(sucursal__administradores=user)
+        from .visibilidad import sucursal_ids_visibles  # import local evita ciclos
+
+        ids = sucursal_ids_visibles(user)
+        qs = model.objects.all() if ids is None else model.objects.filter(sucursal_id__in=ids)
 
     return get_object_or_404(qs, **lookup)
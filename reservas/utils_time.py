@@ -1,27 +1,77 @@
 # reservas/utils_time.py
 from __future__ import annotations
+import threading
 import time
-from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Optional, Tuple
 from django.conf import settings
 from django.core.cache import cache
 from .http_client import session
 
 GOOGLE_TZ_ENDPOINT = "https://maps.googleapis.com/maps/api/timezone/json"
+TZ_CACHE_TTL = 60 * 60 * 24 * 30  # 30d
+
+# Instancia única de TimezoneFinder (cargar sus polígonos es caro: se hace una vez por proceso)
+_tf = None
+_tf_lock = threading.Lock()
+_tf_unavailable = False
+
+
+def _get_timezone_finder():
+    global _tf, _tf_unavailable
+    if _tf is not None or _tf_unavailable:
+        return _tf
+    with _tf_lock:
+        if _tf is None and not _tf_unavailable:
+            try:
+                from timezonefinder import TimezoneFinder
+                _tf = TimezoneFinder()
+            except Exception:
+                _tf_unavailable = True
+    return _tf
+
+
+def _point_key(lat: float, lng: float) -> Tuple[float, float]:
+    """Coordenada normalizada (5 decimales ≈ 1 m); es también la llave de caché."""
+    return round(float(lat), 5), round(float(lng), 5)
+
+
+def _cache_key(lat: float, lng: float) -> str:
+    return f"tz:{float(lat):.5f}:{float(lng):.5f}"
+
 
 def _fallback_timezone(lat: float, lng: float) -> Optional[str]:
-    try:
-        from timezonefinder import TimezoneFinder
-    except Exception:
+    tf = _get_timezone_finder()
+    if tf is None:
         return None
     try:
-        tf = TimezoneFinder()
         return tf.timezone_at(lng=float(lng), lat=float(lat))
     except Exception:
         return None
 
+
+def _google_timezone(lat: float, lng: float, ts: int, key: str) -> Optional[str]:
+    try:
+        resp = session.get(
+            GOOGLE_TZ_ENDPOINT,
+            params={"location": f"{lat},{lng}", "timestamp": ts, "key": key},
+            timeout=getattr(settings, "TIMEZONE_HTTP_TIMEOUT", 4),
+        )
+        data = resp.json()
+        if data.get("status") == "OK":
+            return data.get("timeZoneId")
+        # log suave en DEBUG
+        if getattr(settings, "DEBUG", False):
+            print("TimeZone API error:", data)
+    except Exception as e:
+        if getattr(settings, "DEBUG", False):
+            print("TimeZone API exception:", e)
+    return None
+
+
 def resolve_tz_from_latlng(lat: float, lng: float, timestamp: Optional[int] = None) -> Optional[str]:
     # 1) cache (30 días)
-    ck = f"tz:{float(lat):.5f}:{float(lng):.5f}"
+    ck = _cache_key(lat, lng)
     cached = cache.get(ck)
     if cached:
         return cached
@@ -31,26 +81,77 @@ def resolve_tz_from_latlng(lat: float, lng: float, timestamp: Optional[int] = No
 
     # 2) intento Google (si hay key)
     if key:
-        try:
-            resp = session.get(
-                GOOGLE_TZ_ENDPOINT,
-                params={"location": f"{lat},{lng}", "timestamp": ts, "key": key},
-                timeout=getattr(settings, "TIMEZONE_HTTP_TIMEOUT", 4),
-            )
-            data = resp.json()
-            if data.get("status") == "OK":
-                tz = data.get("timeZoneId")
-                cache.set(ck, tz, 60 * 60 * 24 * 30)  # 30d
-                return tz
-            # log suave en DEBUG
-            if getattr(settings, "DEBUG", False):
-                print("TimeZone API error:", data)
-        except Exception as e:
-            if getattr(settings, "DEBUG", False):
-                print("TimeZone API exception:", e)
+        tz = _google_timezone(lat, lng, ts, key)
+        if tz:
+            cache.set(ck, tz, TZ_CACHE_TTL)
+            return tz
 
     # 3) fallback local
     tz = _fallback_timezone(lat, lng)
     if tz:
-        cache.set(ck, tz, 60 * 60 * 24 * 30)
+        cache.set(ck, tz, TZ_CACHE_TTL)
     return tz
+
+
+def resolve_tz_batch(
+    points: Iterable[Tuple[float, float]],
+    timestamp: Optional[int] = None,
+    max_workers: Optional[int] = None,
+) -> Dict[Tuple[float, float], Optional[str]]:
+    """
+    Resuelve muchas coordenadas de una vez.
+    - Deduplica (lat, lng) redondeando a 5 decimales.
+    - Lee/escribe la caché con get_many/set_many.
+    - Resuelve offline con el TimezoneFinder compartido.
+    - Solo lo que quede sin resolver va a Google, en paralelo sobre la sesión pooled.
+    Devuelve {(lat, lng) normalizado: tz | None}; usa _point_key() para consultar.
+    """
+    pendientes = {}
+    for lat, lng in points:
+        if lat is None or lng is None:
+            continue
+        try:
+            pk = _point_key(lat, lng)
+        except (TypeError, ValueError):
+            continue
+        pendientes.setdefault(pk, _cache_key(*pk))
+
+    out: Dict[Tuple[float, float], Optional[str]] = {}
+    if not pendientes:
+        return out
+
+    # 1) cache
+    hits = cache.get_many(list(pendientes.values()))
+    for pk, ck in list(pendientes.items()):
+        if hits.get(ck):
+            out[pk] = hits[ck]
+            del pendientes[pk]
+
+    nuevos = {}
+
+    # 2) offline (sin red)
+    for pk in list(pendientes):
+        tz = _fallback_timezone(*pk)
+        if tz:
+            out[pk] = nuevos[pk] = tz
+            del pendientes[pk]
+
+    # 3) Google solo para lo no resuelto
+    key = getattr(settings, "GOOGLE_TIMEZONE_API_KEY", None)
+    if pendientes and key:
+        ts = int(timestamp or time.time())
+        workers = max_workers or int(getattr(settings, "TIMEZONE_HTTP_WORKERS", 8))
+        faltan = list(pendientes)
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(faltan)))) as pool:
+            resultados = pool.map(lambda pk: _google_timezone(pk[0], pk[1], ts, key), faltan)
+            for pk, tz in zip(faltan, resultados):
+                if tz:
+                    out[pk] = nuevos[pk] = tz
+                    del pendientes[pk]
+
+    for pk in pendientes:
+        out[pk] = None
+
+    if nuevos:
+        cache.set_many({_cache_key(*pk): tz for pk, tz in nuevos.items()}, TZ_CACHE_TTL)
+    return out
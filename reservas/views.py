@@ -57,9 +57,14 @@ from .permissions import assert_user_can_manage_sucursal  # <-- IMPORTANTE
 from .helpers.permisos import assert_can_manage
 from .utils_auth import scope_sucursales_for, user_allowed_countries
 from .utils_country import get_effective_country
+from .request_metrics import query_budget
+from .folios import buscar_reserva_por_folio, folio_valido, normalizar_folio
+from .tarjeta import tarjeta_por_pk, tarjeta_reserva
+from .visibilidad import puede_ver_sucursal, sucursal_ids_visibles
 from .utils import (
     mesas_disponibles_para_reserva, mover_reserva,
-    booking_total_minutes, asignar_mesa_automatica
+    booking_total_minutes, asignar_mesa_automatica,
+    guardar_reserva_sin_traslape, MesaOcupada,
 )
 from .emails import enviar_correo_reserva_confirmada
 from .forms import (
@@ -71,33 +76,15 @@ from .models import (
     PerfilAdmin, BloqueoMesa,
 )
 
-def _get_reserva_by_folio(folio: str):
-    # Búsqueda case-insensitive por folio exacto
-    return get_object_or_404(Reserva, folio__iexact=folio.strip())
-
 @login_required
 def reserva_scan_entry(request, folio):
-    r = get_object_or_404(
-        Reserva.objects.select_related("sucursal", "mesa", "cliente", "cliente__user"),
-        folio=folio,
-    )
-
-    # TZ sucursal y textos de fecha/hora/duración
-    tz = _tz_for_sucursal(r.sucursal or (r.mesa and r.mesa.sucursal))
-    li = r.local_inicio or (r.inicio_utc and timezone.localtime(r.inicio_utc, tz))
-    lf = r.local_fin or (r.fin_utc and timezone.localtime(r.fin_utc, tz))
-    fecha_txt = formats.date_format(li.date(), "DATE_FORMAT") if li else ""
-    hora_txt = li.strftime("%H:%M") if li else ""
-    duracion_min = int(((lf - li).total_seconds() // 60)) if (li and lf) else 0
-
+    # Tarjeta precalculada (reservas/tarjeta.py): en caliente una lectura de caché, sin joins
+    t = tarjeta_reserva(folio)
+    if t is None:
+        raise Http404("Reserva no encontrada.")
     ctx = {
-        "reserva": r,
-        "fecha_txt": fecha_txt,
-        "hora_txt": hora_txt,
-        "duracion_min": duracion_min,
-        "personas": r.num_personas,
+        "tarjeta": t,
         "for_staff": request.user.is_staff,
-        **_contacto_from_reserva(r),
     }
     return render(request, "reservas/reserva_scan_entry.html", ctx)
 
@@ -107,13 +94,18 @@ def reserva_checkin(request, folio):
     if not request.user.is_staff:
         return HttpResponseForbidden("Solo personal autorizado")
 
-    reserva = _get_reserva_by_folio(folio)
+    t = tarjeta_reserva(folio)
+    if t is None:
+        raise Http404("Reserva no encontrada.")
+    if t["llego"]:  # doble toque desde el teléfono: nada que escribir
+        messages.info(request, "Esta reserva ya tenía el check-in registrado.")
+        return redirect("reservas:reserva_scan_entry", folio=t["folio"])
+
+    reserva = get_object_or_404(Reserva, pk=t["pk"])
     reserva.llego = True
     reserva.checkin_at = dj_tz.now()
     reserva.arrived_at = reserva.checkin_at
-    if hasattr(reserva, "estado") and not reserva.estado:
-        pass
-    reserva.save(update_fields=["llego", "checkin_at", "arrived_at"])
+    reserva.save(update_fields=["llego", "checkin_at", "arrived_at"])  # invalida la tarjeta
 
     # ✅ Liberar pre-orden al hacer check-in
     from reservas.services_orders import liberar_preorden_al_checkin
@@ -236,19 +228,22 @@ def _round_to_next_15(dt: datetime) -> datetime:
 
 
 
-def _slot_consultado(request):
+def _slot_consultado(request, sucursal=None):
     """
     Lee ?fecha=YYYY-MM-DD & ?hora=HH:MM y devuelve (inicio, fin) aware.
     Si no vienen, usa el siguiente bloque de 30 minutos desde 'ahora'.
+    Con 'sucursal' la hora se interpreta en su TZ y la duración sale de su calendario.
     """
-    tz = timezone.get_current_timezone()
+    from .utils import calendario_sucursal
+
+    tz = calendario_sucursal(sucursal).tz if sucursal is not None else timezone.get_current_timezone()
     f = request.GET.get("fecha")
     h = request.GET.get("hora")
 
     if f and h:
         inicio = timezone.make_aware(datetime.strptime(f"{f} {h}", "%Y-%m-%d %H:%M"), tz)
     else:
-        now = timezone.localtime()
+        now = timezone.localtime(timezone.now(), tz)
         minute = ((now.minute // 30) + 1) * 30
         if minute == 60:
             inicio = now.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
@@ -256,7 +251,7 @@ def _slot_consultado(request):
             inicio = now.replace(minute=minute, second=0, microsecond=0)
 
     total_min = int(getattr(settings, "RESERVA_TOTAL_MINUTOS", 70))
-    fin = inicio + timedelta(minutes=booking_total_minutes(inicio, party=2))
+    fin = inicio + timedelta(minutes=booking_total_minutes(inicio, party=2, sucursal=sucursal))
 
     return inicio, fin
 
@@ -411,26 +406,9 @@ def _haversine_km(lat1, lon1, lat2, lon2):
     a = sin(dlat/2)**2 + cos(lat1)*cos(lat2)*sin(dlon/2)**2
     return 2 * R * asin(sqrt(a))
 
-def seleccionar_sucursal(request):
-    """
-    Lista sucursales con filtro y orden de recomendadas o por distancia.
-    GET: q, date (YYYY-MM-DD), time (HH:MM), party (int), page,
-         lat, lng, radius_km | km
-    """
-    q = request.GET.get("q", "").strip()
-    date_str = request.GET.get("date")
-    time_str = request.GET.get("time")
-    party = request.GET.get("party")
-    lat = request.GET.get("lat")
-    lng = request.GET.get("lng")
-
-    radius_str = request.GET.get("radius_km", request.GET.get("km", "50"))
-    try:
-        radius_km = float(radius_str)
-    except Exception:
-        radius_km = 50.0
-
-    # ---- Base y scoping por país ----
+def _sucursales_para_busqueda(request, q=""):
+    """Sucursales activas que el usuario puede ver (staff: su alcance; público: su país)."""
+    user_country = None
     if request.user.is_authenticated and request.user.is_staff:
         base_qs = Sucursal.objects.filter(activo=True)
         qs = scope_sucursales_for(request, base_qs)
@@ -454,61 +432,121 @@ def seleccionar_sucursal(request):
         and not user_allowed_countries(request.user).exists()
     ):
         qs = qs.filter(administradores=request.user)
+    return qs, user_country
 
-    # Helper: base_dt por sucursal (en su TZ)
-    def _base_dt_for_sucursal(suc: Sucursal) -> datetime:
-        tz = ZoneInfo(suc.timezone)
-        if date_str:
-            try:
-                t = datetime.strptime(time_str or "19:00", "%H:%M").time()
-                d = date.fromisoformat(date_str)
-                return dj_tz.make_aware(datetime.combine(d, t), tz)
-            except Exception:
-                pass
-        # si no viene fecha válida, usar ahora local de la sucursal
-        return timezone.now().astimezone(tz)
 
-    user_lat = user_lng = None
-    results_raw = []
+def _slot_label(dt_local) -> str:
+    fmt = "%#I:%M %p" if os.name == "nt" else "%-I:%M %p"
+    return dt_local.strftime(fmt).lower()
 
-    # --- MODO CERCA DE MÍ ---
-    if lat and lng:
-        try:
-            user_lat, user_lng = float(lat), float(lng)
-        except ValueError:
-            user_lat = user_lng = None
-
-    if user_lat is not None and user_lng is not None:
-        for s in qs:
-            s_lat, s_lng = _coords_from_sucursal(s)
-            d = None
-            if s_lat is not None and s_lng is not None:
-                d = _haversine_km(user_lat, user_lng, s_lat, s_lng)
-                if d > radius_km:
-                    continue
-            tz = ZoneInfo(s.timezone)
-            base_dt = _base_dt_for_sucursal(s)
-            results_raw.append({
-                "obj": s,
-                "map_lat": s_lat,
-                "map_lng": s_lng,
-                "distance_km": (None if d is None else round(d, 1)),
-                "proximos_slots": _proximos_slots(base_dt, 3, tz=tz),
-            })
-        results_raw.sort(key=lambda item: (item["distance_km"] is None, item["distance_km"] or 0.0))
+
+def _buscar_disponibilidad(sucursales, fecha, hora, party, origen=None, radius_km=None, n=3):
+    """
+    Disponibilidad REAL (mesas libres) de varias sucursales alrededor de fecha+hora, en una
+    sola pasada (utils.proximos_libres_sucursales), ordenada por cercanía. Sin fecha se
+    leen los snapshots de "próximos libres" (proximos.leer_proximos) en lugar de calcular:
+      - con origen (lat, lng): filtra por radio y ordena por distancia + cercanía en tiempo
+        (BUSQUEDA_MIN_POR_KM minutos equivalen a 1 km)
+      - sin origen: por cercanía en tiempo, respetando el orden recibido en empates
+    Las sucursales sin lugar van al final.
+    """
+    from .proximos import leer_proximos
+    from .utils import proximos_libres_sucursales
+
+    candidatas = []
+    for s in sucursales:
+        s_lat, s_lng = _coords_from_sucursal(s)
+        d = None
+        if origen is not None and s_lat is not None and s_lng is not None:
+            d = _haversine_km(origen[0], origen[1], s_lat, s_lng)
+            if radius_km is not None and d > radius_km:
+                continue
+        candidatas.append((s, s_lat, s_lng, d))
+
+    if fecha is None:
+        # Sin fecha pedida: snapshot precalculado por refrescar_proximos (aquí no se calcula)
+        ahora = timezone.now()
+        libres = {
+            sid: [(dt, (dt - ahora).total_seconds() / 60) for dt in dts
+                  if dt.date() == ahora.astimezone(dt.tzinfo).date()]
+            for sid, dts in leer_proximos([c[0].id for c in candidatas], party, n=n).items()
+        }
+    else:
+        libres = proximos_libres_sucursales([c[0] for c in candidatas], fecha, hora, party, n=n)
+    min_por_km = float(getattr(settings, "BUSQUEDA_MIN_POR_KM", 2))
+
+    resultados = []
+    for s, s_lat, s_lng, d in candidatas:
+        slots = libres.get(s.id, [])
+        delta = min((x[1] for x in slots), default=None)
+        if origen is not None:
+            orden = (delta is None, d is None, (delta or 0) + (d or 0) * min_por_km)
+        else:
+            orden = (delta is None, delta or 0)
+        resultados.append({
+            "obj": s,
+            "map_lat": s_lat,
+            "map_lng": s_lng,
+            "distance_km": (None if d is None else round(d, 1)),
+            "proximos_slots": [{"label": _slot_label(dt), "value": dt.strftime("%H:%M")} for dt, _ in slots],
+            "_orden": orden,
+        })
+    resultados.sort(key=lambda item: item.pop("_orden"))
+    return resultados
+
+
+def _parametros_busqueda(request):
+    """(fecha | None, hora | None, party) de ?date=&time=&party= (fecha inválida → ahora)."""
+    fecha = hora = None
+    try:
+        fecha = date.fromisoformat((request.GET.get("date") or "").strip())
+        hora = datetime.strptime((request.GET.get("time") or "19:00").strip(), "%H:%M").time()
+    except ValueError:
+        fecha = hora = None
+    try:
+        party = max(1, int((request.GET.get("party") or "2").strip()))
+    except ValueError:
+        party = 2
+    return fecha, hora, party
+
+
+def _origen_busqueda(request):
+    try:
+        return float(request.GET["lat"]), float(request.GET["lng"])
+    except (KeyError, ValueError):
+        return None
+
+
+@query_budget(12)  # en frío: +3 calendarios y +2 ocupación, compartidos por todas las sucursales
+def seleccionar_sucursal(request):
+    """
+    Lista sucursales con filtro y orden de recomendadas o por distancia, con sus próximos
+    horarios realmente libres alrededor de la fecha/hora pedida.
+    GET: q, date (YYYY-MM-DD), time (HH:MM), party (int), page,
+         lat, lng, radius_km | km
+    """
+    q = request.GET.get("q", "").strip()
+    date_str = request.GET.get("date")
+    time_str = request.GET.get("time")
+    party = request.GET.get("party")
+
+    radius_str = request.GET.get("radius_km", request.GET.get("km", "50"))
+    try:
+        radius_km = float(radius_str)
+    except Exception:
+        radius_km = 50.0
+
+    qs, user_country = _sucursales_para_busqueda(request, q)
+    fecha, hora, party_n = _parametros_busqueda(request)
+    origen = _origen_busqueda(request)
+    user_lat, user_lng = origen if origen else (None, None)
+
+    if origen is not None:
+        # --- MODO CERCA DE MÍ ---
+        results_raw = _buscar_disponibilidad(qs, fecha, hora, party_n, origen=origen, radius_km=radius_km)
     else:
         # --- MODO NORMAL ---
-        for s in qs.order_by("-recomendado", "nombre"):
-            s_lat, s_lng = _coords_from_sucursal(s)
-            tz = ZoneInfo(s.timezone)
-            base_dt = _base_dt_for_sucursal(s)
-            results_raw.append({
-                "obj": s,
-                "map_lat": s_lat,
-                "map_lng": s_lng,
-                "distance_km": None,
-                "proximos_slots": _proximos_slots(base_dt, 3, tz=tz),
-            })
+        results_raw = _buscar_disponibilidad(qs.order_by("-recomendado", "nombre"), fecha, hora, party_n)
 
     paginator = Paginator(results_raw, 12)
     page_number = request.GET.get("page")
@@ -525,11 +563,51 @@ def seleccionar_sucursal(request):
         "user_lat": user_lat,
         "user_lng": user_lng,
         "radius_km": int(radius_km),
-        "user_country": locals().get("user_country", None),
+        "user_country": user_country,
     }
     return render(request, "reservas/seleccionar_sucursal.html", ctx)
 
 
+@require_GET
+def api_buscar_disponibilidad(request):
+    """
+    Búsqueda de mesa en varias sucursales ("una mesa cerca a las 7pm").
+    GET: date, time, party, lat, lng, radius_km (default 50), q, limit (default 20)
+    Sin lat/lng se busca en el país efectivo del usuario (o el alcance del staff).
+      {"resultados": [{"id", "nombre", "slug", "distance_km", "slots": [{"label", "value"}]}, ...]}
+    Solo devuelve sucursales con lugar, ordenadas por distancia y cercanía a la hora pedida.
+    """
+    try:
+        radius_km = float(request.GET.get("radius_km") or 50)
+    except ValueError:
+        radius_km = 50.0
+    try:
+        limit = min(100, max(1, int(request.GET.get("limit") or 20)))
+    except ValueError:
+        limit = 20
+
+    qs, _ = _sucursales_para_busqueda(request, request.GET.get("q", "").strip())
+    fecha, hora, party = _parametros_busqueda(request)
+    origen = _origen_busqueda(request)
+    if origen is None:
+        qs = qs.order_by("-recomendado", "nombre")
+
+    resultados = [
+        {
+            "id": r["obj"].id,
+            "nombre": r["obj"].nombre,
+            "slug": r["obj"].slug,
+            "lat": r["map_lat"],
+            "lng": r["map_lng"],
+            "distance_km": r["distance_km"],
+            "slots": r["proximos_slots"],
+        }
+        for r in _buscar_disponibilidad(qs, fecha, hora, party, origen=origen, radius_km=radius_km)
+        if r["proximos_slots"]
+    ][:limit]
+    return JsonResponse({"party": party, "resultados": resultados})
+
+
 
 # --- Redirección directa desde "Ver disponibilidad" al detalle de sucursal ---
 
@@ -567,7 +645,8 @@ def seleccionar_sucursal_redirect(request):
 def reservar(request, mesa_id):
     from .utils import (
         anticipacion_minima_para,
-        conflicto_y_disponible,
+        guardar_reserva_sin_traslape,
+        MesaOcupada,
         _auto_cancel_por_tolerancia,
     )
     _auto_cancel_por_tolerancia(minutos=6)
@@ -587,9 +666,8 @@ def reservar(request, mesa_id):
         form = ReservaForm(request.POST, mesa=mesa, cliente=cliente)
         if form.is_valid():
             try:
+                # Sin lock de mesa: la exclusión de BD (Reserva.ocupacion) evita el doble booking
                 with transaction.atomic():
-                    Mesa.objects.select_for_update().get(pk=mesa.pk)
-
                     fecha = form.cleaned_data["fecha"]
                     if timezone.is_naive(fecha):
                         fecha = timezone.make_aware(fecha, timezone.get_current_timezone())
@@ -597,20 +675,11 @@ def reservar(request, mesa_id):
                     tz = timezone.get_current_timezone()
                     now_loc = timezone.now().astimezone(tz)
                     fec_loc = fecha.astimezone(tz)
-                    antic_min = anticipacion_minima_para(fec_loc)
+                    antic_min = anticipacion_minima_para(fec_loc, sucursal=mesa.sucursal_id)
                     if fec_loc < now_loc + timedelta(minutes=antic_min):
                         messages.error(request, f"Debes reservar con al menos {antic_min} minutos de anticipación.")
                         return redirect("reservas:reservar", mesa_id=mesa.id)
 
-                    conflicto, hora_disp = conflicto_y_disponible(mesa, fecha)
-                    if conflicto:
-                        messages.error(
-                            request,
-                            "⚠ La mesa está ocupada hasta las "
-                            f"{hora_disp.astimezone(tz).strftime('%H:%M')}."
-                        )
-                        return redirect("reservas:reservar", mesa_id=mesa.id)
-
                     if not request.user.is_staff:
                         sep_min = int(getattr(settings, "RESERVA_MIN_SEPARACION_MIN", 120))
                         por_sucursal = bool(getattr(settings, "RESERVA_SEPARACION_POR_SUCURSAL", True))
@@ -620,7 +689,7 @@ def reservar(request, mesa_id):
 
                         filtro = Q(cliente=cliente, estado__in=["PEND", "CONF"], fecha__gte=win_ini, fecha__lte=win_fin)
                         if por_sucursal:
-                            filtro &= Q(mesa__sucursal=mesa.sucursal)
+                            filtro &= Q(sucursal_id=mesa.sucursal_id)
 
                         pegadas = Reserva.objects.filter(filtro).order_by("fecha")
                         if pegadas.exists():
@@ -663,8 +732,15 @@ def reservar(request, mesa_id):
                         asist = cap_mesa
                     reserva.num_personas = asist
 
-                    reserva.full_clean()
-                    reserva.save()
+                    try:
+                        guardar_reserva_sin_traslape(reserva)
+                    except MesaOcupada as e:
+                        messages.error(
+                            request,
+                            "⚠ La mesa está ocupada hasta las "
+                            f"{e.disponible_desde.astimezone(tz).strftime('%H:%M')}."
+                        )
+                        return redirect("reservas:reservar", mesa_id=mesa.id)
 
                     if not cliente.email and request.user.email:
                         cliente.email = request.user.email
@@ -702,34 +778,16 @@ def reservar(request, mesa_id):
 @login_required
 def reserva_exito(request, reserva_id):
     from django.conf import settings
-    from django.utils import timezone, formats
-    from .utils import booking_total_minutes
 
-    r = get_object_or_404(
-        Reserva.objects.select_related("mesa", "mesa__sucursal", "cliente"),
-        id=reserva_id,
-        cliente__user=request.user,
-    )
-
-    tz = timezone.get_current_timezone()
-    dt_loc = timezone.localtime(r.fecha, tz)
+    # Misma tarjeta que el QR y el ticket (reservas/tarjeta.py); solo el dueño la ve aquí
+    t = tarjeta_por_pk(reserva_id)
+    if t is None or t["cliente_user_id"] != request.user.pk:
+        raise Http404("Reserva no encontrada.")
 
     ctx = {
-        "reserva": r,
+        "tarjeta": t,
         "tolerancia_min": int(getattr(settings, "CHECKIN_TOLERANCIA_MIN", 5)),
-
-        # ▼ Campos derivados que el template necesita
-        "fecha_txt": formats.date_format(dt_loc.date(), "DATE_FORMAT"),
-        "hora_txt": dt_loc.strftime("%H:%M"),
-        "duracion_min": booking_total_minutes(dt_loc, r.num_personas or 2),
-        "personas": r.num_personas or 1,
-        "mesa_num": getattr(r.mesa, "numero", r.mesa_id),
-
-        # Contacto
-        "contacto_nombre": getattr(r.cliente, "nombre", "") or "",
-        "contacto_email": getattr(r.cliente, "email", "") or "",
-        "contacto_tel": getattr(r.cliente, "telefono", "") or getattr(r, "telefono", ""),
-        "notas": getattr(r, "notas", ""),
+        "qr_url": request.build_absolute_uri(reverse("reservas:reserva_scan_entry", args=[t["folio"]])),
     }
     return render(request, "reservas/reserva_exito.html", ctx)
 
@@ -777,9 +835,10 @@ def mis_reservas(request):
 # ===================================================================
 # reservas/views.py
 @staff_member_required
+@query_budget(15)
 def ver_mesas(request, sucursal_id):
     from .utils import _auto_cancel_por_tolerancia
-    from .utils import booking_total_minutes
+    from .utils import booking_total_minutes, ocupacion_para
     _auto_cancel_por_tolerancia(minutos=6)
 
     sucursal = get_object_or_404(Sucursal, id=sucursal_id)
@@ -788,36 +847,56 @@ def ver_mesas(request, sucursal_id):
     if not _puede_ver_sucursal(request.user, sucursal):
         raise Http404()
 
-    inicio, fin = _slot_consultado(request)  # ideal: que devuelva aware en TZ activa
-    estados_ocupan = ["PEND", "CONF"]
+    inicio, fin = _slot_consultado(request, sucursal)
 
     try:
         party = int((request.GET.get("party") or "2").strip())
     except Exception:
         party = 2
 
-    total_min = booking_total_minutes(inicio, party)
-    mesas_qs = Mesa.objects.filter(sucursal=sucursal)
-
-    reservas_existe = (
-        Reserva.objects
-        .filter(mesa=OuterRef("pk"), estado__in=estados_ocupan, fecha__lt=fin)
-        .annotate(fin_res=Case(default=Value(0), output_field=BooleanField()))
-        .filter(fecha__gt=inicio - timedelta(minutes=total_min))
-    )
+    total_min = booking_total_minutes(inicio, party, sucursal=sucursal)
+    mesas = list(Mesa.objects.filter(sucursal=sucursal).order_by("numero", "id"))
 
-    mesas = (
-        mesas_qs
-        .annotate(ocupada=Exists(reservas_existe))
-        .annotate(disponible=Case(When(ocupada=True, then=Value(False)), default=Value(True), output_field=BooleanField()))
-        .order_by("numero", "id")
-    )
+    # Libre = lo que ocuparía este grupo no choca con reservas ni bloqueos (mapa del día)
+    libres = set(ocupacion_para(sucursal, inicio).mesas_libres(
+        [m.id for m in mesas], inicio, inicio + timedelta(minutes=total_min)))
+    for m in mesas:
+        m.disponible = m.id in libres
+        m.ocupada = not m.disponible
 
     ctx = {"sucursal": sucursal, "mesas": mesas, "slot_inicio": inicio, "slot_fin": fin}
     resp = render(request, "reservas/ver_mesas.html", ctx)
     # (opcional) dj_tz.deactivate()
     return resp
 
+
+@staff_member_required
+@require_GET
+@query_budget(7)  # sesión + usuario + sucursal + estado del piso; permisos + visibles (3) solo en frío
+def api_estado_piso(request, sucursal_id):
+    """
+    GET /staff/api/sucursal/<id>/piso/ → estado de todas las mesas (reserva actual y
+    siguiente, check-in, bloqueo, orden abierta) para la tablet de recepción.
+    Refresco condicional: si If-None-Match (o ?v=) coincide con la versión → 304 sin cuerpo.
+    """
+    from django.http import HttpResponseNotModified
+    from .piso import estado_piso
+
+    sucursal = get_object_or_404(Sucursal, id=sucursal_id)
+    if not _puede_ver_sucursal(request.user, sucursal):
+        return HttpResponseForbidden("No tienes permiso para ver esta sucursal.")
+
+    estado = estado_piso(sucursal)
+    etag = f'"piso-{estado["version"]}"'
+    previo = request.headers.get("If-None-Match") or ""
+    if etag in previo or request.GET.get("v") == estado["version"]:
+        resp = HttpResponseNotModified()
+    else:
+        resp = JsonResponse(estado)
+    resp["ETag"] = etag
+    resp["Cache-Control"] = "private, no-cache"
+    return resp
+
 # ===================================================================
 # ADMIN: SUCURSALES (UI propia) + FORM crear/editar con imagen
 # ===================================================================
@@ -926,6 +1005,7 @@ def _is_chain_owner(user):
 
 
 @staff_member_required
+@query_budget(15)
 def admin_mesa_detalle(request, mesa_id):
     """
     Vista de detalle de mesa (panel staff/admin).
@@ -945,9 +1025,8 @@ def admin_mesa_detalle(request, mesa_id):
 
 
     reserva = (
-        Reserva.objects.filter(
+        Reserva.objects.activas().filter(
             mesa=mesa,
-            estado__in=[Reserva.PEND, Reserva.CONF],
             fecha__gte=ahora - timedelta(minutes=gracia),
         )
         .order_by("fecha")
@@ -955,9 +1034,8 @@ def admin_mesa_detalle(request, mesa_id):
     )
     if not reserva:
         reserva = (
-            Reserva.objects.filter(
+            Reserva.objects.activas().filter(
                 mesa=mesa,
-                estado__in=[Reserva.PEND, Reserva.CONF],
                 fecha__gte=ahora,
             )
             .order_by("fecha")
@@ -1003,7 +1081,7 @@ def admin_confirmar_llegada(request, reserva_id):
     """
     r = get_object_or_404(Reserva.objects.select_for_update(), pk=reserva_id)
 
-    if not _puede_ver_sucursal(request.user, r.mesa.sucursal):
+    if not _puede_ver_sucursal(request.user, r.sucursal_id):
         return HttpResponseForbidden("No tienes permiso para confirmar esta reserva.")
 
     if getattr(r, "llego", False):
@@ -1062,8 +1140,9 @@ def disponibilidad_mesa(request, mesa_id):
     """
     Devuelve JSON con horarios disponibles para una mesa en un día (cliente).
     Usa duración dinámica y fin efectivo (respeta liberada_en) para choques.
+    Horario, paso, duraciones y anticipación salen del calendario de la sucursal.
     """
-    from .utils import anticipacion_minima_para, booking_total_minutes
+    from .utils import calendario_sucursal, ocupacion_dia
     if not _en_ventana_debug_o_ajax(request):
         return HttpResponseForbidden("Sólo AJAX")
 
@@ -1076,67 +1155,38 @@ def disponibilidad_mesa(request, mesa_id):
     except Exception:
         party = 2
 
-    tz = timezone.get_current_timezone()
-    hoy_local = timezone.localdate()
+    cal = calendario_sucursal(mesa.sucursal_id)
+    jornada = cal.jornada_dt(dia)
+    reglas = cal.reglas(dia)
+    duraciones = reglas.dur_grande if party >= 5 else reglas.dur_normal
+    if jornada is None:  # la sucursal no abre ese día
+        return JsonResponse({"mesa": mesa_id, "fecha": dia.isoformat(), "duracion_min": duraciones[0], "slots": []})
 
-    apertura = int(getattr(settings, "HORARIO_APERTURA", 8))
-    cierre   = int(getattr(settings, "HORARIO_CIERRE", 22))
-    paso     = 15
+    hoy_local = timezone.now().astimezone(cal.tz).date()
+    paso = cal.paso_min
+    inicio_jornada, fin_jornada = jornada
 
-    inicio_jornada = timezone.make_aware(datetime(dia.year, dia.month, dia.day, apertura, 0), tz)
-    fin_jornada    = timezone.make_aware(datetime(dia.year, dia.month, dia.day, cierre,   0), tz)
-
-    # Necesitamos fecha, num_personas y liberada_en para calcular fin_efectivo
-    reservas = (
-        Reserva.objects
-        .filter(mesa=mesa, estado__in=["PEND", "CONF"])
-        .filter(fecha__lt=fin_jornada)
-        .only("fecha", "num_personas", "liberada_en")
-        .order_by("fecha")
-    )
-
-    bloqueos = (
-        BloqueoMesa.objects
-        .filter(sucursal=mesa.sucursal)
-        .filter(Q(mesa__isnull=True) | Q(mesa=mesa))
-        .filter(Q(inicio__lt=fin_jornada) & Q(fin__gt=inicio_jornada))
-        .only("inicio", "fin")
-    )
-
-    def se_traslapa(ini_a, fin_a, ini_b, fin_b):
-        return ini_a < fin_b and fin_a > ini_b
-
-    def ocupado(slot_ini, slot_fin):
-        # Reservas: usar fin EFECTIVO (respeta liberada_en)
-        for r in reservas:
-            r_ini = r.fecha
-            r_fin = r.fin_efectivo(getattr(r, "num_personas", party) or party)
-            if se_traslapa(slot_ini, slot_fin, r_ini, r_fin):
-                return True
-        # Bloqueos
-        for b in bloqueos:
-            if se_traslapa(slot_ini, slot_fin, b.inicio, b.fin):
-                return True
-        return False
+    # Reservas (fin efectivo, respeta liberada_en) y bloqueos del día: mapa de ocupación
+    ocupacion = ocupacion_dia(mesa.sucursal_id, dia)
 
     now_local = timezone.localtime()
     slots = []
     t = inicio_jornada
     while t < fin_jornada:
-        dur_min = booking_total_minutes(t, party)
+        minuto = t.hour * 60 + t.minute
+        dur_min = duraciones[minuto]
         if t + timedelta(minutes=dur_min) > fin_jornada:
             break
 
         # oculta pasado y respeta anticipación
         if dia == hoy_local and t < now_local:
             t += timedelta(minutes=paso); continue
-        antic_min = anticipacion_minima_para(t)
-        if t < now_local + timedelta(minutes=antic_min):
+        if t < now_local + timedelta(minutes=reglas.anticipacion[minuto]):
             t += timedelta(minutes=paso); continue
 
         slot_ini = t
         slot_fin = t + timedelta(minutes=dur_min)
-        if not ocupado(slot_ini, slot_fin):
+        if ocupacion.libre(mesa_id, slot_ini, slot_fin):
             slots.append(t.strftime("%H:%M"))
 
         t += timedelta(minutes=paso)
@@ -1144,7 +1194,7 @@ def disponibilidad_mesa(request, mesa_id):
     return JsonResponse({
         "mesa": mesa_id,
         "fecha": dia.isoformat(),
-        "duracion_min": booking_total_minutes(inicio_jornada, party),
+        "duracion_min": reglas.duracion(inicio_jornada, party),
         "slots": slots,
     })
 
@@ -1201,9 +1251,7 @@ def admin_buscar_folio(request):
     if not request.user.is_staff:
         return redirect("reservas:home")
 
-    folio = (request.GET.get("folio") or "").strip().upper()
-    if folio and not folio.startswith("R-"):
-        folio = "R-" + folio.lstrip("R").lstrip("-").strip()
+    folio = normalizar_folio(request.GET.get("folio"))
 
     reserva = None
     error = None
@@ -1212,11 +1260,12 @@ def admin_buscar_folio(request):
     ventana_ini = ventana_fin = None
 
     if folio:
-        try:
-            reserva = (Reserva.objects
-                       .select_related("mesa__sucursal", "cliente")
-                       .get(folio=folio))
-
+        reserva = buscar_reserva_por_folio(folio, Reserva.objects.select_related("mesa", "sucursal", "cliente"))
+        if reserva is None and not folio_valido(folio):
+            error = f"El folio {folio} no es válido: revisa que esté bien escrito."
+        elif reserva is None:
+            error = f"No se encontró ninguna reserva con el folio {folio}."
+        else:
             ahora = timezone.now()
             inicio = reserva.fecha - timedelta(minutes=tol)
             fin    = reserva.fecha + timedelta(minutes=tol)
@@ -1231,9 +1280,6 @@ def admin_buscar_folio(request):
             ventana_ini = inicio.astimezone(tz).strftime("%d/%b/%Y %H:%M")
             ventana_fin = fin.astimezone(tz).strftime("%d/%b/%Y %H:%M")
 
-        except Reserva.DoesNotExist:
-            error = f"No se encontró ninguna reserva con el folio {folio}."
-
     ctx = {
         "folio": folio,
         "reserva": reserva,
@@ -1251,13 +1297,10 @@ def admin_checkin_por_folio(request):
     if request.method != "POST":
         return redirect("reservas:admin_buscar_folio")
 
-    folio = (request.POST.get("folio") or "").strip().upper()
-    if folio and not folio.startswith("R-"):
-        folio = "R-" + folio.lstrip("R").lstrip("-").strip()
+    folio = normalizar_folio(request.POST.get("folio"))
 
-    try:
-        r = Reserva.objects.get(folio=folio)
-    except Reserva.DoesNotExist:
+    r = buscar_reserva_por_folio(folio)
+    if r is None:
         messages.error(request, "No se encontró la reserva.")
         return redirect("reservas:admin_buscar_folio")
 
@@ -1300,17 +1343,14 @@ def admin_checkin_por_folio(request):
 @staff_member_required
 @require_POST
 def admin_cancelar_por_folio(request):
-    folio = (request.POST.get("folio") or "").strip().upper()
-    if folio and not folio.startswith("R-"):
-        folio = "R-" + folio.lstrip("R").lstrip("-").strip()
+    folio = normalizar_folio(request.POST.get("folio"))
 
-    try:
-        r = Reserva.objects.select_related("mesa__sucursal").get(folio=folio)
-    except Reserva.DoesNotExist:
+    r = buscar_reserva_por_folio(folio)
+    if r is None:
         messages.error(request, "No se encontró la reserva.")
         return redirect("reservas:admin_buscar_folio")
 
-    if not _puede_ver_sucursal(request.user, r.mesa.sucursal):
+    if not _puede_ver_sucursal(request.user, r.sucursal_id):
         messages.error(request, "No tienes permiso para cancelar esta reserva.")
         return HttpResponseRedirect(f"{reverse('reservas:admin_buscar_folio')}?folio={folio}")
 
@@ -1327,17 +1367,14 @@ def admin_cancelar_por_folio(request):
 @staff_member_required
 @require_POST
 def admin_reactivar_por_folio(request):
-    folio = (request.POST.get("folio") or "").strip().upper()
-    if folio and not folio.startswith("R-"):
-        folio = "R-" + folio.lstrip("R").lstrip("-").strip()
+    folio = normalizar_folio(request.POST.get("folio"))
 
-    try:
-        r = Reserva.objects.select_related("mesa__sucursal").get(folio=folio)
-    except Reserva.DoesNotExist:
+    r = buscar_reserva_por_folio(folio)
+    if r is None:
         messages.error(request, "No se encontró la reserva.")
         return HttpResponseRedirect(reverse("reservas:admin_dashboard"))
 
-    if not _puede_ver_sucursal(request.user, r.mesa.sucursal):
+    if not _puede_ver_sucursal(request.user, r.sucursal_id):
         messages.error(request, "No tienes permiso sobre esta sucursal.")
         return HttpResponseRedirect(reverse("reservas:admin_dashboard"))
 
@@ -1345,8 +1382,13 @@ def admin_reactivar_por_folio(request):
         messages.info(request, f"La reserva {r.folio} no está cancelada.")
     else:
         r.estado = "PEND"
-        r.save(update_fields=["estado"])
-        messages.success(request, f"✅ Reserva {r.folio} reactivada como {r.get_estado_display()}.")
+        try:
+            guardar_reserva_sin_traslape(r, update_fields=["estado"])
+        except MesaOcupada:
+            # El horario se volvió a reservar mientras estaba cancelada
+            messages.error(request, f"No se puede reactivar {r.folio}: la mesa ya está ocupada en ese horario.")
+        else:
+            messages.success(request, f"✅ Reserva {r.folio} reactivada como {r.get_estado_display()}.")
 
     fecha = request.GET.get("fecha")
     url = reverse("reservas:admin_dashboard")
@@ -1359,6 +1401,8 @@ def admin_reactivar_por_folio(request):
 
 @staff_member_required
 def admin_dashboard(request):
+    from .listados import listar_reservas
+
     tz = timezone.get_current_timezone()
     fecha_q = (request.GET.get("fecha") or "").strip()
     try:
@@ -1369,23 +1413,23 @@ def admin_dashboard(request):
     inicio = timezone.make_aware(datetime(dia.year, dia.month, dia.day, 0, 0), tz)
     fin    = inicio + timezone.timedelta(days=1)
 
-    if request.user.is_superuser:
-        filtro_sucursal = {}
-    else:
-        try:
-            perfil = PerfilAdmin.objects.get(user=request.user)
-            filtro_sucursal = {"mesa__sucursal_id": perfil.sucursal_asignada_id}
-        except PerfilAdmin.DoesNotExist:
-            filtro_sucursal = {"mesa__sucursal_id__isnull": True}
-
-    reservas = (
-        Reserva.objects
-        .select_related("cliente", "mesa__sucursal")
-        .filter(fecha__gte=inicio, fecha__lt=fin, **filtro_sucursal)
-        .order_by("fecha")
+    # Índice (sucursal, fecha) + keyset: solo las columnas que pinta la tabla
+    pagina = listar_reservas(
+        _sucursal_ids_staff(request.user), desde=inicio, hasta=fin,
+        cursor=request.GET.get("cursor"), limite=100,
     )
+    return render(request, "reservas/admin_dashboard.html", {
+        "reservas": pagina.filas,
+        "siguiente": pagina.siguiente,
+        "hoy": dia,
+    })
+
+
+def _sucursal_ids_staff(user):
+    """None = todas; si no, las sucursales visibles del usuario (reservas/visibilidad.py)."""
+    ids = sucursal_ids_visibles(user)
+    return None if ids is None else sorted(ids)
 
-    return render(request, "reservas/admin_dashboard.html", {"reservas": reservas, "hoy": dia})
 
 @staff_member_required
 def admin_walkin_reserva(request):
@@ -1401,8 +1445,19 @@ def admin_walkin_reserva(request):
 
     if request.method == "POST":
         form = WalkInReservaForm(request.POST, user=request.user, sucursal_pref=suc_pref)
+        reserva = None
         if form.is_valid():
-            reserva = form.save()
+            try:
+                reserva = form.save()
+            except MesaOcupada as e:
+                tz = timezone.get_current_timezone()
+                form.add_error(
+                    "fecha",
+                    "Choque: la mesa acaba de ocuparse; disponible desde las "
+                    f"{e.disponible_desde.astimezone(tz).strftime('%H:%M')}."
+                    if e.disponible_desde else "Choque: la mesa acaba de ocuparse.",
+                )
+        if reserva is not None:
             tz = timezone.get_current_timezone()
             dia = timezone.localdate(reserva.fecha, tz).isoformat()
             messages.success(
@@ -1474,75 +1529,34 @@ def _slots_disponibles(mesa, fecha_dt, party=2):
     """
     Devuelve lista de datetimes (aware) con inicios posibles para ese día,
     considerando la duración dinámica, choques con reservas (con fin efectivo)
-    y bloqueos. Usa paso de 15 minutos.
+    y bloqueos. Horario y paso salen del calendario de la sucursal; los choques,
+    del mapa de ocupación del día.
     """
-    from .utils import booking_total_minutes  # asegúrate de tener esta función en utils
+    from .utils import calendario_sucursal, ocupacion_dia
 
     if hasattr(mesa, "bloqueada") and getattr(mesa, "bloqueada", False):
         return []
 
-    tz = ZoneInfo(mesa.sucursal.timezone)
-    base = timezone.make_aware(datetime(fecha_dt.year, fecha_dt.month, fecha_dt.day, 0, 0, 0), tz)
-
-    apertura = int(getattr(settings, 'HORARIO_APERTURA', 8))
-    cierre   = int(getattr(settings, 'HORARIO_CIERRE', 22))
-    paso     = 15
-
-    inicio_j = base + timedelta(hours=apertura)
-    fin_j    = base + timedelta(hours=cierre)
-
-    # Cargar reservas del rango del día (un poco más amplio) y bloqueos
-    # Importante: no uses .only('fecha') a secas; necesitamos num_personas y liberada_en
-    reservas = (
-        Reserva.objects
-        .filter(
-            mesa=mesa,
-            estado__in=['PEND', 'CONF'],
-            fecha__gte=inicio_j - timedelta(hours=3),
-            fecha__lt=fin_j + timedelta(hours=3),
-        )
-        .only('fecha', 'num_personas', 'liberada_en')  # evita queries extra al calcular fin_efectivo
-        .order_by('fecha')
-    )
-
-    bloqueos = (
-        BloqueoMesa.objects
-        .filter(sucursal=mesa.sucursal)
-        .filter(Q(mesa__isnull=True) | Q(mesa=mesa))
-        .filter(Q(inicio__lt=fin_j) & Q(fin__gt=inicio_j))
-        .only('inicio', 'fin')
-    )
-
-    def se_traslapa(ini_a, fin_a, ini_b, fin_b):
-        return ini_a < fin_b and fin_a > ini_b
-
-    def esta_libre(slot_ini):
-        # duración dinámica del slot propuesto (depende de hora y tamaño de grupo)
-        total_min = booking_total_minutes(slot_ini, party)
-        slot_fin = slot_ini + timedelta(minutes=total_min)
-
-        # Reservas: usar fin EFECTIVO (respeta liberada_en)
-        for r in reservas:
-            r_ini = r.fecha
-            r_fin = r.fin_efectivo(getattr(r, "num_personas", party) or party)
-            if se_traslapa(slot_ini, slot_fin, r_ini, r_fin):
-                return False
+    cal = calendario_sucursal(mesa.sucursal_id)
+    jornada = cal.jornada_dt(fecha_dt)
+    if jornada is None:  # la sucursal no abre ese día
+        return []
+    inicio_j, fin_j = jornada
+    paso = cal.paso_min
 
-        # Bloqueos
-        for b in bloqueos:
-            if se_traslapa(slot_ini, slot_fin, b.inicio, b.fin):
-                return False
+    ocupacion = ocupacion_dia(mesa.sucursal_id, fecha_dt)
 
-        return True
+    # duración dinámica (hora y tamaño de grupo) desde las reglas compiladas del día
+    reglas = cal.reglas(fecha_dt)
 
     out = []
     cur = inicio_j
     ahora = timezone.localtime()
     while cur < fin_j:
-        dur_min = booking_total_minutes(cur, party)
-        if cur + timedelta(minutes=dur_min) > fin_j:
+        slot_fin = cur + timedelta(minutes=reglas.duracion(cur, party))
+        if slot_fin > fin_j:
             break
-        if cur >= ahora and esta_libre(cur):
+        if cur >= ahora and ocupacion.libre(mesa.id, cur, slot_fin):
             out.append(cur)
         cur += timedelta(minutes=paso)
 
@@ -1693,7 +1707,7 @@ def valida_separacion_minima(cliente, mesa, fecha, es_staff=False):
     win_ini, win_fin = fecha - timedelta(minutes=sep_min), fecha + timedelta(minutes=sep_min)
     filtro = Q(cliente=cliente, estado__in=["PEND", "CONF"], fecha__gte=win_ini, fecha__lte=win_fin)
     if por_sucursal:
-        filtro &= Q(mesa__sucursal=mesa.sucursal)
+        filtro &= Q(sucursal_id=mesa.sucursal_id)
     return (Reserva.objects.filter(filtro).order_by("fecha").first())
 
 
@@ -1739,30 +1753,22 @@ def confirmar_reserva(request, reserva_id):
 def admin_reservas(request):
     """
     Lista de reservas para staff. Si es superuser ve todas; si es staff normal,
-    filtra por su sucursal asignada. GET ?q=<folio>
+    filtra por su sucursal asignada. GET ?q=<folio>&cursor=<página siguiente>
     """
+    from .listados import listar_reservas
     from .utils import _auto_cancel_por_tolerancia
     _auto_cancel_por_tolerancia(minutos=6)
 
     q = (request.GET.get("q") or "").strip()
-
-    if request.user.is_superuser:
-        reservaciones = Reserva.objects.select_related("cliente", "mesa__sucursal")
-    else:
-        try:
-            perfil = PerfilAdmin.objects.get(user=request.user)
-            reservaciones = (
-                Reserva.objects.select_related("cliente", "mesa__sucursal")
-                .filter(mesa__sucursal=perfil.sucursal_asignada)
-            )
-        except PerfilAdmin.DoesNotExist:
-            reservaciones = Reserva.objects.none()
-
-    if q:
-        reservaciones = reservaciones.filter(folio__icontains=q)
-
-    reservaciones = reservaciones.order_by("-fecha")
-    return render(request, "reservas/admin/reservas.html", {"reservas": reservas})
+    pagina = listar_reservas(
+        _sucursal_ids_staff(request.user), folio=q,
+        cursor=request.GET.get("cursor"), limite=50, desc=True,
+    )
+    return render(request, "reservas/admin_reservas.html", {
+        "reservaciones": pagina.filas,
+        "siguiente": pagina.siguiente,
+        "q": q,
+    })
 
 
 # --- Compat: endpoint antiguo /staff/api/disponibilidad/?mesa_id=... ---
@@ -1859,36 +1865,6 @@ def admin_mesa_crear(request, sucursal_id):
 # reservas/views.py
 
 
-def _proximos_slots(base_dt, n=3, paso_min=15, tz=None):
-    """
-    Devuelve N horarios próximos como strings (ej: '7:30 pm'),
-    formateados en la TZ indicada (o la activa).
-    """
-    tz = tz or dj_tz.get_current_timezone()
-
-    start = base_dt.replace(second=0, microsecond=0)
-    resto = start.minute % paso_min
-    if resto:
-        start += timedelta(minutes=paso_min - resto)
-
-    slots = []
-    cur = start
-    for _ in range(n):
-        # Localiza en la TZ deseada
-        dt_local = cur.astimezone(tz)
-        if os.name == "nt":
-            s = dt_local.strftime("%#I:%M %p")
-        else:
-            s = dt_local.strftime("%-I:%M %p")
-        slots.append(s.lower())
-        cur += timedelta(minutes=paso_min)
-    return slots
-
-
-
-
-
-
 @login_required
 @staff_member_required
 
@@ -1966,6 +1942,8 @@ def admin_sucursales(request):
 
 
 def sucursal_detalle(request, slug):
+    from .proximos import leer_proximos
+
     s = get_object_or_404(Sucursal.objects.filter(activo=True), slug=slug)
 
     # 🔑 Activar TZ local de la sucursal
@@ -1994,8 +1972,16 @@ def sucursal_detalle(request, slug):
     except Exception:
         precio_signos = "$"
 
-    # Sugerencias en la TZ de la sucursal
-    proximos = _proximos_slots(base_dt, 5, tz=tz)
+    # Sugerencias en la TZ de la sucursal: snapshot precalculado (refrescar_proximos)
+    try:
+        party_n = int(party or 2)
+    except ValueError:
+        party_n = 2
+    proximos = [
+        _slot_label(dt.astimezone(tz))
+        for dt in leer_proximos([s.id], party_n, n=5)[s.id]
+        if dt.astimezone(tz).date() == base_dt.date()
+    ]
 
     # Menú (categorías + items activos)
     categorias = (s.menu_categorias
@@ -2044,7 +2030,7 @@ def api_slots_sucursal(request, sucursal_id):
       }
     """
     # --- utilidades ---
-    from .utils import booking_total_minutes, _slots_disponibles
+    from .utils import calendario_sucursal, ocupacion_dia, _slots_disponibles
     try:
         from .utils import _parse_fecha_param as _parse_fecha_param_util
     except Exception:
@@ -2069,7 +2055,8 @@ def api_slots_sucursal(request, sucursal_id):
 
     # sucursal (activa) y TZ local
     sucursal = get_object_or_404(Sucursal, pk=sucursal_id, activo=True)
-    tz = ZoneInfo(sucursal.timezone)
+    cal = calendario_sucursal(sucursal)
+    tz = cal.tz
     dj_tz.activate(tz)  # 🔑 todo lo que siga usa la TZ de la sucursal
 
     # fecha (YYYY-MM-DD)
@@ -2095,23 +2082,25 @@ def api_slots_sucursal(request, sucursal_id):
             pass
 
     if anchor is None:
+        jornada = cal.jornada_dt(dia)
         if now_loc.date() == dia:
             anchor = now_loc
+        elif jornada is not None:
+            anchor = jornada[0]
         else:
-            apertura = int(getattr(settings, "HORARIO_APERTURA", 8))
-            anchor = dj_tz.make_aware(datetime(dia.year, dia.month, dia.day, apertura, 0), tz)
+            anchor = dj_tz.make_aware(datetime.combine(dia, time.min), tz)  # cerrado: no habrá slots
     else:
         if now_loc.date() == dia and anchor < now_loc:
             anchor = now_loc
 
     # redondeo del anchor al siguiente múltiplo de intervalo
-    step = int(getattr(settings, "RESERVA_INTERVALO_MIN", 15))
+    step = cal.paso_min
     bump = (step - (anchor.minute % step)) % step
     if bump:
         anchor = anchor + timedelta(minutes=bump)
 
     # ---------- unión de slots por mesa ----------
-    mesas = Mesa.objects.filter(sucursal=sucursal, capacidad__gte=party).only("id", "capacidad")
+    mesas = Mesa.objects.filter(sucursal=sucursal, capacidad__gte=party).only("id", "capacidad", "sucursal")
     all_slots = set()
 
     if not mesas.exists():
@@ -2120,15 +2109,18 @@ def api_slots_sucursal(request, sucursal_id):
             "fecha": dia.isoformat(),
             "party": party,
             "slots": [],
-            "duracion_min": booking_total_minutes(anchor, party),
+            "duracion_min": cal.duracion(anchor, party),
         })
 
+    # Un solo mapa de ocupación del día para todas las mesas
+    ocupacion = ocupacion_dia(sucursal.id, dia)
+
     # Fallback: soportar firma antigua de _slots_disponibles (sin 'party')
     def _slots_for_mesa(m, dia, party):
         try:
-            return _slots_disponibles(m, dia, party=party)
+            return _slots_disponibles(m, dia, party=party, ocupacion=ocupacion)
         except TypeError as e:
-            if "unexpected keyword argument 'party'" in str(e):
+            if "unexpected keyword argument" in str(e):
                 return _slots_disponibles(m, dia)
             raise
 
@@ -2154,7 +2146,7 @@ def api_slots_sucursal(request, sucursal_id):
         dloc = dt.astimezone(tz)
         return {"label": _label_12h(dloc), "value": dloc.strftime("%H:%M")}
 
-    dur_min = booking_total_minutes(anchor, party)
+    dur_min = cal.duracion(anchor, party)
     payload = [_fmt(dt) for dt in futuros]
 
     return JsonResponse({
@@ -2166,6 +2158,69 @@ def api_slots_sucursal(request, sucursal_id):
     })
 
 
+@require_GET
+def api_calendario_sucursal(request, sucursal_id):
+    """
+    Resumen de disponibilidad por día para un rango (selector de fechas) en una sola llamada,
+    en lugar de pedir api_slots_sucursal día por día.
+    GET ?desde=YYYY-MM-DD&dias=14&party=2
+      {
+        "sucursal": <id>, "party": <int>, "desde": "YYYY-MM-DD",
+        "dias": [{"fecha": "YYYY-MM-DD", "primero": "HH:MM"|null, "ultimo": "HH:MM"|null, "libres": <int>}, ...]
+      }
+    La respuesta se cachea con la versión de ocupación y de horario de la sucursal en la
+    llave, así que una reserva nueva la invalida; además se marca Cache-Control público.
+    """
+    from django.utils.cache import patch_cache_control
+    from .cache_utils import SLOTS_TTL
+    from .ocupacion import version_ocupacion
+    from .utils import calendario_sucursal, resumen_disponibilidad
+
+    try:
+        party = max(1, int((request.GET.get("party") or "2").strip()))
+    except Exception:
+        party = 2
+    dias_max = int(getattr(settings, "CALENDARIO_DIAS_MAX", 31))
+    try:
+        dias = min(dias_max, max(1, int((request.GET.get("dias") or "14").strip())))
+    except Exception:
+        dias = 14
+
+    sucursal = get_object_or_404(Sucursal, pk=sucursal_id, activo=True)
+    cal = calendario_sucursal(sucursal)
+    hoy = timezone.now().astimezone(cal.tz).date()
+    try:
+        desde = parse_date((request.GET.get("desde") or "").strip()) or hoy
+    except ValueError:  # bien formada pero inexistente (2025-02-30): igual que si no viene
+        desde = hoy
+    desde = max(desde, hoy)
+
+    # El "ahora" redondeado al paso también va en la llave: los slots de hoy van caducando
+    tramo = int(timezone.now().timestamp() // (cal.paso_min * 60))
+    llave = (f"slots:{sucursal.id}:cal:{desde.isoformat()}:{dias}:{party}:"
+             f"{version_ocupacion(sucursal.id)}:{cal.version}:{tramo}")
+    data = cache.get(llave)
+    if data is None:
+        def _hhmm(dt):
+            return dt.astimezone(cal.tz).strftime("%H:%M") if dt else None
+
+        data = {
+            "sucursal": sucursal.id,
+            "party": party,
+            "desde": desde.isoformat(),
+            "dias": [
+                {"fecha": r["fecha"].isoformat(), "primero": _hhmm(r["primero"]),
+                 "ultimo": _hhmm(r["ultimo"]), "libres": r["libres"]}
+                for r in resumen_disponibilidad(sucursal, desde, dias, party)
+            ],
+        }
+        cache.set(llave, data, SLOTS_TTL)
+
+    resp = JsonResponse(data)
+    patch_cache_control(resp, public=True, max_age=SLOTS_TTL)
+    return resp
+
+
 
 
 
@@ -2176,7 +2231,7 @@ def admin_disponibilidad_mesa(request, mesa_id):
     GET: ?fecha=YYYY-MM-DD  (default hoy local)
          ?party=2 (opcional)
     """
-    from .utils import booking_total_minutes  # <-- helper de duración dinámica
+    from .utils import calendario_sucursal  # <-- horario y duración dinámica por sucursal
 
     mesa = get_object_or_404(Mesa, pk=mesa_id)
 
@@ -2200,12 +2255,10 @@ def admin_disponibilidad_mesa(request, mesa_id):
     # slots disponibles considerando duración dinámica por party y hora
     slots_dt = _slots_disponibles(mesa, d_dia, party=party)
 
-    # duración “base” que mostraremos junto con la respuesta
-    tz = timezone.get_current_timezone()
-    totalmin = booking_total_minutes(
-        timezone.make_aware(datetime(d_dia.year, d_dia.month, d_dia.day, 0, 0), tz),
-        party
-    )
+    # duración “base” que mostraremos junto con la respuesta (calendario de la sucursal)
+    cal = calendario_sucursal(mesa.sucursal_id)
+    tz = cal.tz
+    totalmin = cal.duracion(datetime(d_dia.year, d_dia.month, d_dia.day, 0, 0, tzinfo=tz), party)
 
     # formateo HH:MM local
     slots_str = [s.astimezone(tz).strftime("%H:%M") for s in slots_dt]
@@ -2228,7 +2281,7 @@ def admin_finalizar_reserva(request, reserva_id):
     """
     r = get_object_or_404(Reserva.objects.select_for_update(), pk=reserva_id)
 
-    if not _puede_ver_sucursal(request.user, r.mesa.sucursal):
+    if not _puede_ver_sucursal(request.user, r.sucursal_id):
         return HttpResponseForbidden("No tienes permiso para operar esta reserva.")
 
     # Regla: solo si ya hubo check-in
@@ -2255,7 +2308,7 @@ def admin_finalizar_reserva(request, reserva_id):
     next_param = (request.POST.get("next") or request.GET.get("next") or "").lower()
     if next_param == "mesa":
         return redirect("reservas:admin_mesa_detalle", mesa_id=r.mesa_id)
-    return redirect("reservas:admin_mapa_sucursal", sucursal_id=r.mesa.sucursal_id)
+    return redirect("reservas:admin_mapa_sucursal", sucursal_id=r.sucursal_id)
 from django.contrib.auth.decorators import login_required
 from reservas.models import Reserva, Cliente
 
@@ -2298,24 +2351,13 @@ def reservar_auto(request, sucursal_id):
     else:
         dt_local = (now_loc + timedelta(minutes=15)).replace(second=0, microsecond=0)
 
-    # 5) Autoasignación de mesa
-    try:
-        mesa = asignar_mesa_automatica(s, dt_local, party)
-    except Exception as e:
-        if request.headers.get("x-requested-with") == "XMLHttpRequest":
-            return JsonResponse({"ok": False, "error": "no_table", "detail": str(e)}, status=200)
-        messages.error(request, "No hay mesas disponibles para ese horario.")
-        return redirect("reservas:sucursal_detalle", slug=s.slug)
-
-    # 6) Calcular fin de reserva
-    dur_min = booking_total_minutes(dt_local, party)
+    # 5) Duración y UTC
+    dur_min = booking_total_minutes(dt_local, party, sucursal=s)
     dt_fin_local = dt_local + timedelta(minutes=dur_min)
-
-    # 7) Convertir a UTC
     inicio_utc = dt_local.astimezone(py_tz.utc)
     fin_utc = dt_fin_local.astimezone(py_tz.utc)
 
-    # 8) Asegurar que el usuario tenga un Cliente asociado
+    # 6) Asegurar que el usuario tenga un Cliente asociado
     user = request.user
     try:
         cliente = user.cliente  # por el OneToOneField en Cliente
@@ -2328,22 +2370,40 @@ def reservar_auto(request, sucursal_id):
             email=email,
         )
 
-    # 9) Crear la reserva (SIEMPRE con cliente)
-    reserva = Reserva.objects.create(
-        sucursal=s,
-        mesa=mesa,
-        cliente=cliente,
-        fecha=dt_local,                        # 👈 DateTime con tz, no .date()
-        inicio_utc=inicio_utc,
-        fin_utc=fin_utc,
-        local_service_date=dt_local.date(),
-        local_inicio=dt_local,
-        local_fin=dt_fin_local,
-        num_personas=party,
-        estado=Reserva.CONF,                   # usar constante del modelo
-    )
+    # 7) Autoasignación + INSERT directo. Si otra petición ganó la mesa (exclusión en BD),
+    #    se intenta con la siguiente candidata.
+    from .utils import crear_reserva_autoasignada
+
+    def _construir(mesa):
+        return Reserva(
+            sucursal=s,
+            mesa=mesa,
+            cliente=cliente,
+            fecha=dt_local,                        # 👈 DateTime con tz, no .date()
+            inicio_utc=inicio_utc,
+            fin_utc=fin_utc,
+            local_service_date=dt_local.date(),
+            local_inicio=dt_local,
+            local_fin=dt_fin_local,
+            num_personas=party,
+            estado=Reserva.CONF,                   # usar constante del modelo
+        )
+
+    reserva, siguiente = crear_reserva_autoasignada(s, dt_local, party, _construir)
 
-    # 10) Mensaje de éxito
+    if reserva is None:
+        if request.headers.get("x-requested-with") == "XMLHttpRequest":
+            return JsonResponse({
+                "ok": False, "error": "no_table",
+                "siguiente_disponible": siguiente.astimezone(tz).isoformat() if siguiente else None,
+            }, status=200)
+        if siguiente:
+            messages.error(request, f"No hay mesas disponibles a esa hora. Próxima: {siguiente.astimezone(tz):%H:%M}.")
+        else:
+            messages.error(request, "No hay mesas disponibles para ese horario.")
+        return redirect("reservas:sucursal_detalle", slug=s.slug)
+
+    # 8) Mensaje de éxito
     messages.success(request, "¡Reserva creada correctamente!")
     return redirect("reservas:reserva_detalle", pk=reserva.pk)
 
@@ -2355,7 +2415,7 @@ def _staff_puede_gestionar_reserva(user, reserva):
     if not user.is_staff:
         return False
     perfil = getattr(user, "perfiladmin", None)
-    if perfil and getattr(perfil, "sucursal_asignada_id", None) == reserva.mesa.sucursal_id:
+    if perfil and getattr(perfil, "sucursal_asignada_id", None) == reserva.sucursal_id:
         return True
     return False
 
@@ -2369,7 +2429,7 @@ def admin_reasignar_reserva(request, reserva_id):
     if request.method == "POST":
         mesa_id = request.POST.get("mesa_id")
         forzar = bool(request.POST.get("forzar"))
-        nueva_mesa = get_object_or_404(Mesa, pk=mesa_id, sucursal=reserva.mesa.sucursal)
+        nueva_mesa = get_object_or_404(Mesa, pk=mesa_id, sucursal_id=reserva.sucursal_id)
 
         ok, motivo = mover_reserva(reserva, nueva_mesa, forzar=forzar)
         if ok:
@@ -2379,7 +2439,7 @@ def admin_reasignar_reserva(request, reserva_id):
 
         # AJUSTA este reverse al nombre de tu panel de mesas
         try:
-            return redirect(reverse("reservas:panel_mesas", args=[reserva.mesa.sucursal_id]))
+            return redirect(reverse("reservas:panel_mesas", args=[reserva.sucursal_id]))
         except Exception:
             return redirect("/")
 
@@ -2446,7 +2506,7 @@ def reservar_slot(request, sucursal_id):
 def admin_mesas_disponibles(request, sucursal_id):
     _ensure_staff_or_404(request)
 
-    from .utils import _auto_cancel_por_tolerancia, booking_total_minutes
+    from .utils import _auto_cancel_por_tolerancia, booking_total_minutes, ocupacion_para
     _auto_cancel_por_tolerancia(minutos=6)
 
     sucursal = get_object_or_404(Sucursal, id=sucursal_id)
@@ -2455,30 +2515,22 @@ def admin_mesas_disponibles(request, sucursal_id):
     if not _puede_ver_sucursal(request.user, sucursal):
         raise Http404()  # o HttpResponseForbidden("No tienes permiso")
 
-    inicio, fin = _slot_consultado(request)
-    estados_ocupan = ["PEND", "CONF"]
+    inicio, fin = _slot_consultado(request, sucursal)
 
     try:
         party = int((request.GET.get("party") or "2").strip())
     except Exception:
         party = 2
 
-    total_min = booking_total_minutes(inicio, party)
-    mesas_qs = Mesa.objects.filter(sucursal=sucursal)
+    total_min = booking_total_minutes(inicio, party, sucursal=sucursal)
+    mesas = list(Mesa.objects.filter(sucursal=sucursal).order_by("numero", "id"))
 
-    reservas_existe = (
-        Reserva.objects
-        .filter(mesa=OuterRef("pk"), estado__in=estados_ocupan, fecha__lt=fin)
-        .annotate(fin_res=Case(default=Value(0), output_field=BooleanField()))
-        .filter(fecha__gt=inicio - timedelta(minutes=total_min))
-    )
-
-    mesas = (
-        mesas_qs
-        .annotate(ocupada=Exists(reservas_existe))
-        .annotate(disponible=Case(When(ocupada=True, then=Value(False)), default=Value(True), output_field=BooleanField()))
-        .order_by("numero", "id")
-    )
+    # Libre = lo que ocuparía este grupo no choca con reservas ni bloqueos (mapa del día)
+    libres = set(ocupacion_para(sucursal, inicio).mesas_libres(
+        [m.id for m in mesas], inicio, inicio + timedelta(minutes=total_min)))
+    for m in mesas:
+        m.disponible = m.id in libres
+        m.ocupada = not m.disponible
 
     ctx = {"sucursal": sucursal, "mesas": mesas, "slot_inicio": inicio, "slot_fin": fin}
     return render(request, "reservas/ver_mesas.html", ctx)
@@ -2555,6 +2607,22 @@ def readyz(request):
     return JsonResponse({"ok": ok, **status}, status=200 if ok else 500)
 
 
+@staff_member_required
+@require_GET
+def metricz(request):
+    """Métricas por vista del proceso actual (ring buffer en memoria). ?reset=1 las limpia."""
+    from . import request_metrics
+
+    data = request_metrics.resumen()
+    if request.GET.get("reset") == "1":
+        request_metrics.reset()
+    return JsonResponse({
+        "pid": os.getpid(),
+        "window": int(getattr(settings, "REQUEST_METRICS_WINDOW", 200)),
+        "vistas": data,
+    })
+
+
 
 
 
@@ -2582,16 +2650,10 @@ def staff_api_disponibilidad(request):
 
 
 def _puede_ver_sucursal(user, sucursal):
+    # Pertenencia al conjunto en caché de sucursales visibles (reservas/visibilidad.py)
     if not user.is_authenticated or not user.is_staff:
         return False
-    if getattr(user, "is_superuser", False) or user.has_perm("reservas.manage_branches"):
-        return True
-    # Admin asignado por perfil
-    perfil = getattr(user, "perfiladmin", None)
-    if perfil and perfil.sucursal_asignada_id == sucursal.id:
-        return True
-    # Admin por M2M
-    return sucursal.administradores.filter(pk=user.pk).exists()
+    return puede_ver_sucursal(user, sucursal)
 
 
 
@@ -2599,85 +2661,69 @@ def _puede_ver_sucursal(user, sucursal):
 @require_POST
 def admin_api_mesa_setpos(request, mesa_id):
     """
-    Guarda la posición (pos_x, pos_y) de una mesa en px relativos al canvas.
-    Espera POST con x, y (ints).
+    Guarda la posición (pos_x, pos_y) de una mesa. Espera POST con x, y.
+    Compat: el mapa guarda con api_guardar_posiciones; esto pasa por el mismo plano.guardar_plano.
     """
-    mesa = get_object_or_404(Mesa, pk=mesa_id)
+    from .plano import PlanoInvalido, guardar_plano
+
+    mesa = get_object_or_404(Mesa.objects.select_related("sucursal"), pk=mesa_id)
     if not _puede_ver_sucursal(request.user, mesa.sucursal):
         return HttpResponseForbidden("Sin permiso")
 
     try:
-        x = int(request.POST.get("x", "0"))
-        y = int(request.POST.get("y", "0"))
-    except ValueError:
+        version = guardar_plano(mesa.sucursal, mesas=[{
+            "id": mesa.pk, "pos_x": request.POST.get("x", "0"), "pos_y": request.POST.get("y", "0"),
+        }])
+    except PlanoInvalido:
         return JsonResponse({"ok": False, "error": "coords_invalidas"}, status=400)
-
-    # Opcional: límites mínimos
-    if x < 0: x = 0
-    if y < 0: y = 0
-
-    mesa.pos_x = x
-    mesa.pos_y = y
-    mesa.save(update_fields=["pos_x", "pos_y"])
-    return JsonResponse({"ok": True, "x": x, "y": y})
-
-
-
+    mesa.refresh_from_db(fields=["pos_x", "pos_y"])
+    return JsonResponse({"ok": True, "x": mesa.pos_x, "y": mesa.pos_y, "version": version})
 
 
 @login_required
 @require_POST
 def admin_api_mesa_pos(request, mesa_id):
-    mesa = get_object_or_404(Mesa, pk=mesa_id)
+    """Compat: posición de una mesa (JSON pos_x/pos_y) vía plano.guardar_plano."""
+    from .plano import PlanoInvalido, guardar_plano
+
+    mesa = get_object_or_404(Mesa.objects.select_related("sucursal"), pk=mesa_id)
     # misma regla de visibilidad que usas en el resto:
     if not _puede_ver_sucursal(request.user, mesa.sucursal):
         return HttpResponseForbidden("Sin permiso.")
 
     try:
         data = json.loads(request.body.decode("utf-8"))
-        pos_x = float(data.get("pos_x"))
-        pos_y = float(data.get("pos_y"))
-    except Exception:
+        version = guardar_plano(mesa.sucursal, mesas=[{
+            "id": mesa.pk, "pos_x": data.get("pos_x"), "pos_y": data.get("pos_y"),
+        }])
+    except (ValueError, AttributeError, PlanoInvalido):
         return HttpResponseBadRequest("payload inválido")
 
-    # acotar a 0..100
-    pos_x = max(0.0, min(100.0, pos_x))
-    pos_y = max(0.0, min(100.0, pos_y))
-
-    mesa.pos_x = pos_x
-    mesa.pos_y = pos_y
-    mesa.save(update_fields=["pos_x", "pos_y"])
-
-    return JsonResponse({"ok": True, "pos_x": float(mesa.pos_x), "pos_y": float(mesa.pos_y)})
-
+    mesa.refresh_from_db(fields=["pos_x", "pos_y"])
+    return JsonResponse({"ok": True, "pos_x": float(mesa.pos_x), "pos_y": float(mesa.pos_y),
+                         "version": version})
 
 
 @login_required
 @require_POST
 def admin_api_recepcion_pos(request, sucursal_id):
-    # permisos básicos: que el usuario pueda ver/gestionar esta sucursal
-    sucursal = get_object_or_404(Sucursal, pk=sucursal_id)
+    """Compat: punto de recepción (JSON pos_x/pos_y) vía plano.guardar_plano."""
+    from .plano import PlanoInvalido, guardar_plano
 
-    # (opcional) si tienes helper de visibilidad, úsalo aquí
-    # if not Sucursal.objects.visibles_para(request.user).filter(pk=sucursal_id).exists():
-    #     return HttpResponseForbidden("No autorizado")
+    sucursal = get_object_or_404(Sucursal, pk=sucursal_id)
+    if not _puede_ver_sucursal(request.user, sucursal):
+        return HttpResponseForbidden("Sin permiso.")
 
     try:
         data = json.loads(request.body.decode("utf-8"))
-        x = float(data.get("pos_x", 0))
-        y = float(data.get("pos_y", 0))
-    except Exception:
+        version = guardar_plano(sucursal, recepcion={
+            "pos_x": data.get("pos_x", 0), "pos_y": data.get("pos_y", 0),
+        })
+    except (ValueError, AttributeError, PlanoInvalido):
         return HttpResponseBadRequest("JSON inválido")
 
-    # clamp 0..100 y redondeo a 2 decimales
-    x = max(0.0, min(100.0, round(x, 2)))
-    y = max(0.0, min(100.0, round(y, 2)))
-
-    sucursal.recepcion_x = int(round(x))
-    sucursal.recepcion_y = int(round(y))
-    sucursal.save(update_fields=["recepcion_x", "recepcion_y"])
-
-    return JsonResponse({"ok": True, "x": sucursal.recepcion_x, "y": sucursal.recepcion_y})
+    return JsonResponse({"ok": True, "x": sucursal.recepcion_x, "y": sucursal.recepcion_y,
+                         "version": version})
 
 
 
@@ -2855,98 +2901,23 @@ def reserva_detalle(request, pk):
     """
     Ticket/recibo de la reserva con QR (sin código de barras).
     """
-    reserva = get_object_or_404(
-        Reserva.objects.select_related("sucursal", "mesa", "cliente", "cliente__user"),
-        pk=pk,
-    )
-
-    # TZ de sucursal
-    tz = _tz_for_sucursal(reserva.sucursal or (getattr(reserva, "mesa", None) and reserva.mesa.sucursal))
-
-    # Normaliza locales
-    li = reserva.local_inicio or (reserva.inicio_utc and timezone.localtime(reserva.inicio_utc, tz))
-    lf = reserva.local_fin    or (reserva.fin_utc   and timezone.localtime(reserva.fin_utc, tz))
-
-    fecha_txt = formats.date_format(li.date(), "DATE_FORMAT") if li else ""
-    hora_txt  = li.strftime("%H:%M") if li else ""
-    duracion_min = int(((lf - li).total_seconds() // 60)) if (li and lf) else 0
-
-    # Contacto fallbacks
-    cliente = getattr(reserva, "cliente", None)
-    user = getattr(cliente, "user", None)
-
-    contacto_nombre = (
-        (reserva.nombre_contacto or "").strip()
-        or (getattr(cliente, "nombre", "") or "").strip()
-        or (" ".join(filter(None, [getattr(user, "first_name", ""), getattr(user, "last_name", "")])).strip() if user else "")
-        or (getattr(user, "username", "") if user else "")
-    )
-
-    contacto_email = (
-        (reserva.email_contacto or "").strip()
-        or (getattr(cliente, "email", "") or "").strip()
-        or (getattr(user, "email", "") if user else "")
-    )
-
-    contacto_tel = (
-        (reserva.telefono_contacto or "").strip()
-        or (getattr(cliente, "telefono", "") or "").strip()
-    )
+    t = tarjeta_por_pk(pk)
+    if t is None:
+        raise Http404("Reserva no encontrada.")
 
     # URL absoluta para el QR (entrada por folio)
     qr_url = request.build_absolute_uri(
-        reverse("reservas:reserva_scan_entry", args=[reserva.folio])
+        reverse("reservas:reserva_scan_entry", args=[t["folio"]])
     )
 
     ctx = {
-        "reserva": reserva,
-        "fecha_txt": fecha_txt,
-        "hora_txt": hora_txt,
-        "duracion_min": duracion_min,
-        "personas": reserva.num_personas,
-        "contacto_nombre": contacto_nombre,
-        "contacto_email": contacto_email,
-        "contacto_tel": contacto_tel,
-        "notas": getattr(reserva, "notas", "") or "",
+        "tarjeta": t,
         "qr_url": qr_url,
     }
     return render(request, "reservas/reserva_exito.html", ctx)
 
 
 
-# --- Helper contacto/fallbacks ----------------------------------------------
-def _contacto_from_reserva(reserva):
-    """
-    Devuelve un dict con nombre/email/tel usando fallbacks:
-    Reserva -> Cliente -> User.
-    """
-    cliente = getattr(reserva, "cliente", None)
-    user = getattr(cliente, "user", None)
-
-    nombre = (
-        (reserva.nombre_contacto or "").strip()
-        or (getattr(cliente, "nombre", "") or "").strip()
-        or (
-            (" ".join([
-                (getattr(user, "first_name", "") or "").strip(),
-                (getattr(user, "last_name", "") or "").strip()
-            ])).strip() if user else ""
-        )
-        or (getattr(user, "username", "") if user else "")
-        or ""
-    )
-    email = (
-        (reserva.email_contacto or "").strip()
-        or (getattr(cliente, "email", "") or "").strip()
-        or (getattr(user, "email", "") if user else "")
-        or ""
-    )
-    tel = (
-        (reserva.telefono_contacto or "").strip()
-        or (getattr(cliente, "telefono", "") or "").strip()
-        or ""
-    )
-    return {"contacto_nombre": nombre, "contacto_email": email, "contacto_tel": tel}
 
 
 
@@ -6,8 +6,9 @@ from django.urls import reverse
 from django.utils.safestring import mark_safe
 import json
 
-from .models import Sucursal, Mesa
+from .models import Sucursal
 from .permissions import assert_user_can_manage_sucursal
+from .plano import snapshot_plano
 
 
 @method_decorator(staff_member_required, name="dispatch")
@@ -17,25 +18,21 @@ class AdminMapaSucursalView(View):
 
     def get(self, request, sucursal_id):
         # Seguridad: sólo sucursales visibles para el usuario
-        sucursal = get_object_or_404(Sucursal.objects.for_user(request.user), pk=sucursal_id)
+        # (assert_user_can_manage_sucursal aplica las mismas reglas que Sucursal.objects.for_user)
+        sucursal = get_object_or_404(Sucursal, pk=sucursal_id)
         assert_user_can_manage_sucursal(request.user, sucursal)
 
-        # Query de mesas (orden opcional, para consistencia)
-        mesas_qs = Mesa.objects.filter(sucursal=sucursal).order_by("id")
+        # Plano pre-serializado (plano.snapshot_plano): sin consultar ni serializar mesas
+        version, blob = snapshot_plano(sucursal.pk)
+        plano = json.loads(blob)
+        mesas_values = plano["mesas"]
 
         # Compatibilidad con tu template actual que itera "estado_mesas"
         estado_mesas = [
             {"mesa": m, "estado": "DISPONIBLE", "reservas": []}
-            for m in mesas_qs
+            for m in mesas_values
         ]
 
-        # Datos crudos para el JS (y por si algún bloque usa "mesas" / "mesas_initial")
-        mesas_values = list(
-            mesas_qs.values(
-                "id", "numero", "zona", "pos_x", "pos_y", "capacidad", "estado", "bloqueada"
-            )
-        )
-
         ctx = {
             "sucursal": sucursal,
 
@@ -48,6 +45,7 @@ class AdminMapaSucursalView(View):
 
             # JSON listo para tu JS (sin escapar)
             "mesas_json": mark_safe(json.dumps(mesas_values)),
+            "plano_version": version,
 
             # Endpoints para el front
             "api_list_url": reverse("reservas:api_list_mesas", args=[sucursal.id]),
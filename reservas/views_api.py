@@ -10,6 +10,7 @@ from django.contrib.auth.decorators import login_required
 from .utils_country import get_effective_country
 from .utils_auth import user_allowed_countries
 from .models import Sucursal, Reserva, Cliente, Mesa
+from .utils import MesaOcupada, crear_reserva_autoasignada, guardar_reserva_sin_traslape
 from .mixins import ChainScopeMixin
 
 @method_decorator(csrf_exempt, name="dispatch")
@@ -87,27 +88,41 @@ class ReservaCreateFromLocalView(ChainScopeMixin, View):
                     telefono=cliente_data.get("telefono") or "",
                 )
 
-            mesa = None
+            # Si tienes helpers en el modelo, úsalos; si no, hazlo aquí:
+            inicio_utc = local_inicio.astimezone(ZoneInfo("UTC"))
+
+            def _construir(mesa):
+                r = Reserva(cliente=cli, mesa=mesa, sucursal=suc, num_personas=num)
+                r.inicio_utc = inicio_utc
+                r.fin_utc = inicio_utc + timedelta(minutes=dur)
+                r.local_inicio = local_inicio
+                r.local_fin = local_inicio + timedelta(minutes=dur)
+                r.local_service_date = local_inicio.date()
+                # Compatibilidad con tu campo 'fecha'
+                r.fecha = local_inicio
+                return r
+
+            # Sin lock: la exclusión de BD decide; un traslape se responde con 409 + próxima hora
+            siguiente = None
             if mesa_id:
                 try:
                     mesa = Mesa.objects.get(pk=mesa_id, sucursal=suc)
                 except Mesa.DoesNotExist:
                     return HttpResponseBadRequest("Mesa no encontrada en esa sucursal")
-
-            r = Reserva(cliente=cli, mesa=mesa, sucursal=suc, num_personas=num)
-
-            # Si tienes helpers en el modelo, úsalos; si no, hazlo aquí:
-            inicio_utc = local_inicio.astimezone(ZoneInfo("UTC"))
-            r.inicio_utc = inicio_utc
-            r.fin_utc = inicio_utc + timedelta(minutes=dur)
-            r.local_inicio = local_inicio
-            r.local_fin = local_inicio + timedelta(minutes=dur)
-            r.local_service_date = local_inicio.date()
-
-            # Compatibilidad con tu campo 'fecha'
-            r.fecha = local_inicio
-
-            r.save()
+                try:
+                    r = guardar_reserva_sin_traslape(_construir(mesa))
+                except MesaOcupada as e:
+                    r, siguiente = None, e.disponible_desde
+            else:
+                r, siguiente = crear_reserva_autoasignada(suc, local_inicio, num, _construir)
+
+            if r is None:
+                transaction.set_rollback(True)
+                return JsonResponse({
+                    "ok": False,
+                    "error": "mesa_ocupada" if mesa_id else "no_table",
+                    "siguiente_disponible": siguiente.astimezone(tz).isoformat() if siguiente else None,
+                }, status=409)
 
         return JsonResponse({
             "ok": True,
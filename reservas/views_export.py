@@ -0,0 +1,179 @@
+# reservas/views_export.py
+"""
+Exportación CSV de reservas y órdenes cerradas para staff / admins de país.
+
+Memoria constante sin importar el rango: StreamingHttpResponse sobre un generador que
+lee con .iterator(chunk_size=EXPORT_CHUNK) (cursor del lado del servidor en PostgreSQL) y
+escribe fila por fila; nunca se arma la lista completa ni el archivo en memoria.
+El alcance es el mismo de scope_sucursales_for (superuser / países / sucursales admin).
+"""
+import csv
+from datetime import datetime, time, timedelta
+from zoneinfo import ZoneInfo
+
+from django.conf import settings
+from django.contrib.auth.decorators import login_required
+from django.db.models.functions import Coalesce
+from django.http import HttpResponseBadRequest, HttpResponseForbidden, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from django.views.decorators.http import require_GET
+
+from .listados import reservas_qs
+from .models import Sucursal
+from .models_orders import Order, OrderStatus
+from .utils_auth import scope_sucursales_for
+
+
+class _Eco:
+    """Pseudo-buffer para csv.writer: devuelve la línea en vez de guardarla."""
+
+    def write(self, valor):
+        return valor
+
+
+def _celda(v):
+    # Evita inyección de fórmulas al abrir el CSV en Excel/Sheets
+    if isinstance(v, str) and v[:1] in ("=", "+", "-", "@"):
+        return "'" + v
+    return "" if v is None else v
+
+
+def _csv(encabezado, filas, nombre):
+    w = csv.writer(_Eco())
+
+    def _gen():
+        yield "\ufeff"  # BOM: Excel abre UTF-8 con acentos
+        yield w.writerow(encabezado)
+        for fila in filas:
+            yield w.writerow([_celda(v) for v in fila])
+
+    resp = StreamingHttpResponse(_gen(), content_type="text/csv; charset=utf-8")
+    resp["Content-Disposition"] = f'attachment; filename="{nombre}"'
+    resp["Cache-Control"] = "no-store"
+    return resp
+
+
+def _zona(nombre):
+    try:
+        return ZoneInfo(nombre or settings.TIME_ZONE)
+    except Exception:
+        return timezone.get_default_timezone()
+
+
+def _parametros(request):
+    """
+    (sucursales {id: (nombre, tz)}, desde, hasta, desde_date, hasta_date) o HttpResponse de error.
+    ?desde=YYYY-MM-DD&hasta=YYYY-MM-DD (inclusivo, default últimos 30 días) &sucursal=<id>
+    """
+    hoy = timezone.localdate()
+    try:
+        hasta_d = parse_date(request.GET.get("hasta") or "") or hoy
+        desde_d = parse_date(request.GET.get("desde") or "") or (hasta_d - timedelta(days=30))
+    except ValueError:  # bien formada pero inexistente (2025-02-30)
+        return HttpResponseBadRequest("Fecha inválida.")
+    if desde_d > hasta_d:
+        return HttpResponseBadRequest("'desde' debe ser anterior a 'hasta'.")
+    dias_max = int(getattr(settings, "EXPORT_DIAS_MAX", 92))
+    if (hasta_d - desde_d).days + 1 > dias_max:
+        return HttpResponseBadRequest(f"Rango máximo: {dias_max} días.")
+
+    qs = scope_sucursales_for(request, Sucursal.objects.all())
+    sucursal = request.GET.get("sucursal")
+    if sucursal:
+        if not sucursal.isdigit():
+            return HttpResponseBadRequest("sucursal inválida")
+        qs = qs.filter(pk=int(sucursal))
+    sucursales = {
+        sid: (nombre, _zona(tz))
+        for sid, nombre, tz in qs.order_by().values_list("id", "nombre", "timezone")
+    }
+
+    # Rango amplio en UTC: de 00:00 de 'desde' a 24:00 de 'hasta' en la TZ más temprana/tardía
+    # (±14 h cubre cualquier zona); el día local exacto se filtra al escribir cada fila.
+    tz_default = timezone.get_default_timezone()
+    desde = datetime.combine(desde_d, time.min, tzinfo=tz_default) - timedelta(hours=14)
+    hasta = datetime.combine(hasta_d + timedelta(days=1), time.min, tzinfo=tz_default) + timedelta(hours=14)
+    return sucursales, desde, hasta, desde_d, hasta_d
+
+
+def _puede_exportar(user):
+    return user.is_staff or user.is_superuser
+
+
+@login_required
+@require_GET
+def exportar_reservas_csv(request):
+    if not _puede_exportar(request.user):
+        return HttpResponseForbidden("Sin permiso.")
+    params = _parametros(request)
+    if not isinstance(params, tuple):
+        return params
+    sucursales, desde, hasta, desde_d, hasta_d = params
+    chunk = int(getattr(settings, "EXPORT_CHUNK", 2000))
+
+    filas_db = (
+        reservas_qs(list(sucursales), desde=desde, hasta=hasta)
+        .values_list("folio", "sucursal_id", "fecha", "estado", "num_personas", "mesa__numero",
+                     "cliente__nombre", "nombre_contacto", "email_contacto", "cliente__email",
+                     "telefono_contacto", "llego", "creada_por_staff")
+        .iterator(chunk_size=chunk)
+    )
+
+    def filas():
+        for (folio, sid, fecha, estado, personas, mesa, cliente, contacto, email, cliente_email,
+             telefono, llego, staff) in filas_db:
+            nombre, tz = sucursales[sid]
+            local = fecha.astimezone(tz)
+            if not (desde_d <= local.date() <= hasta_d):
+                continue
+            yield (folio, nombre, local.strftime("%Y-%m-%d %H:%M"), fecha.isoformat(), estado,
+                   personas, mesa, contacto or cliente, email or cliente_email, telefono,
+                   "si" if llego else "no", "si" if staff else "no")
+
+    return _csv(
+        ["folio", "sucursal", "fecha_local", "fecha_utc", "estado", "personas", "mesa",
+         "cliente", "email", "telefono", "llego", "creada_por_staff"],
+        filas(),
+        f"reservas_{desde_d:%Y%m%d}_{hasta_d:%Y%m%d}.csv",
+    )
+
+
+@login_required
+@require_GET
+def exportar_ordenes_csv(request):
+    """Órdenes POS cerradas con totales; la fecha es closed_at (o created_at si no se guardó)."""
+    if not _puede_exportar(request.user):
+        return HttpResponseForbidden("Sin permiso.")
+    params = _parametros(request)
+    if not isinstance(params, tuple):
+        return params
+    sucursales, desde, hasta, desde_d, hasta_d = params
+    chunk = int(getattr(settings, "EXPORT_CHUNK", 2000))
+
+    filas_db = (
+        Order.objects.filter(sucursal_id__in=list(sucursales), status=OrderStatus.CLOSED)
+        .annotate(cerrada=Coalesce("closed_at", "created_at"))
+        .filter(cerrada__gte=desde, cerrada__lt=hasta)
+        .order_by("cerrada", "id")
+        .values_list("id", "sucursal_id", "cerrada", "mesa__numero", "reserva__folio",
+                     "payment_method", "subtotal_base", "iva_total", "total_bruto", "propina",
+                     "total_con_propina")
+        .iterator(chunk_size=chunk)
+    )
+
+    def filas():
+        for (oid, sid, cerrada, mesa, folio, pago, subtotal, iva, bruto, propina, total) in filas_db:
+            nombre, tz = sucursales[sid]
+            local = cerrada.astimezone(tz)
+            if not (desde_d <= local.date() <= hasta_d):
+                continue
+            yield (oid, nombre, local.strftime("%Y-%m-%d %H:%M"), mesa, folio, pago,
+                   subtotal, iva, bruto, propina, total)
+
+    return _csv(
+        ["orden", "sucursal", "cerrada_local", "mesa", "folio_reserva", "pago",
+         "subtotal", "iva", "total_bruto", "propina", "total"],
+        filas(),
+        f"ordenes_{desde_d:%Y%m%d}_{hasta_d:%Y%m%d}.csv",
+    )
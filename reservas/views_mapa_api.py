@@ -1,11 +1,14 @@
-from django.http import JsonResponse, HttpResponseBadRequest
+import json
+
+from django.http import HttpResponse, JsonResponse, HttpResponseBadRequest, HttpResponseNotModified
 from django.views.decorators.http import require_GET, require_POST
 from django.contrib.admin.views.decorators import staff_member_required
 from django.shortcuts import get_object_or_404
-from django.db import transaction
 
-from .models import Sucursal, Mesa  # <- quitamos PosicionMesa
+from .models import Sucursal  # <- quitamos PosicionMesa
 from .permissions import assert_user_can_manage_sucursal
+from .plano import PlanoDesfasado, PlanoInvalido, guardar_plano, snapshot_plano, version_plano
+from .request_metrics import query_budget
 
 
 
@@ -14,57 +17,72 @@ from .permissions import assert_user_can_manage_sucursal
 # ============================================================
 
 
-@staff_member_required
-@require_GET
-def api_list_mesas(request, sucursal_id):
-    # Usar el queryset seguro por usuario
-    suc = get_object_or_404(Sucursal.objects.for_user(request.user), pk=sucursal_id)
-    assert_user_can_manage_sucursal(request.user, suc)
+def respuesta_plano(request, sucursal_id, filtro=None, etag_extra=""):
+    """
+    Sirve el snapshot del plano (plano.snapshot_plano) con ETag = versión del plano.
+    If-None-Match igual → 304 sin tocar BD ni caché del blob. 'filtro' (opcional) recibe el
+    dict del plano y devuelve otro a serializar (p.ej. api_mesas_sucursal con min_cap).
+    """
+    version = version_plano(sucursal_id)
+    etag = f'"plano-{version}{etag_extra}"'
+    if etag in (request.headers.get("If-None-Match") or ""):
+        resp = HttpResponseNotModified()
+    else:
+        version, blob = snapshot_plano(sucursal_id)
+        etag = f'"plano-{version}{etag_extra}"'
+        if filtro is not None:
+            resp = JsonResponse(filtro(json.loads(blob)))
+        else:
+            resp = HttpResponse(blob, content_type="application/json")
+    resp["ETag"] = etag
+    resp["Cache-Control"] = "private, no-cache"
+    return resp
 
-    # ⬇️  Devolver también numero/pos_x/pos_y o el front no puede dibujar
-    data = list(
-        Mesa.objects.filter(sucursal=suc)
-        .values("id", "numero", "zona", "pos_x", "pos_y", "capacidad", "estado", "bloqueada")
-    )
-    return JsonResponse({"mesas": data})
 
 @staff_member_required
-@require_POST
-def api_guardar_posiciones(request, sucursal_id):
-    suc = get_object_or_404(Sucursal.objects.for_user(request.user), pk=sucursal_id)
+@require_GET
+@query_budget(8)  # sesión + usuario + sucursal; en frío permisos + visibles (3) y snapshot (2)
+def api_list_mesas(request, sucursal_id):
+    # assert_user_can_manage_sucursal: pertenencia al conjunto en caché (reservas/visibilidad.py)
+    suc = get_object_or_404(Sucursal.objects.only("id", "pais_id"), pk=sucursal_id)
     assert_user_can_manage_sucursal(request.user, suc)
-    # ... lógica de guardado ...
-    return JsonResponse({"ok": True})
+    # {"sucursal", "version", "recepcion", "mesas": [id, numero, zona, pos_x, pos_y, ...]}
+    return respuesta_plano(request, suc.pk)
 
 # ============================================================
-#  Guardar posiciones (cuando el staff mueve mesas)
+#  Guardar layout (cuando el staff mueve mesas / recepción)
 # ============================================================
 @staff_member_required
 @require_POST
-@transaction.atomic
 def api_guardar_posiciones(request, sucursal_id):
     """
-    Guarda nuevas coordenadas de las mesas desde el mapa.
+    Guarda el layout del mapa completo o parcial en una transacción (ver plano.guardar_plano).
     Espera JSON como:
-      {"mesas": [{"id": 1, "x": 50, "y": 120}, ...]}
+      {"mesas": [{"id": 1, "pos_x": 50, "pos_y": 20}, ...],
+       "recepcion": {"pos_x": 3, "pos_y": 3},      (opcional)
+       "version": "..."}                           (opcional: 409 si el plano cambió)
+    Responde {"ok": true, "version": "..."}.
     """
     suc = get_object_or_404(Sucursal.objects.for_user(request.user), pk=sucursal_id)
     assert_user_can_manage_sucursal(request.user, suc)
 
     try:
-        import json
         data = json.loads(request.body.decode("utf-8"))
     except Exception:
         return HttpResponseBadRequest("JSON inválido")
+    if not isinstance(data, dict):
+        return HttpResponseBadRequest("JSON inválido")
 
-    mesas_data = data.get("mesas", [])
-    for mesa_info in mesas_data:
-        mesa_id = mesa_info.get("id")
-        x = mesa_info.get("x")
-        y = mesa_info.get("y")
-        if not mesa_id or x is None or y is None:
-            continue
-
-        Mesa.objects.filter(id=mesa_id, sucursal=suc).update(x=x, y=y)
+    try:
+        version = guardar_plano(
+            suc,
+            mesas=data.get("mesas") or [],
+            recepcion=data.get("recepcion"),
+            version=data.get("version"),
+        )
+    except PlanoInvalido as e:
+        return JsonResponse({"ok": False, "error": str(e)}, status=400)
+    except PlanoDesfasado as e:
+        return JsonResponse({"ok": False, "error": "plano_desfasado", "version": str(e)}, status=409)
 
-    return JsonResponse({"ok": True})
+    return JsonResponse({"ok": True, "version": version})
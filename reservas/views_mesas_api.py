@@ -1,9 +1,11 @@
 # reservas/views_mesas_api.py
-from django.http import JsonResponse
 from django.views.decorators.http import require_GET
 from django.contrib.auth.decorators import login_required, user_passes_test
 
-from .models import Mesa
+from django.http import Http404
+
+from .views_mapa_api import respuesta_plano
+from .visibilidad import puede_ver_sucursal
 
 def _staff_or_chain(user):
     return user.is_authenticated and (user.is_staff or user.is_superuser)
@@ -19,21 +21,21 @@ def api_mesas_sucursal(request, sucursal_id: int):
       "mesas": [{"id":..., "numero":..., "nombre":..., "capacidad": ...}, ...]
     }
     """
-    qs = Mesa.objects.filter(sucursal_id=sucursal_id)
+    if not puede_ver_sucursal(request.user, sucursal_id):
+        raise Http404("Sucursal no encontrada o sin permisos.")
 
-    # filtro opcional de capacidad
-    min_cap = request.GET.get("min_cap")
-    if min_cap:
-        try:
-            qs = qs.filter(capacidad__gte=int(min_cap))
-        except Exception:
-            pass
+    # Sale del snapshot del plano (ETag por versión + min_cap); sin consultar mesas
+    try:
+        min_cap = int(request.GET.get("min_cap") or 0)
+    except Exception:
+        min_cap = 0
 
-    mesas = [{
-        "id": m.id,
-        "numero": getattr(m, "numero", None),
-        "nombre": getattr(m, "nombre", None),
-        "capacidad": getattr(m, "capacidad", None),
-    } for m in qs.order_by("numero", "id")]
+    def _filtrar(plano):
+        return {"mesas": [{
+            "id": m["id"],
+            "numero": m["numero"],
+            "nombre": None,  # Mesa no tiene nombre; se conserva la llave por compatibilidad
+            "capacidad": m["capacidad"],
+        } for m in plano["mesas"] if m["capacidad"] >= min_cap]}
 
-    return JsonResponse({"mesas": mesas})
+    return respuesta_plano(request, sucursal_id, filtro=_filtrar, etag_extra=f"-c{min_cap}")
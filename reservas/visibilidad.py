@@ -0,0 +1,96 @@
+# reservas/visibilidad.py
+"""
+Sucursales que ve cada usuario staff, como conjunto de ids en caché.
+
+Reglas (las de Sucursal.objects.for_user):
+  - superuser o permiso reservas.manage_branches → todas (None)
+  - si no: administradores (M2M) ∪ PerfilAdmin.sucursal_asignada ∪ sucursales de los
+    países con CountryAdminScope activo
+
+El conjunto se arma con una query y queda en caché por usuario; las revisiones de permiso
+son pertenencia a un frozenset (y se memoriza en el objeto user durante el request).
+Cualquier cambio que pueda moverlo (M2M administradores, PerfilAdmin, CountryAdminScope,
+alta/baja/cambio de país de Sucursal, permisos y grupos) sube una versión global
+(visibles:v) al confirmar la transacción; son eventos raros, así que se invalida todo.
+"""
+from __future__ import annotations
+
+import time as _time
+from typing import FrozenSet, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+_VERSION_KEY = "visibles:v"
+_TODAS = "*"
+
+
+def _version() -> str:
+    try:
+        v = cache.get(_VERSION_KEY)
+        if v is None:
+            cache.add(_VERSION_KEY, _time.time_ns(), None)
+            v = cache.get(_VERSION_KEY)
+    except Exception:
+        v = None
+    return str(v if v is not None else _time.time_ns())
+
+
+def invalidar_visibles(**kwargs) -> None:
+    """Sube la versión global al confirmar (se conecta tal cual como receiver)."""
+    def _subir():
+        try:
+            cache.set(_VERSION_KEY, _time.time_ns(), None)
+        except Exception:
+            pass
+
+    transaction.on_commit(_subir)
+
+
+def _calcular(user):
+    from django.db.models import Q
+    from .models import CountryAdminScope, PerfilAdmin, Sucursal  # import local evita ciclos
+
+    if user.has_perm("reservas.manage_branches"):
+        return _TODAS
+    admin_m2m = Sucursal.administradores.through.objects.filter(user_id=user.pk).values("sucursal_id")
+    asignada = PerfilAdmin.objects.filter(user_id=user.pk, sucursal_asignada__isnull=False).values("sucursal_asignada_id")
+    paises = CountryAdminScope.objects.filter(user_id=user.pk, is_active=True).values("pais_id")
+    return tuple(sorted(
+        Sucursal.objects.filter(Q(pk__in=admin_m2m) | Q(pk__in=asignada) | Q(pais_id__in=paises))
+        .order_by().values_list("id", flat=True)
+    ))
+
+
+def sucursal_ids_visibles(user) -> Optional[FrozenSet[int]]:
+    """None = todas; frozenset de ids (vacío si ninguna o anónimo)."""
+    if not getattr(user, "is_authenticated", False):
+        return frozenset()
+    if user.is_superuser:
+        return None
+    memo = getattr(user, "_sucursal_ids_visibles", False)
+    if memo is not False:
+        return memo
+
+    key = f"visibles:{user.pk}:{_version()}"
+    try:
+        valor = cache.get(key)
+    except Exception:
+        valor = None
+    if valor is None:
+        valor = _calcular(user)
+        try:
+            cache.set(key, valor, int(getattr(settings, "VISIBLES_TTL", 600)))
+        except Exception:
+            pass
+
+    ids = None if valor == _TODAS else frozenset(valor)
+    user._sucursal_ids_visibles = ids
+    return ids
+
+
+def puede_ver_sucursal(user, sucursal) -> bool:
+    """sucursal: instancia o id."""
+    ids = sucursal_ids_visibles(user)
+    return ids is None or getattr(sucursal, "pk", sucursal) in ids